@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки заданий 37 и 38: последовательный и параллельный режимы
+опроса критериев на локальной заглушке модели FakeBackend (без сетевых запросов).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_criteria_fanout
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+# config.py требует наличия ключей, для заглушки подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from services import gemini_service
+from services.fake_backend import FakeBackend
+from services.llm_backend import set_backend
+
+# Задержка ответа заглушки по одному критерию: медиана и sigma логнормального распределения
+LATENCY_MEDIAN = 0.35
+LATENCY_SIGMA = 0.3
+RUNS = 5
+
+def make_user_data(task_number: str) -> dict:
+    words = 120 if task_number == "37" else 220
+    return {
+        "task_number": task_number,
+        "task_description": "Benchmark task description",
+        "task_solution": " ".join(["word"] * words),
+    }
+
+async def run_mode(task_number: str, parallel: bool) -> list:
+    gemini_service.GEMINI_PARALLEL_CRITERIA = parallel
+    timings = []
+    for _ in range(RUNS):
+        set_backend(FakeBackend(LATENCY_MEDIAN, LATENCY_SIGMA, seed=len(timings)))
+        start = time.perf_counter()
+        # Проверяем напрямую, минуя кэш результатов
+        await gemini_service.grade_submission(make_user_data(task_number))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+async def main():
+    logging.disable(logging.CRITICAL)
+
+    print(f"Задержка критерия: медиана {LATENCY_MEDIAN} с, sigma {LATENCY_SIGMA}, прогонов: {RUNS}")
+    for task_number in ("37", "38"):
+        sequential = await run_mode(task_number, parallel=False)
+        parallel = await run_mode(task_number, parallel=True)
+        seq_avg = sum(sequential) / len(sequential)
+        par_avg = sum(parallel) / len(parallel)
+        print(
+            f"Задание {task_number}: последовательно {seq_avg:.2f} с, "
+            f"параллельно {par_avg:.2f} с, ускорение x{seq_avg / par_avg:.1f}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Сравнение двух режимов графика задания 38 (GRAPH_MODE) по задержке:
+ocr - текст графика распознается OCR.space, пока пользователь ждет,
+image - изображение прикладывается к запросам Gemini и загружается,
+пока пользователь пишет работу.
+
+Каждая работа проходит get_graph_image (с заглушкой Telegram и OCR.space
+с задержкой --ocr-latency), затем пользователь пишет работу --typing секунд,
+затем check_with_gemini на заглушке модели FakeBackend (загрузка
+изображения - --upload-latency). В отчете - сколько пользователь ждет
+после отправки графика, сколько длится проверка и их сумма (все, что
+пользователь ждет, кроме собственного набора текста).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_graph_modes --users 50 --ocr-latency 4 --typing 30
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+# config.py требует наличия ключей, для заглушки подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from handlers import conversation_handlers
+from services import gemini_service
+from services.fake_backend import FakeBackend
+from services.llm_backend import set_backend
+
+# Словарь для случайных решений: работы разных пользователей не совпадают
+VOCABULARY = [f"word{i}" for i in range(2000)]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Задержка проверки задания 38: OCR графика или изображение в запросе")
+    parser.add_argument("--users", type=int, default=50, help="число пользователей (по одной работе на каждого)")
+    parser.add_argument("--ocr-latency", type=float, default=4, help="время ответа OCR.space, с")
+    parser.add_argument("--upload-latency", type=float, default=1.5, help="время загрузки изображения в Gemini, с")
+    parser.add_argument("--typing", type=float, default=30, help="сколько пользователь пишет работу после отправки графика, с")
+    parser.add_argument("--latency-median", type=float, default=8, help="медиана задержки ответа модели, с")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="sigma логнормального распределения задержки")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="множитель всех задержек")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+class FakeMessage:
+    def __init__(self, photo=None):
+        self.photo = photo
+
+    async def reply_text(self, text, **kwargs):
+        return FakeMessage()
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+class FakePhoto:
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+
+class FakeFile:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def download_to_drive(self, path):
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+class FakeBot:
+    def __init__(self, images: dict):
+        self.images = images
+
+    async def get_file(self, file_id):
+        return FakeFile(self.images[file_id])
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+class FakeUpdate:
+    def __init__(self, user_id: int, file_id: str):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage([FakePhoto(file_id)])
+
+class FakeContext:
+    def __init__(self, bot: FakeBot, user_data: dict):
+        self.bot = bot
+        self.user_data = user_data
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+async def run(mode: str, args) -> dict:
+    scale = args.time_scale
+    backend = FakeBackend(args.latency_median, args.latency_sigma, time_scale=scale, seed=args.seed,
+                          upload_latency=args.upload_latency)
+    set_backend(backend)
+    # Работы обоих прогонов одинаковые: результат прошлого прогона не должен подставляться
+    gemini_service.NEAR_DUPLICATE_MODE = "off"
+    conversation_handlers.GRAPH_MODE = mode
+    ocr_calls = 0
+
+    async def fake_ocr(image_path):
+        nonlocal ocr_calls
+        ocr_calls += 1
+        await asyncio.sleep(args.ocr_latency * scale)
+        return "Chart: share of students, 2010 - 35%, 2015 - 42%, 2020 - 51%"
+
+    conversation_handlers.process_image_ocr = fake_ocr
+    rng = random.Random(args.seed)
+    images = {f"photo{user_id}": rng.randbytes(50_000) for user_id in range(args.users)}
+    bot = FakeBot(images)
+    timings = {"graph": [], "grading": [], "total": []}
+
+    async def user(user_id: int):
+        user_data = {"task_number": "38", "task_description": f"Project task {user_id % 5}"}
+        start = time.perf_counter()
+        await conversation_handlers.get_graph_image(FakeUpdate(user_id, f"photo{user_id}"), FakeContext(bot, user_data))
+        graph = time.perf_counter() - start
+
+        await asyncio.sleep(args.typing * scale)
+        user_data["task_solution"] = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(200, 260)))
+        start = time.perf_counter()
+        await gemini_service.check_with_gemini(user_data)
+        grading = time.perf_counter() - start
+
+        timings["graph"].append(graph / scale)
+        timings["grading"].append(grading / scale)
+        timings["total"].append((graph + grading) / scale)
+
+    await asyncio.gather(*(user(user_id) for user_id in range(args.users)))
+    return {"timings": timings, "ocr_calls": ocr_calls, "uploads": backend.image_uploads, "requests": backend.requests}
+
+async def main():
+    args = parse_args()
+    logging.disable(logging.CRITICAL)
+    print(
+        f"Пользователей: {args.users}, OCR {args.ocr_latency} с, загрузка изображения {args.upload_latency} с, "
+        f"пользователь пишет работу {args.typing} с, задержка модели: медиана {args.latency_median} с"
+    )
+    titles = {"graph": "ожидание после графика", "grading": "проверка", "total": "всего ожидания"}
+    for mode in ("ocr", "image"):
+        result = await run(mode, args)
+        print(f"\nGRAPH_MODE={mode}: вызовов OCR {result['ocr_calls']}, загрузок изображений {result['uploads']}, "
+              f"запросов к модели {result['requests']}")
+        for name, values in result["timings"].items():
+            print(f"{titles[name]:>24}: p50 {percentile(values, 50):.1f} с, p95 {percentile(values, 95):.1f} с")
+
+if __name__ == "__main__":
+    asyncio.run(main())
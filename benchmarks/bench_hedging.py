@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк дублирования медленных запросов к Gemini: перцентили задержки
+request_gemini с дублированием и без него на заглушке с "тяжелым хвостом"
+(большинство ответов быстрые, небольшая доля - в десятки раз медленнее).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_hedging
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+# config.py требует наличия ключей, для заглушки подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from services import gemini_service, resilience
+from services.fake_backend import FakeBackend
+from services.llm_backend import set_backend
+
+REQUESTS = 400
+# Запросы до замеров: набирают статистику задержек для расчета перцентиля
+WARMUP_REQUESTS = 50
+CONCURRENCY = 20
+FAST_LATENCY = (0.04, 0.08)  # секунд
+SLOW_LATENCY = (1.0, 2.0)    # секунд
+SLOW_SHARE = 0.03
+
+class HeavyTailBackend(FakeBackend):
+    """Заглушка модели, у которой небольшая доля ответов в десятки раз медленнее остальных"""
+
+    def latency(self, model_name: str = None) -> float:
+        slow = self.random.random() < SLOW_SHARE
+        return self.random.uniform(*(SLOW_LATENCY if slow else FAST_LATENCY))
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+async def run(hedge_percentile: float) -> list:
+    set_backend(HeavyTailBackend(seed=1))
+    gemini_service.GEMINI_HEDGE_PERCENTILE = hedge_percentile
+    resilience._latency_tracker = resilience.LatencyTracker(percentile=hedge_percentile or 95, min_delay=0.05)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await gemini_service.request_gemini("prompt", {}, "бенчмарк")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(WARMUP_REQUESTS)))
+    latencies.clear()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    return latencies
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    print(f"Запросов: {REQUESTS}, медленных: {SLOW_SHARE:.0%} ({SLOW_LATENCY[0]}-{SLOW_LATENCY[1]} с)")
+    for title, hedge_percentile in (("без дублирования", 0), ("дублирование после p95", 95)):
+        latencies = await run(hedge_percentile)
+        print(
+            f"{title:>24}: p50 {percentile(latencies, 50) * 1000:.0f} мс, "
+            f"p95 {percentile(latencies, 95) * 1000:.0f} мс, p99 {percentile(latencies, 99) * 1000:.0f} мс"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кэширования рубрик: сколько входных токенов отправляется на одну
+проверку и каково время до первого токена с кэшем рубрики и без него.
+
+Используется локальная заглушка Gemini: время обработки промпта (prefill)
+пропорционально числу незакэшированных входных токенов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_prefix_cache
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+# config.py требует наличия ключей, для заглушки подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from config import GEMINI_MODEL
+from services import gemini_client, gemini_service
+from utils.text_utils import estimate_tokens
+
+# Модель задержки заглушки
+BASE_LATENCY = 0.05          # секунд на запрос
+PREFILL_PER_TOKEN = 0.00002  # секунд на незакэшированный входной токен
+CHECKS = 10
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeCachedContent:
+    def __init__(self, prefix: str):
+        self.name = f"cachedContents/fake-{abs(hash(prefix)) % 10000}"
+        self.prefix_tokens = estimate_tokens(prefix)
+
+    def update(self, ttl=None):
+        pass
+
+class FakeModel:
+    """Заглушка GenerativeModel, считающая токены и время до первого токена"""
+
+    def __init__(self, stats: dict, cached_content: FakeCachedContent = None):
+        self.stats = stats
+        self.cached_content = cached_content
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        input_tokens = estimate_tokens(prompt)
+        cached_tokens = self.cached_content.prefix_tokens if self.cached_content else 0
+        ttft = BASE_LATENCY + input_tokens * PREFILL_PER_TOKEN
+        await asyncio.sleep(ttft)
+        self.stats["input_tokens"] += input_tokens
+        self.stats["cached_tokens"] += cached_tokens
+        self.stats["ttft"].append(ttft)
+        return StubResponse("ИТОГОВАЯ ОЦЕНКА\n- Балл: 2\n- Итоговый балл: 2\n- Общий балл: 2\n")
+
+def make_user_data(task_number: str) -> dict:
+    words = 140 if task_number == "37" else 250
+    return {
+        "task_number": task_number,
+        "task_description": "Benchmark task description " * 20,
+        "task_solution": " ".join(["word"] * words),
+        "graph_ocr_text": "Survey results 45% 12% 27%",
+        "graph_image_id": "benchmark",
+    }
+
+async def run(task_number: str, prefix_cache: bool) -> dict:
+    stats = {"input_tokens": 0, "cached_tokens": 0, "ttft": []}
+    gemini_client.GEMINI_PREFIX_CACHE = prefix_cache
+    gemini_client._prefix_caches.clear()
+    key = gemini_client.get_key_pool().keys[0]
+    gemini_client._models[(key.index, GEMINI_MODEL)] = FakeModel(stats)
+    gemini_client._create_cached_content = lambda key, model_name, template, ttl: FakeCachedContent(template.prefix)
+    gemini_client._model_from_cached_content = lambda key, cached_content: FakeModel(stats, cached_content)
+
+    start = time.perf_counter()
+    for _ in range(CHECKS):
+        await gemini_service.grade_submission(make_user_data(task_number))
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    print(f"Проверок каждого задания: {CHECKS}")
+    for task_number in ("37", "38"):
+        results = {mode: await run(task_number, mode) for mode in (False, True)}
+        full, cached = results[False], results[True]
+        for mode, stats in (("без кэша", full), ("с кэшем рубрик", cached)):
+            ttft = sum(stats["ttft"]) / len(stats["ttft"]) * 1000
+            print(
+                f"Задание {task_number}, {mode}: входных токенов на проверку {stats['input_tokens'] // CHECKS}, "
+                f"из кэша {stats['cached_tokens'] // CHECKS}, среднее время до первого токена {ttft:.0f} мс"
+            )
+        saved = 1 - cached["input_tokens"] / full["input_tokens"]
+        print(f"Задание {task_number}: экономия отправляемых входных токенов {saved:.0%}\n")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк извлечения балла из ответа модели: прежний каскад re.search
+против однопроходного извлечения по таблице шаблонов (utils.score_extraction).
+
+Ответы генерируются в типичных форматах (блок ИТОГОВАЯ ОЦЕНКА, "Балл: X",
+"получает **X балла", ответ без балла) длиной от 1 до 20 КБ.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_score_extraction
+"""
+
+import re
+import random
+import timeit
+
+from utils.score_extraction import extract_score
+
+SIZES_KB = [1, 5, 20]
+
+def legacy_extract_37(i: int, response_text: str):
+    """Прежний каскад для задания 37 (без логирования и значения по умолчанию)"""
+    if i == 1:
+        score_matches = re.search(r'Итоговый балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            score_matches = re.search(r'итоговый балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            score_matches = re.search(r'ИТОГОВЫЙ БАЛЛ:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            last_section = response_text.split("ИТОГОВАЯ ОЦЕНКА")[-1] if "ИТОГОВАЯ ОЦЕНКА" in response_text else response_text
+            score_matches = re.search(r'(\d+)\s*балл', last_section)
+    elif i == 2:
+        score_matches = re.search(r'Балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            score_matches = re.search(r'получает\s*\*\*(\d+)\s*балл', response_text)
+        if not score_matches:
+            score_matches = re.search(r'оценка:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+    else:
+        if "ИТОГОВАЯ ОЦЕНКА" in response_text:
+            block = response_text.split("ИТОГОВАЯ ОЦЕНКА")[1].split("\n\n")[0]
+            match = re.search(r'Общий балл:?\s*(\d+)', block)
+            if match:
+                return int(match.group(1))
+        score_matches = re.search(r'Общий балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            score_matches = re.search(r'общий балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+        if not score_matches:
+            score_matches = re.search(r'ОБЩИЙ БАЛЛ:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
+    return int(score_matches.group(1)) if score_matches else None
+
+def legacy_extract_38(i: int, response_text: str):
+    """Прежний каскад для задания 38 (без логирования и значения по умолчанию)"""
+    if "ИТОГОВАЯ ОЦЕНКА" in response_text:
+        text = response_text.split("ИТОГОВАЯ ОЦЕНКА")[1].lstrip('\n\r\t ')
+        parts = text.split("\n\n")
+        section = parts[0]
+        if len(section) < 50 and len(parts) > 1:
+            section = section + "\n\n" + parts[1]
+        match = re.search(r'Балл:?\s*(\d+)', section)
+        if match:
+            return int(match.group(1))
+    for pattern in [
+        r'Балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
+        r'Итоговый балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
+        r'Финальный балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
+        r'ОЦЕНКА:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
+        r'Оценка:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
+        r'получает\s*\*\*(\d+)\s*балл'
+    ]:
+        match = re.search(pattern, response_text)
+        if match:
+            return int(match.group(1))
+    return None
+
+ENDINGS = {
+    "prompt1": ["ИТОГОВАЯ ОЦЕНКА\nИтоговый балл: 2", "ИТОГОВАЯ ОЦЕНКА\nРабота получает 1 балл", "Без оценки."],
+    "prompt2": ["ИТОГОВАЯ ОЦЕНКА\n- Балл: 2", "Работа получает **1 балл**.", "Без оценки."],
+    "prompt3": ["ИТОГОВАЯ ОЦЕНКА\n- Общий балл: 2\n\nРекомендации.", "Общий балл: 1.", "Без оценки."],
+    "prompt38_1": ["ИТОГОВАЯ ОЦЕНКА\n\n*Критерий 1*\n- Балл: 3\n", "Итоговый балл: 2 из 3", "Без оценки."],
+}
+
+def make_response(size_kb: int, ending: str, seed: int) -> str:
+    rng = random.Random(seed)
+    vocabulary = ["Ученик", "корректно", "использует", "связки", "however", "абзац", "ошибка", "(collocations)",
+                  "*Рекомендации*", "в", "тексте", "встречаются", "неточности", "\n\n"]
+    words = []
+    length = 0
+    while length < size_kb * 1024:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words) + "\n\n" + ending
+
+def legacy(prompt_name: str, response_text: str):
+    if prompt_name.startswith("prompt38"):
+        return legacy_extract_38(1, response_text)
+    return legacy_extract_37(int(prompt_name[-1]), response_text)
+
+def main():
+    print(f"{'Промпт':>11} {'Размер':>7} {'Каскад, мкс':>12} {'Таблица, мкс':>13} {'Ускорение':>10}  Совпадает")
+    for prompt_name, endings in ENDINGS.items():
+        for size_kb in SIZES_KB:
+            responses = [make_response(size_kb, ending, seed) for seed, ending in enumerate(endings)]
+            runs = 200
+            old = timeit.timeit(lambda: [legacy(prompt_name, text) for text in responses], number=runs) / runs / len(responses) * 1e6
+            new = timeit.timeit(lambda: [extract_score(prompt_name, text) for text in responses], number=runs) / runs / len(responses) * 1e6
+            same = all(legacy(prompt_name, text) == extract_score(prompt_name, text)[0] for text in responses)
+            print(f"{prompt_name:>11} {size_kb:>5}КБ {old:>12.1f} {new:>13.1f} {old / new:>9.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк индекса почти совпадающих работ: время вычисления сигнатуры,
+время поиска и потребление памяти на сотнях тысяч работ.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_similarity_index [число работ]
+"""
+
+import os
+import sys
+import time
+import random
+import tracemalloc
+from array import array
+
+# config.py требует наличия ключей, для бенчмарка подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from services.similarity_index import NearDuplicateIndex, minhash_signature, shingle_hashes, NUM_PERM
+
+VOCABULARY = [f"word{i}" for i in range(3000)]
+VARIANTS = [f"38:variant{i}" for i in range(50)]
+
+def make_essay(rng: random.Random, words: int = 230) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+def random_signature(rng: random.Random) -> array:
+    return array("I", rng.randbytes(4 * NUM_PERM))
+
+def random_shingles(rng: random.Random, count: int = 228) -> array:
+    return array("I", sorted(array("I", rng.randbytes(4 * count))))
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(1)
+
+    essay = make_essay(rng)
+    start = time.perf_counter()
+    for _ in range(100):
+        minhash_signature(shingle_hashes(essay))
+    print(f"Сигнатура работы из 230 слов: {(time.perf_counter() - start) * 10:.2f} мс")
+
+    index = NearDuplicateIndex(max_entries=total, threshold=0.95)
+    tracemalloc.start()
+    start = time.perf_counter()
+    # Случайные сигнатуры и шинглы вместо реальных работ, чтобы заполнение не занимало минуты
+    for i in range(total):
+        index.add(rng.choice(VARIANTS), random_signature(rng), random_shingles(rng), f"{i:064x}")
+    fill_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Заполнение {total} работ: {fill_time:.1f} с, память: {memory / 1024 / 1024:.0f} МБ "
+          f"({memory / total:.0f} байт на работу)")
+
+    # Реальные работы: исходная и копия с одним замененным словом
+    variant = VARIANTS[0]
+    original = essay.split()
+    shingles = shingle_hashes(essay)
+    index.add(variant, minhash_signature(shingles), shingles, "original")
+    edited = list(original)
+    edited[100] = "changed"
+
+    for name, text, expected in (("копия с одним измененным словом", " ".join(edited), "original"),
+                                 ("новая работа", make_essay(rng), None)):
+        shingles = shingle_hashes(text)
+        signature = minhash_signature(shingles)
+        start = time.perf_counter()
+        for _ in range(1000):
+            result = index.find(variant, signature, shingles)
+        elapsed = (time.perf_counter() - start) * 1000 / 1000
+        print(f"Поиск ({name}): {elapsed * 1000:.1f} мкс, результат: {result}")
+        found = result[0] if result else None
+        assert found == expected, f"{name}: ожидался {expected}, найден {found}"
+
+if __name__ == "__main__":
+    main()
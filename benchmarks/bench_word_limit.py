@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк подсчета и обрезки слов (лимиты 154 и 275 слов) на текстах
+от 1 КБ до 100 КБ: прежний способ (регулярное выражение из всех слов)
+против однопроходного count_words_and_truncate.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_word_limit
+"""
+
+import re
+import random
+import timeit
+
+from utils.text_utils import truncate_words
+
+SIZES_KB = [1, 10, 50, 100]
+LIMITS = [154, 275]
+
+def legacy_truncate(text: str, limit: int) -> tuple:
+    """Прежняя реализация из gemini_service (до перехода на общий токенизатор)"""
+    words = re.findall(r'\b\w+\b', text)
+    word_count = len(words)
+    if word_count > limit:
+        truncated_words = words[:limit]
+        pattern = r'\b(' + '|'.join(re.escape(word) for word in truncated_words) + r')\b'
+        matches = list(re.finditer(pattern, text))
+        if matches and len(matches) >= limit:
+            text = text[:matches[limit - 1].end()]
+        else:
+            text = ' '.join(truncated_words)
+    return text, word_count
+
+def make_text(size_kb: int) -> str:
+    rng = random.Random(size_kb)
+    vocabulary = ["students", "often", "use", "public", "transport,", "while", "others", "prefer", "bikes.",
+                  "In", "my", "opinion", "it's", "important", "to", "consider", "27%", "of", "respondents"]
+    words = []
+    length = 0
+    while length < size_kb * 1024:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+def main():
+    print(f"{'Размер':>8} {'Лимит':>6} {'Прежний, мс':>12} {'Новый, мс':>10} {'Ускорение':>10}  Совпадает")
+    for size_kb in SIZES_KB:
+        text = make_text(size_kb)
+        for limit in LIMITS:
+            runs = 20
+            legacy = timeit.timeit(lambda: legacy_truncate(text, limit), number=runs) / runs * 1000
+            current = timeit.timeit(lambda: truncate_words(text, limit), number=runs) / runs * 1000
+            same = legacy_truncate(text, limit) == truncate_words(text, limit)
+            print(f"{size_kb:>6}КБ {limit:>6} {legacy:>12.3f} {current:>10.3f} {legacy / current:>9.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
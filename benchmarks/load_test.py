@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест проверки работ на локальной заглушке модели FakeBackend:
+много пользователей одновременно отправляют работы по заданиям 37 и 38
+через check_with_gemini (очередь, повторы, предохранитель, потоковые ответы -
+все как в боте), без сети и без расхода квоты Gemini.
+
+Все задержки (ответы модели, паузы перед повтором, таймауты, квоты в минуту)
+масштабируются --time-scale, поэтому тест на 1000 пользователей с задержкой
+модели ~8 с проходит за десятки секунд. Время в отчете - в масштабе модели.
+Процессорное время самого бота не масштабируется: если цикл событий загружен
+почти полностью, задержки завышены тестом - увеличьте --time-scale.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_test --users 1000 --error-rate 0.02
+
+С --cascade критерии сначала проверяются быстрой моделью (ее задержка -
+--fast-latency-factor от задержки основной), в отчет добавляется доля
+принятых ответов быстрой модели и задержки каждой ступени каскада.
+
+Упрощенный режим под нагрузкой (DEGRADED_MODE) работает как в боте, его
+пороги задаются --degraded-backlog и --degraded-queue-depth; --no-degraded
+выключает его для сравнения. В отчете - сколько проверок прошло в каждом режиме.
+
+С --shadow-rate доля проверок в фоне сравнивается с промптами-кандидатами
+из --shadow-dir (теневая проверка), в конце выводится отчет сравнения.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+# config.py требует наличия ключей, для заглушки подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from services import gemini_service, rate_limiter, resilience, degraded_mode, shadow_evaluation
+from services.fake_backend import FakeBackend
+from services.llm_backend import set_backend
+from services.metrics import get_metrics
+from services.model_cascade import get_cascade_stats
+from config import (
+    GEMINI_HEDGE_MIN_DELAY, GEMINI_BREAKER_ERROR_RATE, GEMINI_BREAKER_MIN_REQUESTS,
+    GEMINI_BREAKER_WINDOW_SECONDS, GEMINI_BREAKER_OPEN_SECONDS, GEMINI_MODEL, GEMINI_FAST_MODEL,
+    DEGRADED_BACKLOG, DEGRADED_QUEUE_DEPTH, DEGRADED_LATENCY, DEGRADED_HOLD_SECONDS,
+    GEMINI_REQUEST_TIMEOUT, SHADOW_PROMPTS_DIR, SHADOW_MAX_CONCURRENCY
+)
+
+# Словарь для случайных решений: работы разных пользователей не совпадают
+VOCABULARY = [f"word{i}" for i in range(2000)]
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест проверки работ на заглушке модели")
+    parser.add_argument("--users", type=int, default=1000, help="число пользователей (по одной работе на каждого)")
+    parser.add_argument("--ramp", type=float, default=60, help="за сколько секунд приходят все работы")
+    parser.add_argument("--latency-median", type=float, default=8, help="медиана задержки ответа модели, с")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma логнормального распределения задержки")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--rpm", type=int, default=0, help="квота запросов в минуту (0 - без ограничения)")
+    parser.add_argument("--tpm", type=int, default=0, help="квота входных токенов в минуту (0 - без ограничения)")
+    parser.add_argument("--time-scale", type=float, default=0.25, help="множитель всех задержек")
+    parser.add_argument("--cascade", action="store_true", help="проверять сначала быстрой моделью (GEMINI_CASCADE)")
+    parser.add_argument("--fast-latency-factor", type=float, default=0.4, help="задержка быстрой модели относительно основной")
+    parser.add_argument("--no-degraded", action="store_true", help="не переходить в упрощенный режим под нагрузкой")
+    parser.add_argument("--degraded-backlog", type=int, default=DEGRADED_BACKLOG, help="порог проверок в работе для упрощенного режима")
+    parser.add_argument("--degraded-queue-depth", type=int, default=DEGRADED_QUEUE_DEPTH, help="порог очереди квот для упрощенного режима")
+    parser.add_argument("--shadow-rate", type=float, default=0, help="доля проверок для теневой проверки промптов-кандидатов")
+    parser.add_argument("--shadow-dir", default=SHADOW_PROMPTS_DIR, help="каталог промптов-кандидатов")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+def make_user_data(rng: random.Random, user_id: int) -> dict:
+    task_number = rng.choice(("37", "38"))
+    words = rng.randint(110, 150) if task_number == "37" else rng.randint(200, 260)
+    return {
+        "task_number": task_number,
+        "task_description": f"Load test task {user_id % 20}",
+        "task_solution": " ".join(rng.choice(VOCABULARY) for _ in range(words)),
+    }
+
+def scale_timings(scale: float, args) -> None:
+    """Переводит паузы, таймауты и окна устойчивости в масштаб времени заглушки"""
+    gemini_service.RETRY_DELAY *= scale
+    gemini_service.GEMINI_REQUEST_TIMEOUT *= scale
+    gemini_service.GEMINI_CASCADE_FAST_TIMEOUT *= scale
+    resilience._latency_tracker = resilience.LatencyTracker(min_delay=GEMINI_HEDGE_MIN_DELAY * scale)
+    resilience._circuit_breakers = {
+        model_name: resilience.CircuitBreaker(
+            GEMINI_BREAKER_ERROR_RATE, GEMINI_BREAKER_MIN_REQUESTS,
+            GEMINI_BREAKER_WINDOW_SECONDS * scale, GEMINI_BREAKER_OPEN_SECONDS * scale, name=model_name
+        )
+        for model_name in (GEMINI_MODEL, GEMINI_FAST_MODEL)
+    }
+    degraded_mode._degraded_mode = degraded_mode.DegradedMode(
+        not args.no_degraded, args.degraded_backlog, args.degraded_queue_depth, DEGRADED_LATENCY * scale,
+        hold_seconds=DEGRADED_HOLD_SECONDS * scale, latency_window=degraded_mode.LATENCY_WINDOW_SECONDS * scale
+    )
+    shadow_evaluation._shadow_evaluator = shadow_evaluation.ShadowEvaluator(
+        args.shadow_dir, args.shadow_rate, SHADOW_MAX_CONCURRENCY, GEMINI_REQUEST_TIMEOUT * scale, seed=args.seed
+    )
+
+async def main():
+    args = parse_args()
+    logging.disable(logging.CRITICAL)
+    scale = args.time_scale
+
+    backend = FakeBackend(
+        args.latency_median, args.latency_sigma, args.error_rate, args.quota_error_rate,
+        time_scale=scale, seed=args.seed, latency_factors={GEMINI_FAST_MODEL: args.fast_latency_factor}
+    )
+    set_backend(backend)
+    gemini_service.GEMINI_CASCADE = args.cascade
+    scale_timings(scale, args)
+    # Квоты в минуту масштаба модели (у быстрой модели каскада - такие же)
+    rate_limiter._rate_limiters = {
+        model_name: rate_limiter.RateLimiter(int(args.rpm / scale), int(args.tpm / scale))
+        for model_name in (GEMINI_MODEL, GEMINI_FAST_MODEL)
+    }
+
+    rng = random.Random(args.seed)
+    latencies = []
+    outcomes = {"ok": 0, "partial": 0, "error": 0}
+    status_updates = 0
+
+    async def user(user_id: int):
+        user_data = make_user_data(rng, user_id)
+        await asyncio.sleep(rng.uniform(0, args.ramp) * scale)
+
+        async def status_callback(text):
+            nonlocal status_updates
+            status_updates += 1
+
+        start = time.perf_counter()
+        try:
+            result = await gemini_service.check_with_gemini(user_data, status_callback)
+        except Exception:
+            outcomes["error"] += 1
+            return
+        latencies.append((time.perf_counter() - start) / scale)
+        # Решения генерируются с достаточным числом слов, поэтому в результате всегда есть extra_info
+        outcomes["partial" if len(result) == 3 and result[2].get("failed") else "ok"] += 1
+
+    print(
+        f"Пользователей: {args.users}, работы приходят за {args.ramp:.0f} с, задержка модели: медиана "
+        f"{args.latency_median} с, sigma {args.latency_sigma}, ошибок 503: {args.error_rate:.0%}, 429: {args.quota_error_rate:.0%}"
+    )
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(user(user_id) for user_id in range(args.users)))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    # Теневые проверки продолжаются после ответов пользователям; в статистику проверок они не входят
+    shadow = shadow_evaluation.get_shadow_evaluator()
+    if shadow.tasks:
+        await asyncio.gather(*shadow.tasks)
+
+    metrics = get_metrics()
+    print(f"Реальное время теста: {wall:.1f} с (в масштабе модели {wall / scale:.0f} с)")
+    print(f"Проверок: успешно {outcomes['ok']}, с непроверенными критериями {outcomes['partial']}, с ошибкой {outcomes['error']}")
+    if latencies:
+        print(
+            f"Время проверки: p50 {percentile(latencies, 50):.1f} с, p95 {percentile(latencies, 95):.1f} с, "
+            f"p99 {percentile(latencies, 99):.1f} с, max {max(latencies):.1f} с"
+        )
+        print(f"Пропускная способность: {len(latencies) / (wall / scale) * 60:.0f} проверок в минуту")
+    print(
+        f"Запросов к модели: {backend.requests}, ошибок: {backend.errors}, повторов: {metrics.total('gemini_retries'):g}, "
+        f"дублирующих: {metrics.total('gemini_hedged_requests'):g}, отклонено предохранителем: {metrics.total('gemini_circuit_rejections'):g}"
+    )
+    print(
+        f"Проверок с 0 баллов по К1 (остальные критерии не нужны): {metrics.total('criteria_short_circuits'):g}, "
+        f"сэкономлено запросов: {metrics.total('criteria_requests_saved'):g}"
+    )
+    if args.cascade:
+        cascade_stats = get_cascade_stats().stats()
+        escalations = ", ".join(f"{reason} {count}" for reason, count in cascade_stats['escalations'].items()) or "нет"
+        print(
+            f"Каскад: запросов к быстрой модели {backend.model_requests.get(GEMINI_FAST_MODEL, 0)}, к основной "
+            f"{backend.model_requests.get(None, 0)}; принято ответов быстрой модели {cascade_stats['hit_rate']:.0%}, "
+            f"переходы к основной: {escalations}"
+        )
+        for tier, (p50, p95) in cascade_stats['latency'].items():
+            if p50 is not None:
+                print(f"   • {tier}: p50 {p50 / scale:.1f} с, p95 {p95 / scale:.1f} с")
+    if not args.no_degraded:
+        modes = ", ".join(
+            f"{name} {metrics.get('graded_checks', mode=name):g}" for name in degraded_mode.LEVEL_NAMES.values()
+        )
+        print(f"Проверок по режимам: {modes}; переключений режима: {metrics.total('degraded_mode_switches'):g}")
+    print(f"Ожидание в очереди квот: {metrics.total('rate_limiter_wait_seconds') / scale:.0f} с суммарно, обновлений статуса: {status_updates}")
+    print(f"Процессорное время: {cpu * 1000 / args.users:.1f} мс на проверку, загрузка цикла событий {cpu / wall:.0%}")
+    if cpu / wall > 0.7:
+        print("⚠️ Цикл событий почти полностью загружен: задержки завышены самим тестом, увеличьте --time-scale")
+    if args.shadow_rate:
+        print(f"\nТеневая проверка (текущий → кандидат):\n{shadow.format_report(scale)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Сборка промптов из prompts/ (шаблоны + общие фрагменты prompts/fragments/)
+и отчет о числе входных токенов: по каждому шаблону критерия и на одну
+проверку в обоих режимах (по критериям и одним запросом). Данные
+пользователя в отчет не входят - считается только статическая часть.
+
+С --baseline промпты той же ревизии git собираются рядом для сравнения.
+По умолчанию токены оцениваются по числу символов (estimate_tokens);
+с --count-tokens они считаются самим Gemini (нужен рабочий GEMINI_API_KEY).
+
+Запуск из корня репозитория:
+    python -m benchmarks.prompt_tokens --baseline HEAD~1
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import subprocess
+import tarfile
+import tempfile
+
+# config.py требует наличия ключей, для оценки по символам подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from services.prompt_registry import PromptRegistry, PROMPTS_DIR, TASK_PROMPTS
+from utils.text_utils import estimate_tokens
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Отчет о числе токенов в собранных промптах")
+    parser.add_argument("--baseline", help="ревизия git для сравнения (например, HEAD~1)")
+    parser.add_argument("--count-tokens", action="store_true", help="считать токены через Gemini count_tokens")
+    return parser.parse_args()
+
+def export_prompts(revision: str, target: str) -> str:
+    """Выгружает каталог промптов ревизии git во временный каталог"""
+    archive = subprocess.run(["git", "archive", revision, PROMPTS_DIR], check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return os.path.join(target, PROMPTS_DIR)
+
+def rendered_prompts(registry: PromptRegistry) -> dict:
+    """Статические части промптов: имя -> текст (шаблоны критериев и шаблоны проверки одним запросом)"""
+    prompts = {}
+    for task_number, names in TASK_PROMPTS.items():
+        for name in names:
+            prompts[name] = registry.get(name).render()
+        prompts[f"single_{task_number}"] = registry.get_single_call_template(task_number).render()
+    return prompts
+
+async def count_tokens(prompts: dict) -> dict:
+    from services import gemini_client
+    model = gemini_client.get_model()
+    counts = {}
+    for name, text in prompts.items():
+        counts[name] = (await model.count_tokens_async(text)).total_tokens
+    return counts
+
+def per_check(tokens: dict) -> dict:
+    """Входные токены на одну проверку: по критериям - сумма шаблонов, одним запросом - один шаблон"""
+    totals = {}
+    for task_number, names in TASK_PROMPTS.items():
+        totals[f"{task_number}: по критериям"] = sum(tokens[name] for name in names)
+        totals[f"{task_number}: одним запросом"] = tokens[f"single_{task_number}"]
+    return totals
+
+def main():
+    args = parse_args()
+    logging.disable(logging.CRITICAL)
+
+    def measure(registry: PromptRegistry) -> dict:
+        prompts = rendered_prompts(registry)
+        if args.count_tokens:
+            return asyncio.run(count_tokens(prompts))
+        return {name: estimate_tokens(text) for name, text in prompts.items()}
+
+    registry = PromptRegistry()
+    tokens = measure(registry)
+    baseline = {}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as target:
+            # Промпты ревизии собираются без нормализации пробелов, как они отправлялись до нее
+            baseline = measure(PromptRegistry(export_prompts(args.baseline, target), normalize=False))
+
+    method = "Gemini count_tokens" if args.count_tokens else "оценка по символам"
+    print(f"Токены статической части промптов ({method})")
+    header = f"{'промпт':<28}{'токенов':>9}"
+    if baseline:
+        header += f"{args.baseline:>12}{'экономия':>10}"
+    print(header + "   фрагменты")
+
+    def row(name: str, value: int, old: int = None, fragments: str = "") -> str:
+        line = f"{name:<28}{value:>9}"
+        if old is not None:
+            line += f"{old:>12}{(old - value) / old:>10.1%}"
+        return line + (f"   {fragments}" if fragments else "")
+
+    for name, value in tokens.items():
+        fragments = ", ".join(registry.get(name).fragments) if name in registry.templates else ""
+        print(row(name, value, baseline.get(name), fragments))
+
+    print("\nНа одну проверку")
+    old_totals = per_check(baseline) if baseline else {}
+    for name, value in per_check(tokens).items():
+        print(row(name, value, old_totals.get(name)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанных проверок: каждая проверка из кассеты проходит
+через get_task_solution целиком (права пользователя, проверка, отправка
+результата на бэкенд, списание бесплатной проверки), а все внешние вызовы
+отвечают из кассеты с записанными задержками. Сравнивая отчеты двух версий
+бота на одной кассете, можно оценить изменение производительности на одном
+и том же трафике.
+
+Кассета записывается работающим ботом с CASSETTE_MODE=record.
+
+Запуск из корня репозитория:
+    python -m benchmarks.replay_flows cassettes/session.jsonl.gz --time-scale 0.1
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных проверок через get_task_solution")
+    parser.add_argument("cassette", help="файл кассеты (.jsonl.gz)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="множитель записанных задержек (0 - без задержек)")
+    parser.add_argument("--concurrency", type=int, default=1, help="сколько проверок воспроизводить одновременно")
+    return parser.parse_args()
+
+args = parse_args()
+# Настройки кассеты читаются config.py при импорте, поэтому задаются до импорта сервисов
+os.environ["CASSETTE_MODE"] = "replay"
+os.environ["CASSETTE_PATH"] = args.cassette
+os.environ["CASSETTE_TIME_SCALE"] = str(args.time_scale)
+# config.py требует наличия ключей, при воспроизведении подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("OCR_API_KEY", "benchmark")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+
+from handlers.conversation_handlers import get_task_solution
+from services.cassette import get_cassette
+from services.metrics import get_metrics
+
+class FakeMessage:
+    """Сообщение Telegram: ответы и правки только считаются"""
+
+    def __init__(self, text: str = "", counters: dict = None):
+        self.text = text
+        self.counters = counters if counters is not None else {}
+
+    async def reply_text(self, text, **kwargs):
+        self.counters["replies"] = self.counters.get("replies", 0) + 1
+        return FakeMessage(text, self.counters)
+
+    async def edit_text(self, text, **kwargs):
+        self.counters["edits"] = self.counters.get("edits", 0) + 1
+        return self
+
+    async def delete(self):
+        return True
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+
+class FakeUpdate:
+    def __init__(self, user_id: int, text: str, counters: dict):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text, counters)
+
+class FakeContext:
+    def __init__(self, user_data: dict):
+        self.user_data = user_data
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    cassette = get_cassette()
+    if not cassette.flows:
+        print(f"В кассете {args.cassette} нет записанных проверок")
+        sys.exit(1)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    counters = {}
+
+    async def replay(flow: dict):
+        user_data = {field: value for field, value in flow.items() if field != "user_id"}
+        update = FakeUpdate(flow["user_id"], user_data.get("task_solution", ""), counters)
+        async with semaphore:
+            start = time.perf_counter()
+            await get_task_solution(update, FakeContext(user_data))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(replay(flow) for flow in cassette.flows))
+    wall = time.perf_counter() - start
+
+    stats = cassette.stats
+    print(f"Кассета: {args.cassette}, проверок: {len(cassette.flows)}, множитель задержек: {args.time_scale}")
+    print(f"Общее время: {wall:.2f} с, одновременно: {args.concurrency}")
+    print(
+        f"Время проверки: p50 {percentile(latencies, 50):.2f} с, p95 {percentile(latencies, 95):.2f} с, "
+        f"max {max(latencies):.2f} с"
+    )
+    print(
+        f"Внешних вызовов воспроизведено: {stats['replayed']}, из них по группе: {stats['group_matches']}, "
+        f"не найдено: {stats['misses']}"
+    )
+    print(f"Сообщений: {counters.get('replies', 0)}, правок статуса: {counters.get('edits', 0)}, "
+          f"повторов запросов к модели: {get_metrics().total('gemini_retries'):g}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -51,6 +51,10 @@ if [ -d "prompts" ]; then
         "prompts/prompt38_3.txt"
         "prompts/prompt38_4.txt"
         "prompts/prompt38_5.txt"
+        "prompts/fragments/answer_style.txt"
+        "prompts/fragments/english_terms.txt"
+        "prompts/fragments/task37_input.txt"
+        "prompts/fragments/task38_input.txt"
     )
     
     for file in "${prompt_files[@]}"; do
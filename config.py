@@ -22,8 +22,136 @@ missing_vars = [var for var, value in required_vars.items() if not value]
 if missing_vars:
     raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
 
+# GEMINI_API_KEY может содержать несколько ключей через запятую (пул ключей)
+GEMINI_API_KEYS = [key.strip() for key in GEMINI_API_KEY.split(",") if key.strip()]
+
+# Gemini настройки
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Максимальное число одновременных запросов к Gemini со всего бота
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "100"))
+# Квоты Gemini на один ключ: запросов и входных токенов в минуту (0 - без ограничения)
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "1000"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+# Начальная пауза ключа после ответа 429 (удваивается при повторных 429)
+GEMINI_KEY_COOLDOWN_SECONDS = float(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "60"))
+# Повторных попыток запросов к Gemini на одну проверку (на все критерии вместе)
+GEMINI_RETRY_BUDGET = int(os.getenv("GEMINI_RETRY_BUDGET", "4"))
+# Жесткий таймаут одного запроса к Gemini, секунд
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "120"))
+# Дублирующий запрос, если ответа нет дольше этого перцентиля задержки (0 - не дублировать)
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "10"))
+# Предохранитель: при доле ошибок от GEMINI_BREAKER_ERROR_RATE за окно (и минимум запросов)
+# запросы к Gemini не отправляются GEMINI_BREAKER_OPEN_SECONDS секунд
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_MIN_REQUESTS = int(os.getenv("GEMINI_BREAKER_MIN_REQUESTS", "10"))
+GEMINI_BREAKER_WINDOW_SECONDS = float(os.getenv("GEMINI_BREAKER_WINDOW_SECONDS", "60"))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))
+# Кэшировать статическую рубрику промптов на стороне Gemini (cached content)
+GEMINI_PREFIX_CACHE = os.getenv("GEMINI_PREFIX_CACHE", "true").lower() == "true"
+GEMINI_PREFIX_CACHE_TTL_MINUTES = int(os.getenv("GEMINI_PREFIX_CACHE_TTL_MINUTES", "60"))
+# Отправлять запросы по всем критериям задания одновременно
+GEMINI_PARALLEL_CRITERIA = os.getenv("GEMINI_PARALLEL_CRITERIA", "true").lower() == "true"
+# Не проверять (отменять) остальные критерии, если по первому выставлено 0 баллов
+GEMINI_SHORT_CIRCUIT_K1 = os.getenv("GEMINI_SHORT_CIRCUIT_K1", "true").lower() == "true"
+# Каскад моделей при проверке по критериям: сначала быстрая модель GEMINI_FAST_MODEL (без повторов,
+# с коротким таймаутом), основная GEMINI_MODEL - только если балл не найден, ответ испорчен
+# или балл входит в GEMINI_CASCADE_BOUNDARY_SCORES (через запятую)
+GEMINI_CASCADE = os.getenv("GEMINI_CASCADE", "false").lower() == "true"
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+GEMINI_CASCADE_BOUNDARY_SCORES = [int(score) for score in os.getenv("GEMINI_CASCADE_BOUNDARY_SCORES", "0").split(",") if score.strip()]
+GEMINI_CASCADE_FAST_TIMEOUT = float(os.getenv("GEMINI_CASCADE_FAST_TIMEOUT", "30"))
+# Квоты быстрой модели на один ключ (у каждой модели свои квоты, очередь и предохранитель)
+GEMINI_FAST_RPM_LIMIT = int(os.getenv("GEMINI_FAST_RPM_LIMIT", "4000"))
+GEMINI_FAST_TPM_LIMIT = int(os.getenv("GEMINI_FAST_TPM_LIMIT", "4000000"))
+# Максимум выходных токенов в ответе Gemini
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "8192"))
+# Адаптивный лимит выходных токенов по промпту: перцентиль длины ответов с запасом (доля), не меньше минимума
+GEMINI_TOKEN_BUDGETS = os.getenv("GEMINI_TOKEN_BUDGETS", "true").lower() == "true"
+GEMINI_TOKEN_BUDGET_PERCENTILE = float(os.getenv("GEMINI_TOKEN_BUDGET_PERCENTILE", "99"))
+GEMINI_TOKEN_BUDGET_HEADROOM = float(os.getenv("GEMINI_TOKEN_BUDGET_HEADROOM", "0.2"))
+GEMINI_TOKEN_BUDGET_MIN = int(os.getenv("GEMINI_TOKEN_BUDGET_MIN", "1024"))
+# Потоковое получение ответов Gemini: промежуточный прогресс и предварительные баллы в статусе проверки
+# (потоки дублируются по времени до первого фрагмента, а не по времени полного ответа)
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() == "true"
+# Не чаще одного обновления статуса за столько секунд при потоковом ответе
+GEMINI_STREAM_STATUS_INTERVAL = float(os.getenv("GEMINI_STREAM_STATUS_INTERVAL", "3"))
+# Проверка всех критериев одним запросом с ответом в JSON: для каких заданий
+# (через запятую, например "37,38") и для каких пользователей (free - без подписки, premium - с подпиской)
+GEMINI_SINGLE_CALL_TASKS = {task.strip() for task in os.getenv("GEMINI_SINGLE_CALL_TASKS", "").split(",") if task.strip()}
+GEMINI_SINGLE_CALL_TIERS = {tier.strip() for tier in os.getenv("GEMINI_SINGLE_CALL_TIERS", "free").split(",") if tier.strip()}
+# Упрощенная проверка под нагрузкой: если проверок в работе больше DEGRADED_BACKLOG, запросов в очереди
+# квот больше DEGRADED_QUEUE_DEPTH или p95 задержки запросов по критериям за минуту больше DEGRADED_LATENCY
+# секунд (0 - сигнал не учитывается), все задания проверяются одним запросом, при вдвое большей нагрузке -
+# еще и с кратким разбором (лимит токенов ответа - адаптивный лимит с запасом, но не меньше
+# DEGRADED_MAX_OUTPUT_TOKENS). Обычная проверка возвращается, когда нагрузка ниже доли
+# DEGRADED_RECOVERY_RATIO порога, но не раньше чем через DEGRADED_HOLD_SECONDS
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "true").lower() == "true"
+DEGRADED_BACKLOG = int(os.getenv("DEGRADED_BACKLOG", "50"))
+DEGRADED_QUEUE_DEPTH = int(os.getenv("DEGRADED_QUEUE_DEPTH", "20"))
+DEGRADED_LATENCY = float(os.getenv("DEGRADED_LATENCY", "60"))
+DEGRADED_RECOVERY_RATIO = float(os.getenv("DEGRADED_RECOVERY_RATIO", "0.5"))
+DEGRADED_HOLD_SECONDS = float(os.getenv("DEGRADED_HOLD_SECONDS", "60"))
+DEGRADED_MAX_OUTPUT_TOKENS = int(os.getenv("DEGRADED_MAX_OUTPUT_TOKENS", "4096"))
+# Теневая проверка новых версий промптов: доля проверок (0 - выключена), которые в фоне проверяются
+# еще раз промптами-кандидатами из SHADOW_PROMPTS_DIR (недостающие файлы берутся из prompts/) и, для
+# сравнения в тех же условиях, текущими промптами; не больше SHADOW_MAX_CONCURRENCY запросов одновременно
+# и только пока свободна доля SHADOW_MIN_HEADROOM минутной квоты Gemini
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+SHADOW_PROMPTS_DIR = os.getenv("SHADOW_PROMPTS_DIR", "prompts/candidate")
+SHADOW_MAX_CONCURRENCY = int(os.getenv("SHADOW_MAX_CONCURRENCY", "4"))
+SHADOW_MIN_HEADROOM = float(os.getenv("SHADOW_MIN_HEADROOM", "0.5"))
+
+# Модель для проверки: gemini или fake - локальная заглушка без сети для нагрузочных тестов
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+# Заглушка: медиана и разброс (sigma логнормального распределения) задержки ответа,
+# доля ответов с ошибкой 503 и доля ответов 429
+FAKE_LLM_LATENCY_MEDIAN = float(os.getenv("FAKE_LLM_LATENCY_MEDIAN", "8"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_QUOTA_ERROR_RATE = float(os.getenv("FAKE_LLM_QUOTA_ERROR_RATE", "0"))
+# Заглушка: время загрузки изображения графика, секунд
+FAKE_LLM_UPLOAD_LATENCY = float(os.getenv("FAKE_LLM_UPLOAD_LATENCY", "1.5"))
+
+# Кассета внешних вызовов (Gemini, OCR, API checkmateai.ru, ЮKassa): off, record - записывать
+# в файл (вместе с текстами работ - это персональные данные, файл нельзя публиковать;
+# пароли, токены и ссылки на оплату не записываются), replay - воспроизводить из файла без сети;
+# множитель записанных задержек при воспроизведении (0 - без задержек)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/session.jsonl.gz")
+CASSETTE_TIME_SCALE = float(os.getenv("CASSETTE_TIME_SCALE", "1"))
+
+# Кэш результатов проверки (повторная отправка той же работы)
+GRADING_CACHE_SIZE = int(os.getenv("GRADING_CACHE_SIZE", "1000"))
+GRADING_CACHE_TTL_HOURS = float(os.getenv("GRADING_CACHE_TTL_HOURS", "24"))
+# Каталог для дискового уровня кэша (пусто - только память)
+GRADING_CACHE_DIR = os.getenv("GRADING_CACHE_DIR", "")
+# Максимальный размер каталога дискового кэша, МБ (самые старые записи удаляются)
+GRADING_CACHE_DISK_MAX_MB = float(os.getenv("GRADING_CACHE_DISK_MAX_MB", "200"))
+
+# Поиск почти совпадающих работ (MinHash/LSH): off - выключен, log - фиксировать совпадения
+# в логе и метриках. Результат чужой работы не используется никогда (прежнее значение reuse работает как log),
+# поэтому по умолчанию поиск выключен: индекс занимает память, а сигнатура - процессор на каждую проверку
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "off")
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.95"))
+# Максимум работ в индексе (около 2 КБ памяти на работу)
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "100000"))
+
+# Повторная проверка исправленной работы: сравнение с прошлой отправкой пользователя по тому же
+# заданию и перепроверка только затронутых критериев. Критерии содержания и языка перепроверяются
+# при любой правке текста, организации - если изменилось больше этой доли слов (или деление на абзацы)
+INCREMENTAL_REGRADE = os.getenv("INCREMENTAL_REGRADE", "true").lower() == "true"
+INCREMENTAL_REGRADE_THRESHOLD = float(os.getenv("INCREMENTAL_REGRADE_THRESHOLD", "0.15"))
+# Сколько последних отправок хранить и как долго (в памяти)
+SUBMISSION_HISTORY_SIZE = int(os.getenv("SUBMISSION_HISTORY_SIZE", "10000"))
+SUBMISSION_HISTORY_TTL_HOURS = float(os.getenv("SUBMISSION_HISTORY_TTL_HOURS", "72"))
+
 # OCR настройки
 OCR_API_URL = os.getenv("OCR_API_URL", "https://api.ocr.space/parse/image")
+# График задания 38: ocr - распознать текст графика через OCR.space и подставить его в промпты,
+# image - приложить само изображение к запросам Gemini (загружается в Files API один раз
+# на проверку, пока пользователь пишет работу; OCR не вызывается)
+GRAPH_MODE = os.getenv("GRAPH_MODE", "ocr").lower()
 
 # YooKassa настройки
 YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
@@ -7,10 +7,23 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import logging
 from services.log_cleaner_service import cleanup_logs_now, get_log_cleaner_service
+from services.metrics import get_metrics
+from services.model_cascade import get_cascade_stats, ESCALATION_REASONS
+from services.active_checks import get_active_checks
+from services.degraded_mode import get_degraded_mode
+from services.shadow_evaluation import get_shadow_evaluator
+from services.rate_limiter import get_rate_limiter
+from services.gemini_keys import get_key_pool
+from services.resilience import get_circuit_breaker, get_latency_tracker
+from services.result_cache import get_result_cache
+from services.similarity_index import get_near_duplicate_index
+from services.token_budget import get_token_budgets
 
 # Импортируем функции для работы с промокодами
 from handlers.subscription_handlers import USED_PROMO_CODES, PROMO_CODES
 from datetime import datetime
+from utils.text_utils import split_message
+from config import GEMINI_MODEL, GEMINI_FAST_MODEL, GEMINI_CASCADE
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -172,6 +185,100 @@ async def promo_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"❌ Ошибка при получении статистики: {str(e)}"
         )
 
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /metrics для просмотра счетчиков проверки"""
+    user_id = update.effective_user.id
+
+    # Проверяем права администратора
+    if not is_admin(user_id):
+        await update.message.reply_text(
+            "❌ У вас нет прав для выполнения этой команды."
+        )
+        return
+
+    try:
+        cache_stats = get_result_cache().stats()
+        index_stats = get_near_duplicate_index().stats()
+
+        message = f"📈 МЕТРИКИ ПРОВЕРКИ\n\n"
+        message += get_metrics().format_report() + "\n\n"
+        message += f"🗄 Кэш результатов: {cache_stats['size']} работ, попаданий {cache_stats['hits']} (с диска {cache_stats['disk_hits']}), промахов {cache_stats['misses']}, доля попаданий {cache_stats['hit_rate']:.0%}\n"
+        message += f"🔎 Индекс похожих работ: {index_stats['size']} работ, поисков {index_stats['lookups']}, совпадений {index_stats['matches']}\n"
+        active_stats = get_active_checks().stats()
+        if active_stats:
+            message += "▶️ Выполняется проверок: " + ", ".join(f"{stage} {count}" for stage, count in active_stats.items()) + "\n"
+        degraded_stats = get_degraded_mode().stats()
+        if degraded_stats['enabled']:
+            seconds = ", ".join(f"{level} {value:.0f} с" for level, value in degraded_stats['seconds'].items() if value)
+            message += f"⚡ Режим проверки: {degraded_stats['level']}, нагрузка {degraded_stats['pressure']:.2f} (время по режимам: {seconds or 'нет'})\n"
+        # У каждой модели свои квоты и предохранитель
+        for model_name in [GEMINI_MODEL] + ([GEMINI_FAST_MODEL] if GEMINI_CASCADE and GEMINI_FAST_MODEL != GEMINI_MODEL else []):
+            limiter_stats = get_rate_limiter(model_name).stats()
+            message += f"🚦 Очередь к {model_name}: {limiter_stats['queue_depth']} запросов, свободно {limiter_stats['available_requests']} запросов и {limiter_stats['available_tokens']} токенов\n"
+            breaker_stats = get_circuit_breaker(model_name).stats()
+            message += f"🛡 Предохранитель {model_name}: {breaker_stats['state']}, ошибок {breaker_stats['failures']} из {breaker_stats['requests']} за окно\n"
+        latency_stats = get_latency_tracker().stats()
+        if latency_stats['p50'] is not None:
+            message += f"⏱ Задержка Gemini: p50 {latency_stats['p50']:.1f} с, p95 {latency_stats['p95']:.1f} с, p99 {latency_stats['p99']:.1f} с, дублирование через {latency_stats['hedge_delay']} с\n"
+        cascade_stats = get_cascade_stats().stats()
+        if cascade_stats['fast_requests']:
+            fast_latency = cascade_stats['latency']['fast']
+            strong_latency = cascade_stats['latency']['strong']
+            escalations = ", ".join(f"{ESCALATION_REASONS[reason]} {count}" for reason, count in cascade_stats['escalations'].items()) or "нет"
+            message += f"🪜 Каскад моделей: принято ответов быстрой модели {cascade_stats['hit_rate']:.0%} из {cascade_stats['fast_requests']}, переходы к основной: {escalations}\n"
+            message += f"   • быстрая: p50 {fast_latency[0]:.1f} с, p95 {fast_latency[1]:.1f} с"
+            message += f"; основная: p50 {strong_latency[0]:.1f} с, p95 {strong_latency[1]:.1f} с\n" if strong_latency[0] is not None else "\n"
+        budget_stats = get_token_budgets().stats()
+        if budget_stats:
+            message += "📏 Ответы по промптам (токены p50/p95, задержка p50/p95, лимит токенов):\n"
+            for prompt_name, stats in budget_stats.items():
+                message += f"   • {prompt_name}: {stats['tokens_p50']}/{stats['tokens_p95']}, {stats['latency_p50']:.1f}/{stats['latency_p95']:.1f} с, лимит {stats['budget']}"
+                message += f", обрезано {stats['truncations']}\n" if stats['truncations'] else "\n"
+        message += "🔑 Ключи Gemini:\n"
+        for key_stats in get_key_pool().stats():
+            message += f"   • {key_stats['key']}: в работе {key_stats['in_flight']}, запросов {key_stats['requests']}, ответов 429 {key_stats['rate_limited']}"
+            cooldowns = ", ".join(f"{model_name} {seconds} с" for model_name, seconds in key_stats['cooldown'].items())
+            message += f", пауза {cooldowns}\n" if cooldowns else "\n"
+
+        # Отчет со счетчиками по промптам, моделям и ключам может не поместиться в одно сообщение
+        for part in split_message(message):
+            await update.message.reply_text(part)
+
+        logger.info(f"Администратор {user_id} запросил метрики")
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении метрик: {e}")
+        await update.message.reply_text(
+            f"❌ Ошибка при получении метрик: {str(e)}"
+        )
+
+async def shadow_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /shadow для просмотра теневой проверки промптов-кандидатов"""
+    user_id = update.effective_user.id
+
+    # Проверяем права администратора
+    if not is_admin(user_id):
+        await update.message.reply_text(
+            "❌ У вас нет прав для выполнения этой команды."
+        )
+        return
+
+    try:
+        message = f"🧪 ТЕНЕВАЯ ПРОВЕРКА ПРОМПТОВ\n(текущий → кандидат)\n\n"
+        message += get_shadow_evaluator().format_report()
+
+        # Сравнение по всем промптам может не поместиться в одно сообщение
+        for part in split_message(message):
+            await update.message.reply_text(part)
+
+        logger.info(f"Администратор {user_id} запросил отчет теневой проверки")
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении отчета теневой проверки: {e}")
+        await update.message.reply_text(
+            f"❌ Ошибка при получении отчета теневой проверки: {str(e)}"
+        )
+
 async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /admin_help для показа административных команд"""
     user_id = update.effective_user.id
@@ -189,6 +296,8 @@ async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 📊 /log_stats - Статистика логов
 🧹 /clear_logs - Очистка логов
 🎫 /promo_stats - Статистика промокодов
+📈 /metrics - Метрики проверки (сбои извлечения баллов и др.)
+🧪 /shadow - Сравнение промптов-кандидатов с текущими
 ➕ /addpromo <КОД> - Создать новый промокод (30 дней)
 ❓ /admin_help - Эта справка
 
@@ -2,19 +2,27 @@ import logging
 import asyncio
 import re
 import os
+import aiofiles
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ConversationHandler
 from services.ocr_service import process_image_ocr
 from services.gemini_service import check_with_gemini
 from services.api_service import register_user, decrement_user_free_checks, can_user_proceed_with_check, send_essay_result, send_table_task_result
 from services.image_service import convert_image_to_base64
+from services.llm_backend import get_backend
+from services.graph_image import GraphImage
+from services.cassette import get_cassette
+from services.active_checks import get_active_checks
 from utils.task37_parser import parse_task37_description, extract_criterion_scores_and_comments
 from utils.task38_parser import parse_task38_description, extract_criterion_scores_and_comments_38
-from config import CHOOSE_TASK, TASK_DESCRIPTION, GRAPH_IMAGE, TASK_SOLUTION, CHECKING, SHOW_ANALYSIS
+from config import CHOOSE_TASK, TASK_DESCRIPTION, GRAPH_IMAGE, TASK_SOLUTION, CHECKING, SHOW_ANALYSIS, GRAPH_MODE
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Данные проверки, которые сохраняются в кассету для воспроизведения get_task_solution
+FLOW_FIELDS = ("task_number", "task_description", "task_solution", "graph_ocr_text", "graph_image_id")
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Первое сообщение бота с выбором задания"""
 
@@ -73,8 +81,36 @@ async def get_task_description(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return TASK_SOLUTION
 
+async def run_cancellable(update: Update, context: ContextTypes.DEFAULT_TYPE, stage: str, handler) -> int:
+    """
+    Выполняет долгий обработчик как проверку пользователя, которую можно
+    отменить командами /cancel и /new (см. ActiveChecks): отмененный
+    обработчик удаляет сообщение о ходе проверки и возвращает состояние
+    диалога, заданное командой.
+    """
+    user_id = update.effective_user.id
+    checks = get_active_checks()
+    check = checks.start(user_id, stage)
+    try:
+        return await handler(update, context, check)
+    except asyncio.CancelledError:
+        if not checks.consume_cancel(check):
+            raise
+        if check.status_message is not None:
+            try:
+                await check.status_message.delete()
+            except Exception as e:
+                logger.warning(f"Не удалось удалить сообщение о ходе отмененной проверки: {e}")
+        return check.result
+    finally:
+        checks.finish(user_id, check)
+
 async def get_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение изображения графика для задания 38"""
+    return await run_cancellable(update, context, "ocr", process_graph_image)
+
+async def process_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE, check) -> int:
+    """Обработка изображения графика: OCR или загрузка изображения для запросов к Gemini"""
     # Проверяем, есть ли изображение
     photo = update.message.photo
 
@@ -89,11 +125,12 @@ async def get_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         # Отправляем сообщение о обработке
         processing_message = await update.message.reply_text("🔍 Обрабатываю изображение графика...")
+        check.status_message = processing_message
+        file_path = f"temp_{photo_id}.jpg"
 
         try:
             # Получаем файл из Telegram
             file = await context.bot.get_file(photo_id)
-            file_path = f"temp_{photo_id}.jpg"
 
             # Скачиваем файл
             await file.download_to_drive(file_path)
@@ -111,12 +148,22 @@ async def get_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 logger.warning("Не удалось конвертировать изображение в base64")
                 context.user_data['table_image_url'] = ""
 
-            # Обрабатываем изображение через OCR.space API
-            await processing_message.edit_text("🔍 Распознаю текст на изображении...")
-            ocr_result = await process_image_ocr(file_path)
+            if GRAPH_MODE == "image":
+                # Изображение прикладывается к запросам Gemini: загрузка начинается сразу
+                # и идет, пока пользователь пишет работу, распознавать текст не нужно
+                async with aiofiles.open(file_path, 'rb') as image_file:
+                    image_data = await image_file.read()
+                context.user_data['graph_image'] = image_data
+                context.user_data.pop('graph_ocr_text', None)
+                get_backend().prepare_image(GraphImage(image_data))
+            else:
+                # Обрабатываем изображение через OCR.space API
+                await processing_message.edit_text("🔍 Распознаю текст на изображении...")
+                ocr_result = await process_image_ocr(file_path)
 
-            # Сохраняем результат OCR в контексте пользователя
-            context.user_data['graph_ocr_text'] = ocr_result
+                # Сохраняем результат OCR в контексте пользователя
+                context.user_data['graph_ocr_text'] = ocr_result
+                context.user_data.pop('graph_image', None)
 
             # Удаляем временный файл
             try:
@@ -134,6 +181,11 @@ async def get_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             return TASK_SOLUTION
 
+        except asyncio.CancelledError:
+            # Обработку отменили: временный файл больше не нужен
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при обработке изображения: {e}")
             await processing_message.edit_text("❌ Произошла ошибка при обработке изображения")
@@ -152,11 +204,21 @@ async def get_graph_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def get_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение решения задания от пользователя"""
+    return await run_cancellable(update, context, "grading", check_task_solution)
+
+async def check_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE, check) -> int:
+    """Проверка решения: права пользователя, проверка через Gemini, отправка результата на бэкенд"""
     # Сохраняем решение
     context.user_data['task_solution'] = update.message.text
 
     # Проверяем, может ли пользователь продолжить с проверкой
     user_id = update.effective_user.id
+
+    # В режиме записи кассеты сохраняем входные данные проверки
+    cassette = get_cassette()
+    if cassette.mode == "record":
+        cassette.record_flow({"user_id": user_id, **{field: context.user_data[field] for field in FLOW_FIELDS if field in context.user_data}})
+
     check_permission = await can_user_proceed_with_check(user_id)
 
     if not check_permission.get("can_proceed", False):
@@ -171,10 +233,14 @@ async def get_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ConversationHandler.END
 
+    # Уровень пользователя определяет режим проверки (см. GEMINI_SINGLE_CALL_TIERS)
+    context.user_data['user_tier'] = "premium" if check_permission.get("is_subscription_active") else "free"
+
     # Сообщение о начале проверки
     status_message = await update.message.reply_text(
         "✨Теперь немного подожди, скоро случится магия..."
     )
+    check.status_message = status_message
 
     try:
         # Сообщаем о начале проверки
@@ -196,7 +262,7 @@ async def get_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if task_number == "37":
             # Для задания 37 функция возвращает дополнительную информацию
             try:
-                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status)
+                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status, user_id=user_id)
                 if len(result) == 3:
                     score, feedback, extra_info = result
                 else:
@@ -246,7 +312,7 @@ async def get_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE)
         elif task_number == "38":
             # Для задания 38 функция возвращает дополнительную информацию
             try:
-                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status)
+                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status, user_id=user_id)
                 if len(result) == 3:
                     score, feedback, extra_info = result
                 else:
@@ -301,7 +367,7 @@ async def get_task_solution(update: Update, context: ContextTypes.DEFAULT_TYPE)
         else:
             # Для других заданий стандартный вызов
             try:
-                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status)
+                result = await check_with_gemini(user_data=context.user_data, status_callback=update_status, user_id=user_id)
                 if len(result) == 2:
                     score, feedback = result
                 else:
@@ -495,7 +561,8 @@ async def show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Отмена диалога"""
+    """Отмена диалога (и выполняющейся проверки, если она есть)"""
+    get_active_checks().cancel(update.effective_user.id, "cancel", ConversationHandler.END)
     await update.message.reply_text('Проверка отменена')
     return ConversationHandler.END
 
@@ -505,6 +572,10 @@ async def new_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     username = update.effective_user.username
 
+    # Выполняющаяся проверка прежнего задания больше не нужна: отменяем ее,
+    # а диалог после отмены продолжится с выбора задания
+    get_active_checks().cancel(user_id, "new", CHOOSE_TASK)
+
     # Регистрируем пользователя в системе
     await register_user(user_id, username)
 
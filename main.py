@@ -12,10 +12,11 @@ from handlers.conversation_handlers import (
 from handlers.subscription_handlers import subscription_command, promo_command, add_promo_command
 from handlers.start_handler import start_callback_handler
 from handlers.feedback_handlers import rating_feedback
-from handlers.admin_handlers import clear_logs_command, log_stats_command, admin_help_command, promo_stats_command
+from handlers.admin_handlers import clear_logs_command, log_stats_command, admin_help_command, promo_stats_command, metrics_command, shadow_command
 from webhook_server import run_webhook_server
 from services.payment_callbacks import setup_bot
 from services.log_cleaner_service import start_log_cleaner
+from services.prompt_registry import get_prompt_registry
 
 logger = setup_logging()
 
@@ -42,10 +43,18 @@ def main() -> None:
         states={
             CHOOSE_TASK: [CallbackQueryHandler(task_choice)],
             TASK_DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_task_description)],
-            GRAPH_IMAGE: [MessageHandler(filters.PHOTO | filters.TEXT & ~filters.COMMAND, get_graph_image)],
-            TASK_SOLUTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_task_solution)],
+            # OCR и проверка через Gemini выполняются долго: block=False, чтобы
+            # не задерживать обработку обновлений других пользователей
+            GRAPH_IMAGE: [MessageHandler(filters.PHOTO | filters.TEXT & ~filters.COMMAND, get_graph_image, block=False)],
+            TASK_SOLUTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_task_solution, block=False)],
             SHOW_ANALYSIS: [
                 CallbackQueryHandler(show_analysis, pattern="^show_analysis$")
+            ],
+            # Пока выполняется неблокирующий обработчик (OCR, проверка), диалог обрабатывает
+            # только эти команды: они отменяют выполняющуюся проверку
+            ConversationHandler.WAITING: [
+                CommandHandler("cancel", cancel),
+                CommandHandler("new", new_task)
             ]
         },
         fallbacks=[
@@ -69,6 +78,8 @@ def main() -> None:
     application.add_handler(CommandHandler("log_stats", log_stats_command))
     application.add_handler(CommandHandler("admin_help", admin_help_command))
     application.add_handler(CommandHandler("promo_stats", promo_stats_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    application.add_handler(CommandHandler("shadow", shadow_command))
     
     application.add_handler(CallbackQueryHandler(start_callback_handler, pattern="^task_"))
 
@@ -88,6 +99,9 @@ def main() -> None:
 
     setup_bot(application.bot)
 
+    # Загружаем и разбираем шаблоны промптов заранее, до первой проверки
+    get_prompt_registry().load_all()
+
     logger.info("Запуск бота CheckMate")
     application.run_polling(drop_pending_updates=True)
 
@@ -0,0 +1,105 @@
+import time
+import asyncio
+import logging
+from services.metrics import get_metrics
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class ActiveCheck:
+    """Выполняющийся этап проверки пользователя: задача asyncio обработчика"""
+
+    def __init__(self, task: asyncio.Task, stage: str):
+        self.task = task
+        self.stage = stage
+        self.started_at = time.monotonic()
+        # Сообщение о ходе проверки: при отмене его никто не ждет, и оно удаляется
+        self.status_message = None
+        # Причина отмены и что вернет отмененный обработчик (None - не отменялась)
+        self.cancel_reason = None
+        self.result = None
+
+class ActiveChecks:
+    """
+    Выполняющиеся проверки пользователей (распознавание графика, проверка
+    через Gemini, отправка результата на бэкенд), по одной на пользователя.
+
+    Обработчик регистрирует свою задачу (start) и снимает ее по завершении
+    (finish). Отмена (cancel) прерывает задачу: ожидающие запросы к Gemini,
+    OCR и бэкенду отменяются сразу, а места в очереди, семафоре и пуле ключей
+    освобождаются их собственными блоками finally.
+    """
+
+    def __init__(self):
+        # user_id -> ActiveCheck
+        self.checks = {}
+
+    def start(self, user_id, stage: str) -> ActiveCheck:
+        """
+        Регистрирует текущую задачу как проверку пользователя на этапе stage
+        (ocr или grading). Прежняя незавершенная проверка пользователя отменяется.
+        """
+        previous = self.checks.get(user_id)
+        task = asyncio.current_task()
+        if previous is not None and previous.task is not task:
+            self.cancel(user_id, "replaced")
+        check = ActiveCheck(task, stage)
+        self.checks[user_id] = check
+        return check
+
+    def finish(self, user_id, check: ActiveCheck) -> None:
+        """Снимает проверку с учета, если она еще зарегистрирована"""
+        if self.checks.get(user_id) is check:
+            del self.checks[user_id]
+
+    def cancel(self, user_id, reason: str, result=None) -> bool:
+        """
+        Отменяет выполняющуюся проверку пользователя.
+
+        Args:
+            reason: Причина для логов и метрик (cancel, new, replaced)
+            result: Что должен вернуть отмененный обработчик (например, состояние диалога)
+
+        Returns:
+            bool: Была ли проверка, которую отменили
+        """
+        check = self.checks.pop(user_id, None)
+        if check is None or check.task.done():
+            return False
+        check.cancel_reason = reason
+        check.result = result
+        check.task.cancel()
+
+        elapsed = time.monotonic() - check.started_at
+        get_metrics().increment("checks_cancelled", stage=check.stage, reason=reason)
+        logger.info(f"Проверка пользователя {user_id} отменена ({reason}) на этапе {check.stage} через {elapsed:.1f} с")
+        return True
+
+    @staticmethod
+    def consume_cancel(check: ActiveCheck) -> bool:
+        """
+        Вызывается в обработчике CancelledError: True, если задачу отменил
+        пользователь (тогда отмена погашена и обработчик может завершиться
+        штатно), False - если задачу отменили извне (остановка бота).
+        """
+        if check.cancel_reason is None:
+            return False
+        check.task.uncancel()
+        return True
+
+    def stats(self) -> dict:
+        """Число выполняющихся проверок по этапам"""
+        stages = {}
+        for check in self.checks.values():
+            stages[check.stage] = stages.get(check.stage, 0) + 1
+        return stages
+
+# Глобальный экземпляр выполняющихся проверок
+_active_checks = None
+
+def get_active_checks() -> ActiveChecks:
+    """Получает глобальный экземпляр выполняющихся проверок"""
+    global _active_checks
+    if _active_checks is None:
+        _active_checks = ActiveChecks()
+    return _active_checks
@@ -4,6 +4,7 @@ import json
 from datetime import datetime, timedelta
 import re
 import ssl
+from services.cassette import cassette_call
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -20,6 +21,7 @@ ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
+@cassette_call("checkmate_api")
 async def register_user(tg_id: int, username: str) -> bool:
     """
     Регистрирует пользователя в системе через API.
@@ -82,6 +84,7 @@ async def register_user(tg_id: int, username: str) -> bool:
         logger.error(f"Ошибка при регистрации пользователя {tg_id}: {e}")
         return False
 
+@cassette_call("checkmate_api")
 async def get_user_subscription(tg_id: int) -> dict:
     """
     Получает информацию о подписке пользователя.
@@ -218,6 +221,7 @@ def calculate_days_left(sub_until: str) -> int:
         logger.error(f"Ошибка при расчете дней до истечения подписки: {e}")
         return 0
 
+@cassette_call("checkmate_api")
 async def update_user_subscription(tg_id: int, days: int = 30) -> bool:
     """
     Обновляет статус подписки пользователя через API.
@@ -286,6 +290,7 @@ async def update_user_subscription(tg_id: int, days: int = 30) -> bool:
         logger.error(f"Тип ошибки: {type(e).__name__}")
         return False
 
+@cassette_call("checkmate_api")
 async def increment_user_free_checks(tg_id: int) -> bool:
     """
     Увеличивает счетчик бесплатных проверок пользователя на 1 через API.
@@ -326,6 +331,7 @@ async def increment_user_free_checks(tg_id: int) -> bool:
         logger.error(f"Ошибка при обновлении счетчика бесплатных проверок пользователя {tg_id}: {e}")
         return False
 
+@cassette_call("checkmate_api")
 async def decrement_user_free_checks(tg_id: int) -> bool:
     """
     Уменьшает счетчик бесплатных проверок пользователя на 1 через API.
@@ -508,6 +514,7 @@ async def get_auth_token() -> str:
         logger.error(f"Ошибка при получении токена авторизации: {e}")
         return ""
 
+@cassette_call("checkmate_api")
 async def send_essay_result(essay_data: dict) -> bool:
     """
     Отправляет результат проверки задания 37 (essay) на бэкенд.
@@ -577,6 +584,7 @@ async def send_essay_result(essay_data: dict) -> bool:
         logger.error(f"Ошибка при отправке результата эссе: {e}")
         return False
 
+@cassette_call("checkmate_api")
 async def send_table_task_result(table_task_data: dict) -> bool:
     """
     Отправляет результат проверки задания 38 (table task) на бэкенд.
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import gzip
+import time
+import asyncio
+import hashlib
+import logging
+import builtins
+import functools
+from collections import deque
+from google.api_core import exceptions as google_exceptions
+from config import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_TIME_SCALE
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Поля с учетными данными: в кассету вместо их значений записывается REDACTED
+SECRET_FIELDS = {"password", "token", "access_token", "refresh_token", "authorization", "api_key", "secret", "secret_key"}
+# Учетные данные внутри строк: заголовок Authorization, попавший в текст ошибки или ответа
+_CREDENTIALS_RE = re.compile(r"\b(Bearer|Basic)\s+[\w.~+/=-]+")
+REDACTED = "[скрыто]"
+
+class CassetteMissError(ValueError):
+    """В кассете нет записи для внешнего вызова, который надо воспроизвести"""
+
+def make_key(*parts) -> str:
+    """Короткий ключ записи по аргументам вызова"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+def redact(value):
+    """Копия значения без учетных данных: поля SECRET_FIELDS и значения Bearer/Basic в строках"""
+    if isinstance(value, dict):
+        return {
+            name: REDACTED if isinstance(name, str) and name.lower() in SECRET_FIELDS else redact(item)
+            for name, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return _CREDENTIALS_RE.sub(lambda match: f"{match.group(1)} {REDACTED}", value)
+    return value
+
+def error_to_dict(error: Exception) -> dict:
+    return {"type": type(error).__name__, "message": str(error)}
+
+def error_from_dict(data: dict) -> Exception:
+    """Восстанавливает исключение записанного типа (ошибки google.api_core и встроенные), иначе RuntimeError"""
+    error_class = getattr(google_exceptions, data["type"], None) or getattr(builtins, data["type"], None)
+    if isinstance(error_class, type) and issubclass(error_class, Exception):
+        try:
+            return error_class(data["message"])
+        except TypeError:
+            pass
+    return RuntimeError(f"{data['type']}: {data['message']}")
+
+class Cassette:
+    """
+    Запись и воспроизведение внешних вызовов (Gemini, OCR.space, API checkmateai.ru,
+    ЮKassa) в сжатый файл JSON Lines.
+
+    record - вызовы выполняются как обычно, пары запрос/ответ и время ответа
+    дописываются в файл; replay - вызовы не выполняются, ответы берутся из файла
+    с исходными задержками, умноженными на time_scale (0 - без задержек).
+    Одинаковые вызовы воспроизводятся в порядке записи; если точного совпадения
+    нет, используется следующая запись той же группы (например, того же шаблона
+    промпта), чтобы можно было сравнивать версии бота с измененными промптами.
+
+    Учетные данные (SECRET_FIELDS, заголовки Authorization) перед записью
+    заменяются на REDACTED, ссылки на оплату - заглушкой. Но кассета содержит
+    тексты работ пользователей и ответы модели с цитатами из них: это
+    персональные данные, кассету нельзя публиковать и передавать (каталог
+    cassettes/ исключен из git).
+    """
+
+    def __init__(self, mode: str = CASSETTE_MODE, path: str = CASSETTE_PATH, time_scale: float = CASSETTE_TIME_SCALE):
+        self.mode = mode
+        self.path = path
+        self.time_scale = time_scale
+        self._file = None
+        # (сервис, вызов, ключ) -> записи; (сервис, вызов, группа) -> записи
+        self.by_key = {}
+        self.by_group = {}
+        # Входные данные проверок (get_task_solution) для воспроизведения целиком
+        self.flows = []
+        self.stats = {"recorded": 0, "replayed": 0, "group_matches": 0, "misses": 0}
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["service"] == "flow":
+                    self.flows.append(entry["data"])
+                    continue
+                self.by_key.setdefault((entry["service"], entry["call"], entry["key"]), deque()).append(entry)
+                self.by_group.setdefault((entry["service"], entry["call"], entry.get("group", "")), deque()).append(entry)
+        logger.info(f"Кассета {self.path} загружена: {sum(len(q) for q in self.by_key.values())} вызовов, {len(self.flows)} проверок")
+
+    def _write(self, entry: dict) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+        # Каждая запись - отдельный сегмент gzip: файл остается читаемым,
+        # даже если бот остановлен без закрытия кассеты
+        line = json.dumps(redact(entry), ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._file.write(gzip.compress(line.encode("utf-8")))
+        self._file.flush()
+        self.stats["recorded"] += 1
+
+    def record(self, service: str, call: str, key: str, elapsed: float, group: str = "", **data) -> None:
+        """Дописывает в кассету вызов и его результат (result, error, chunks и т.д. в data)"""
+        self._write({"service": service, "call": call, "key": key, "group": group, "elapsed": round(elapsed, 3), **data})
+
+    def record_flow(self, data: dict) -> None:
+        """Дописывает в кассету входные данные проверки"""
+        self._write({"service": "flow", "data": data})
+
+    def find(self, service: str, call: str, key: str, group: str = "") -> dict:
+        """
+        Запись для воспроизведения вызова: сначала по ключу, затем по группе.
+        Последняя запись очереди не удаляется и повторяется для следующих таких же вызовов.
+
+        Raises:
+            CassetteMissError: если записи нет
+        """
+        queue = self.by_key.get((service, call, key))
+        exact = bool(queue)
+        if not exact:
+            queue = self.by_group.get((service, call, group))
+            # Записи, уже воспроизведенные по ключу, пропускаем
+            while queue and len(queue) > 1 and queue[0].get("used"):
+                queue.popleft()
+        if not queue:
+            self.stats["misses"] += 1
+            raise CassetteMissError(f"в кассете нет записи для {service}.{call} (ключ {key})")
+
+        entry = queue.popleft() if len(queue) > 1 else queue[0]
+        entry["used"] = True
+        self.stats["replayed"] += 1
+        if not exact:
+            self.stats["group_matches"] += 1
+            logger.info(f"Кассета: для {service}.{call} нет точной записи, использована запись группы «{group}»")
+        return entry
+
+    async def wait(self, seconds: float) -> None:
+        """Пауза воспроизведения с учетом time_scale"""
+        if seconds > 0 and self.time_scale > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+def cassette_call(service: str, key_func=None, scrub=None):
+    """
+    Декоратор асинхронной функции внешнего вызова с JSON-совместимым результатом:
+    в режиме record записывает результат, в режиме replay возвращает записанный.
+
+    Args:
+        service: Имя внешнего сервиса (ocr, checkmate_api, yookassa)
+        key_func: Функция (аргументы вызова) -> части ключа записи; по умолчанию
+                  ключ строится из всех аргументов
+        scrub: Функция (результат) -> результат для записи, если настоящий
+               записывать нельзя (вызывающий код получает настоящий)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cassette = get_cassette()
+            if cassette.mode not in ("record", "replay"):
+                return await func(*args, **kwargs)
+
+            key = make_key(*(key_func(*args, **kwargs) if key_func else (args, kwargs)))
+            if cassette.mode == "replay":
+                entry = cassette.find(service, func.__name__, key)
+                await cassette.wait(entry["elapsed"])
+                if "error" in entry:
+                    raise error_from_dict(entry["error"])
+                return entry["result"]
+
+            start = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                cassette.record(service, func.__name__, key, time.monotonic() - start, error=error_to_dict(e))
+                raise
+            cassette.record(service, func.__name__, key, time.monotonic() - start,
+                            result=scrub(result) if scrub else result)
+            return result
+        return wrapper
+    return decorator
+
+# Глобальный экземпляр кассеты
+_cassette = None
+
+def get_cassette() -> Cassette:
+    """Получает глобальный экземпляр кассеты (режим задает CASSETTE_MODE: off, record, replay)"""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+        if _cassette.mode == "record":
+            logger.warning(f"Кассета внешних вызовов записывается в {_cassette.path}: файл содержит тексты работ пользователей")
+        elif _cassette.mode != "off":
+            logger.info(f"Кассета внешних вызовов: режим {_cassette.mode}, файл {_cassette.path}")
+    return _cassette
@@ -0,0 +1,100 @@
+import time
+import logging
+from services.cassette import get_cassette, make_key, error_to_dict, error_from_dict
+from services.fake_backend import FakeResponse
+from services.llm_backend import LLMBackend, candidate_text, output_token_count
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+def request_key(prompt, generation_config: dict, template, model_name: str = None) -> tuple:
+    """
+    Ключ и группа записи запроса к модели. max_output_tokens в ключ не входит:
+    адаптивный лимит токенов меняется от прогона к прогону. Имя модели входит
+    в ключ только для запросов не к основной модели, чтобы старые кассеты
+    воспроизводились как прежде.
+    """
+    config = {name: value for name, value in (generation_config or {}).items() if name != "max_output_tokens"}
+    group = getattr(template, "name", "")
+    if model_name:
+        return make_key(prompt, config, group, model_name), group
+    return make_key(prompt, config, group), group
+
+def response_fields(response) -> dict:
+    """Длина ответа в токенах (с размышлениями) и причина завершения для записи в кассету"""
+    candidates = getattr(response, "candidates", None)
+    return {
+        "output_tokens": output_token_count(response),
+        "finish_reason": int(candidates[0].finish_reason) if candidates else None,
+    }
+
+class CassetteBackend(LLMBackend):
+    """
+    Модель с записью в кассету (CASSETTE_MODE=record): запросы идут в inner,
+    ответы записываются; или с воспроизведением (replay): ответы берутся из
+    кассеты, inner не нужен.
+    """
+
+    name = "cassette"
+
+    def __init__(self, inner: LLMBackend = None):
+        self.inner = inner
+        self.cassette = get_cassette()
+        self.name = f"cassette-{self.cassette.mode}" + (f"-{inner.name}" if inner else "")
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        key, group = request_key(prompt, generation_config, template, model_name)
+        if self.cassette.mode == "replay":
+            entry = self.cassette.find("gemini", "generate_content", key, group)
+            await self.cassette.wait(entry["elapsed"])
+            if "error" in entry:
+                raise error_from_dict(entry["error"])
+            return FakeResponse(entry["text"], entry["output_tokens"], entry["finish_reason"])
+
+        start = time.monotonic()
+        try:
+            response = await self.inner.generate_content(prompt, generation_config=generation_config, template=template,
+                                                         model_name=model_name)
+        except Exception as e:
+            self.cassette.record("gemini", "generate_content", key, time.monotonic() - start, group, error=error_to_dict(e))
+            raise
+        # Ответ без текста (блокировка, обрезка лимитом) записывается как есть: его разберет проверка
+        self.cassette.record("gemini", "generate_content", key, time.monotonic() - start, group,
+                             text=candidate_text(response), **response_fields(response))
+        return response
+
+    async def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        key, group = request_key(prompt, generation_config, template, model_name)
+        if self.cassette.mode == "replay":
+            entry = self.cassette.find("gemini", "stream_content", key, group)
+            chunks = entry["chunks"]
+            previous = 0.0
+            for i, (offset, text) in enumerate(chunks):
+                await self.cassette.wait(offset - previous)
+                previous = offset
+                last = i == len(chunks) - 1 and "error" not in entry
+                yield FakeResponse(text, entry["output_tokens"] if last else None, entry["finish_reason"] if last else None)
+            if "error" in entry:
+                await self.cassette.wait(entry["elapsed"] - previous)
+                raise error_from_dict(entry["error"])
+            return
+
+        start = time.monotonic()
+        chunks = []
+        chunk = None
+        try:
+            async for chunk in self.inner.stream_content(prompt, generation_config=generation_config, template=template,
+                                                         model_name=model_name):
+                chunks.append((round(time.monotonic() - start, 3), candidate_text(chunk)))
+                yield chunk
+        except Exception as e:
+            self.cassette.record("gemini", "stream_content", key, time.monotonic() - start, group,
+                                 chunks=chunks, error=error_to_dict(e))
+            raise
+        self.cassette.record("gemini", "stream_content", key, time.monotonic() - start, group,
+                             chunks=chunks, **response_fields(chunk))
+
+    def prepare_image(self, image) -> None:
+        # При воспроизведении изображения не загружаются: ответы уже записаны
+        if self.inner is not None:
+            self.inner.prepare_image(image)
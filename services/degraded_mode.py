@@ -0,0 +1,175 @@
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from services.metrics import get_metrics
+from services.rate_limiter import get_rate_limiter
+from config import (
+    DEGRADED_MODE, DEGRADED_BACKLOG, DEGRADED_QUEUE_DEPTH, DEGRADED_LATENCY,
+    DEGRADED_RECOVERY_RATIO, DEGRADED_HOLD_SECONDS
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Уровни нагрузки: обычная проверка, все задания одним запросом, одним запросом с кратким разбором
+NORMAL = 0
+SINGLE_CALL = 1
+BRIEF = 2
+LEVEL_NAMES = {NORMAL: "normal", SINGLE_CALL: "single_call", BRIEF: "brief"}
+
+# За какой период учитываются задержки запросов и сколько их нужно для оценки
+LATENCY_WINDOW_SECONDS = 60
+MIN_LATENCY_SAMPLES = 5
+
+def _percentile(ordered: list, p: float) -> float:
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+class DegradedMode:
+    """
+    Переключение проверки на более дешевые стратегии под нагрузкой.
+
+    Нагрузка - наибольшее из отношений сигнала к порогу: проверок в работе
+    (backlog), запросов в очереди квот Gemini (queue_depth) и p95 задержки
+    запросов по критериям за последнюю минуту (latency). При нагрузке от 1
+    все задания проверяются одним запросом, от 2 - еще и с кратким разбором.
+    Уровень повышается сразу, а понижается на ступень, только когда нагрузка
+    ниже recovery_ratio от порога текущего уровня и уровень держится не
+    меньше hold_seconds - так режим не переключается туда и обратно на каждой
+    проверке.
+
+    Задержка берется у запросов по критериям. Запрос по всем критериям сразу
+    заметно дольше и сам удерживал бы упрощенный режим, поэтому его задержка
+    приводится к масштабу запросов по критериям - умножается на отношение
+    медиан задержек двух видов запросов, замеренное, когда в окне были оба
+    (обычно сразу после переключения режима). Пока отношение не известно,
+    задержка в упрощенном режиме не учитывается.
+    """
+
+    def __init__(self, enabled: bool = DEGRADED_MODE, backlog: int = DEGRADED_BACKLOG,
+                 queue_depth: int = DEGRADED_QUEUE_DEPTH, latency: float = DEGRADED_LATENCY,
+                 recovery_ratio: float = DEGRADED_RECOVERY_RATIO, hold_seconds: float = DEGRADED_HOLD_SECONDS,
+                 latency_window: float = LATENCY_WINDOW_SECONDS):
+        self.enabled = enabled
+        # Пороги сигналов (0 - сигнал не учитывается)
+        self.thresholds = {"backlog": backlog, "queue_depth": queue_depth, "latency": latency}
+        self.recovery_ratio = recovery_ratio
+        self.hold_seconds = hold_seconds
+        self.latency_window = latency_window
+        self.current = NORMAL
+        self.changed_at = time.monotonic()
+        # Проверок, которые сейчас выполняются (без ответов из кэша)
+        self.in_flight = 0
+        # (время, задержка) запросов по критериям и запросов по всем критериям сразу
+        self.latencies = deque()
+        self.single_call_latencies = deque()
+        # Отношение медианы задержки запроса по критерию к медиане запроса по всем критериям
+        self.single_call_ratio = None
+        # Секунд на каждом уровне до последнего переключения
+        self.durations = {level: 0.0 for level in LEVEL_NAMES}
+
+    def record_latency(self, latency: float, single_call: bool = False) -> None:
+        """Учитывает задержку успешного запроса по одному критерию или по всем критериям сразу (single_call)"""
+        (self.single_call_latencies if single_call else self.latencies).append((time.monotonic(), latency))
+
+    def _window(self, samples: deque) -> list:
+        """Задержки из окна latency_window по возрастанию (старые замеры удаляются)"""
+        cutoff = time.monotonic() - self.latency_window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return sorted(latency for _, latency in samples)
+
+    def _latency_p95(self):
+        criteria = self._window(self.latencies)
+        single_calls = self._window(self.single_call_latencies)
+        if len(criteria) >= MIN_LATENCY_SAMPLES and len(single_calls) >= MIN_LATENCY_SAMPLES:
+            self.single_call_ratio = _percentile(criteria, 0.5) / max(_percentile(single_calls, 0.5), 1e-6)
+        if len(criteria) >= MIN_LATENCY_SAMPLES:
+            return _percentile(criteria, 0.95)
+        if len(single_calls) >= MIN_LATENCY_SAMPLES and self.single_call_ratio is not None:
+            return _percentile(single_calls, 0.95) * self.single_call_ratio
+        return None
+
+    def signals(self) -> dict:
+        """Текущие значения сигналов нагрузки"""
+        return {
+            "backlog": self.in_flight,
+            "queue_depth": get_rate_limiter().queue_depth,
+            "latency": self._latency_p95(),
+        }
+
+    def pressure(self, signals: dict = None) -> float:
+        """Нагрузка: наибольшее отношение сигнала к порогу"""
+        signals = signals or self.signals()
+        ratios = [
+            signals[name] / threshold
+            for name, threshold in self.thresholds.items()
+            if threshold > 0 and signals[name] is not None
+        ]
+        return max(ratios, default=0.0)
+
+    def level(self) -> int:
+        """Пересчитывает уровень по текущей нагрузке и возвращает его (NORMAL, SINGLE_CALL или BRIEF)"""
+        if not self.enabled:
+            return NORMAL
+        signals = self.signals()
+        pressure = self.pressure(signals)
+        target = min(int(pressure), BRIEF)
+        now = time.monotonic()
+        if target > self.current:
+            self._switch(target, pressure, signals, now)
+        elif (self.current > NORMAL and pressure < self.recovery_ratio * self.current
+              and now - self.changed_at >= self.hold_seconds):
+            self._switch(self.current - 1, pressure, signals, now)
+        return self.current
+
+    def _switch(self, level: int, pressure: float, signals: dict, now: float) -> None:
+        previous = self.current
+        self.durations[previous] += now - self.changed_at
+        self.current = level
+        self.changed_at = now
+        get_metrics().increment("degraded_mode_switches", level=LEVEL_NAMES[level])
+        latency = signals["latency"]
+        details = (
+            f"нагрузка {pressure:.2f}: проверок в работе {signals['backlog']}, в очереди квот {signals['queue_depth']}, "
+            f"p95 задержки {f'{latency:.1f} с' if latency is not None else 'нет данных'}"
+        )
+        if level > previous:
+            logger.warning(f"Режим проверки: {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} ({details})")
+        else:
+            logger.info(f"Режим проверки: {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} ({details})")
+
+    @contextmanager
+    def grading(self, level: int):
+        """Учитывает выполняющуюся проверку (сигнал backlog) и проверки по уровням"""
+        self.in_flight += 1
+        get_metrics().increment("graded_checks", mode=LEVEL_NAMES[level])
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        """Уровень, нагрузка, сигналы и время на каждом уровне (секунд)"""
+        # Уровень пересчитывается и без новых проверок, чтобы не показывать устаревший
+        self.level()
+        signals = self.signals()
+        durations = dict(self.durations)
+        durations[self.current] += time.monotonic() - self.changed_at
+        return {
+            "enabled": self.enabled,
+            "level": LEVEL_NAMES[self.current],
+            "pressure": round(self.pressure(signals), 2),
+            "signals": signals,
+            "seconds": {LEVEL_NAMES[level]: round(seconds, 1) for level, seconds in durations.items()},
+        }
+
+# Глобальный экземпляр переключателя режима проверки
+_degraded_mode = None
+
+def get_degraded_mode() -> DegradedMode:
+    """Получает глобальный экземпляр переключателя режима проверки под нагрузкой"""
+    global _degraded_mode
+    if _degraded_mode is None:
+        _degraded_mode = DegradedMode()
+    return _degraded_mode
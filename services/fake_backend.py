@@ -0,0 +1,217 @@
+import math
+import json
+import random
+import asyncio
+import logging
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import protos
+from services.llm_backend import LLMBackend
+from services.model_cascade import MAX_SCORES
+from services.graph_image import prompt_images
+from services.prompt_registry import TASK_PROMPTS
+from utils.text_utils import estimate_tokens
+from config import (
+    FAKE_LLM_LATENCY_MEDIAN, FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_ERROR_RATE, FAKE_LLM_QUOTA_ERROR_RATE,
+    FAKE_LLM_UPLOAD_LATENCY
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+FinishReason = protos.Candidate.FinishReason
+
+# Строка с баллом в блоке ИТОГОВАЯ ОЦЕНКА для каждого файла промпта (как в ответах модели)
+SCORE_LINES = {
+    "prompt1": "- Итоговый балл: {score}",
+    "prompt2": "- Балл: {score}",
+    "prompt3": "- Общий балл: {score}",
+}
+DEFAULT_SCORE_LINE = "- Балл: {score}"
+
+# Баллы ответов и их веса: 0 встречается в каждом десятом ответе, чтобы нагрузочные
+# тесты проходили и пропуск остальных критериев после 0 баллов по К1
+SCORE_WEIGHTS = {0: 1, 1: 3, 2: 4, 3: 2}
+
+# Абзацы разбора, из которых собирается ответ
+ANALYSIS_PARAGRAPHS = [
+    "Работа в целом соответствует требованиям задания: затронуты все аспекты, указанные в формулировке.",
+    "Аспект раскрыт не полностью: ответ на вопрос дан, но без необходимых подробностей и аргументации.",
+    "Текст логично разделен на абзацы, средства логической связи использованы уместно.",
+    "Встречаются лексические неточности, которые не затрудняют понимания текста.",
+    "Допущены грамматические ошибки в употреблении времен и артиклей.",
+    "Орфографических ошибок немного, пунктуация в основном соответствует нормам.",
+    "Стиль письма выбран правильно, нормы вежливости соблюдены.",
+]
+
+def prompt_name(template):
+    """Имя файла промпта, из которого собран шаблон (без приставки реестра кандидатов)"""
+    name = getattr(template, "name", None)
+    return name.rsplit("/", 1)[-1] if name else None
+
+def single_call_prompts(template) -> list:
+    """Имена промптов по критериям для шаблона проверки одним запросом (single_37, single_38_brief)"""
+    parts = (prompt_name(template) or "").split("_")
+    if len(parts) < 2 or parts[0] != "single":
+        return []
+    return TASK_PROMPTS.get(parts[1], [])
+
+class FakeResponse:
+    """Ответ или фрагмент потокового ответа в формате google.generativeai"""
+
+    def __init__(self, text: str, output_tokens: int = None, finish_reason=None):
+        self.text = text
+        self.usage_metadata = protos.GenerateContentResponse.UsageMetadata(candidates_token_count=output_tokens) if output_tokens else None
+        # Как у Gemini: у фрагмента без текста нет частей, причина завершения - только в последнем фрагменте
+        self.candidates = [protos.Candidate(
+            content=protos.Content(parts=[protos.Part(text=text)] if text else []),
+            finish_reason=finish_reason or FinishReason.FINISH_REASON_UNSPECIFIED,
+        )]
+
+class FakeBackend(LLMBackend):
+    """
+    Локальная заглушка модели без сетевых запросов для нагрузочных тестов и
+    бенчмарков.
+
+    Отвечает заготовленными разборами в формате рубрик (с баллом в блоке
+    ИТОГОВАЯ ОЦЕНКА под шаблоны извлечения балла; JSON для проверки одним
+    запросом) с логнормальной задержкой и заданной долей ошибок 503 и 429.
+    Запросы к другим моделям (model_name) считаются отдельно и могут отвечать
+    быстрее основной модели (latency_factors). Изображения в промпте
+    "загружаются" один раз (upload_latency), как файлы в Gemini.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_median: float = FAKE_LLM_LATENCY_MEDIAN, latency_sigma: float = FAKE_LLM_LATENCY_SIGMA,
+                 error_rate: float = FAKE_LLM_ERROR_RATE, quota_error_rate: float = FAKE_LLM_QUOTA_ERROR_RATE,
+                 response_paragraphs: tuple = (4, 12), time_scale: float = 1.0, seed: int = None,
+                 latency_factors: dict = None, upload_latency: float = FAKE_LLM_UPLOAD_LATENCY):
+        """
+        Args:
+            latency_median: Медиана задержки ответа, секунд
+            latency_sigma: Разброс задержки (sigma логнормального распределения; 0 - постоянная задержка)
+            error_rate: Доля запросов, завершающихся ошибкой 503
+            quota_error_rate: Доля запросов, завершающихся ошибкой 429
+            response_paragraphs: Сколько абзацев разбора в ответе (от и до)
+            time_scale: Множитель всех задержек (меньше 1 - ускоренный прогон)
+            seed: Начальное значение генератора случайных чисел (для воспроизводимых прогонов)
+            latency_factors: Множитель задержки по имени модели (например, для быстрой модели каскада)
+            upload_latency: Время загрузки изображения, секунд
+        """
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self.response_paragraphs = response_paragraphs
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.latency_factors = latency_factors or {}
+        self.upload_latency = upload_latency
+        # Загрузки изображений: хэш изображения -> задача загрузки
+        self.uploads = {}
+        self.image_uploads = 0
+        self.requests = 0
+        self.errors = 0
+        # Число запросов по имени модели (None - основная модель)
+        self.model_requests = {}
+
+    def latency(self, model_name: str = None) -> float:
+        """Задержка очередного ответа, секунд (с учетом time_scale и множителя модели)"""
+        scale = self.time_scale * self.latency_factors.get(model_name, 1.0)
+        if self.latency_sigma <= 0:
+            return self.latency_median * scale
+        return self.random.lognormvariate(math.log(self.latency_median), self.latency_sigma) * scale
+
+    def _count(self, model_name: str) -> None:
+        self.requests += 1
+        self.model_requests[model_name] = self.model_requests.get(model_name, 0) + 1
+
+    def prepare_image(self, image) -> None:
+        if image.digest not in self.uploads:
+            self.image_uploads += 1
+            self.uploads[image.digest] = asyncio.ensure_future(asyncio.sleep(self.upload_latency * self.time_scale))
+
+    async def _wait_images(self, prompt) -> None:
+        """Ждет загрузки изображений промпта (загружает их при первом запросе)"""
+        for image in prompt_images(prompt):
+            self.prepare_image(image)
+            await asyncio.shield(self.uploads[image.digest])
+
+    def _error(self):
+        """Ошибка для очередного запроса или None"""
+        roll = self.random.random()
+        if roll < self.quota_error_rate:
+            return google_exceptions.ResourceExhausted("fake backend: quota exceeded")
+        if roll < self.quota_error_rate + self.error_rate:
+            return google_exceptions.ServiceUnavailable("fake backend: service unavailable")
+        return None
+
+    def _score(self, prompt: str = None) -> int:
+        """Случайный балл, не больше максимума критерия промпта prompt"""
+        score = self.random.choices(list(SCORE_WEIGHTS), weights=list(SCORE_WEIGHTS.values()))[0]
+        return min(score, MAX_SCORES.get(prompt, score))
+
+    def response_text(self, generation_config: dict = None, template=None) -> str:
+        """Заготовленный ответ на промпт шаблона template"""
+        generation_config = generation_config or {}
+        if generation_config.get("response_mime_type") == "application/json":
+            # Проверка одним запросом: поля k1..kN и comment_k1..comment_kN из схемы ответа,
+            # балл kI - в пределах максимума I-го критерия задания
+            properties = generation_config.get("response_schema", {}).get("properties", {})
+            prompts = single_call_prompts(template)
+            data = {}
+            for field, schema in properties.items():
+                if schema.get("type") == "integer":
+                    i = int(field[1:])
+                    data[field] = self._score(prompts[i-1] if i <= len(prompts) else None)
+                else:
+                    data[field] = " ".join(self.random.sample(ANALYSIS_PARAGRAPHS, 3))
+            return json.dumps(data, ensure_ascii=False)
+
+        paragraphs = [self.random.choice(ANALYSIS_PARAGRAPHS) for _ in range(self.random.randint(*self.response_paragraphs))]
+        score_line = SCORE_LINES.get(prompt_name(template), DEFAULT_SCORE_LINE).format(score=self._score(prompt_name(template)))
+        return "АНАЛИЗ\n\n" + "\n\n".join(paragraphs) + "\n\nИТОГОВАЯ ОЦЕНКА\n" + score_line + "\n"
+
+    def _respond(self, generation_config: dict, template) -> tuple:
+        """Текст ответа, число выходных токенов и причина завершения с учетом max_output_tokens"""
+        text = self.response_text(generation_config, template)
+        output_tokens = estimate_tokens(text)
+        limit = (generation_config or {}).get("max_output_tokens")
+        if limit and output_tokens > limit:
+            return text[:limit * 3], limit, FinishReason.MAX_TOKENS
+        return text, output_tokens, FinishReason.STOP
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        self._count(model_name)
+        await self._wait_images(prompt)
+        latency = self.latency(model_name)
+        error = self._error()
+        if error is not None:
+            self.errors += 1
+            # Ошибки приходят быстрее полноценного ответа
+            await asyncio.sleep(latency * self.random.uniform(0.05, 0.3))
+            raise error
+        await asyncio.sleep(latency)
+        text, output_tokens, finish_reason = self._respond(generation_config, template)
+        return FakeResponse(text, output_tokens, finish_reason)
+
+    async def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None,
+                             chunks: int = 8):
+        self._count(model_name)
+        await self._wait_images(prompt)
+        latency = self.latency(model_name)
+        error = self._error()
+        if error is not None:
+            self.errors += 1
+            await asyncio.sleep(latency * self.random.uniform(0.05, 0.3))
+            raise error
+        text, output_tokens, finish_reason = self._respond(generation_config, template)
+        # Первый фрагмент приходит через пятую часть задержки, остальные - равномерно
+        await asyncio.sleep(latency * 0.2)
+        size = math.ceil(len(text) / chunks)
+        parts = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, part in enumerate(parts):
+            if i:
+                await asyncio.sleep(latency * 0.8 / (len(parts) - 1))
+            last = i == len(parts) - 1
+            yield FakeResponse(part, output_tokens if last else None, finish_reason if last else None)
@@ -0,0 +1,281 @@
+import io
+import time
+import asyncio
+import datetime
+import logging
+import google.generativeai as genai
+from google.generativeai import caching, protos
+from google.generativeai import client as genai_client
+from google.protobuf import field_mask_pb2
+from google.api_core.exceptions import ResourceExhausted
+from services.gemini_keys import get_key_pool
+from services.graph_image import GraphImage
+from config import (
+    GEMINI_API_KEYS, GEMINI_MODEL, GEMINI_MAX_CONCURRENCY,
+    GEMINI_PREFIX_CACHE, GEMINI_PREFIX_CACHE_TTL_MINUTES
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Клиенты ключей пула, привязка модели к ключу и кэш рубрик опираются на внутренние
+# API SDK, проверенные на этой версии (она же закреплена в requirements.txt)
+SUPPORTED_GENAI_VERSION = "0.8.5"
+
+def _check_sdk_internals() -> None:
+    """Проверяет при импорте, что внутренние API SDK, которые использует модуль, на месте"""
+    missing = [
+        name for name, present in (
+            ("client._ClientManager", hasattr(genai_client, "_ClientManager")),
+            ("CachedContent._prepare_create_request", hasattr(caching.CachedContent, "_prepare_create_request")),
+            ("CachedContent._from_obj", hasattr(caching.CachedContent, "_from_obj")),
+            ("GenerativeModel._async_client", "_async_client" in vars(genai.GenerativeModel(GEMINI_MODEL))),
+        )
+        if not present
+    ]
+    if missing:
+        raise ImportError(
+            f"google-generativeai {genai.__version__} не поддерживается (нужна версия {SUPPORTED_GENAI_VERSION}): "
+            f"нет {', '.join(missing)}"
+        )
+    if genai.__version__ != SUPPORTED_GENAI_VERSION:
+        logger.warning(
+            f"google-generativeai {genai.__version__} не проверялась с ботом (нужна версия {SUPPORTED_GENAI_VERSION}), "
+            f"внутренние API SDK могли измениться"
+        )
+
+_check_sdk_internals()
+
+# Конфигурация Gemini API (клиенты по умолчанию - первый ключ пула)
+genai.configure(api_key=GEMINI_API_KEYS[0])
+
+# Модели создаются один раз на ключ и переиспользуются между проверками: (номер ключа, модель) -> модель
+_models = {}
+
+# Ограничение одновременных запросов к Gemini со всего бота
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# Закэшированные на стороне Gemini рубрики (кэш привязан к проекту ключа):
+# (номер ключа, модель, шаблон, версия) -> запись кэша
+_prefix_caches = {}
+# Шаблоны, для которых не удалось создать кэш: ключ -> время следующей попытки
+_prefix_cache_failures = {}
+_prefix_cache_locks = {}
+
+# Изображения, загруженные в Files API (файл доступен только проекту своего ключа):
+# (номер ключа, хэш изображения) -> (время загрузки, задача загрузки)
+_image_uploads = {}
+
+# Продлеваем кэш заранее, если до истечения осталось меньше этого времени
+PREFIX_CACHE_REFRESH_SECONDS = 5 * 60
+# Пауза перед повторной попыткой создать кэш после ошибки
+PREFIX_CACHE_RETRY_SECONDS = 10 * 60
+# Files API удаляет файлы через 48 часов; загруженное изображение используем чуть меньше
+IMAGE_FILE_TTL_SECONDS = 47 * 3600
+
+def get_model(model_name: str = GEMINI_MODEL, key=None) -> genai.GenerativeModel:
+    """Возвращает закэшированный экземпляр GenerativeModel для указанной модели и ключа пула"""
+    key = key or get_key_pool().keys[0]
+    model = _models.get((key.index, model_name))
+    if model is None:
+        logger.info(f"Инициализация модели {model_name} ({key.label})")
+        model = _bind_to_key(genai.GenerativeModel(model_name), key)
+        _models[(key.index, model_name)] = model
+    return model
+
+def _bind_to_key(model: genai.GenerativeModel, key) -> genai.GenerativeModel:
+    """Направляет запросы модели через клиент SDK указанного ключа"""
+    model._async_client = key.get_client("generative_async")
+    return model
+
+def _create_cached_content(key, model_name: str, template, ttl: datetime.timedelta):
+    """Создает cached content с рубрикой шаблона от имени ключа (блокирующий вызов SDK)"""
+    request = caching.CachedContent._prepare_create_request(
+        model=model_name,
+        display_name=f"checkmate-{template.name}-{template.version}",
+        contents=[template.prefix],
+        ttl=ttl,
+    )
+    response = key.get_client("cache").create_cached_content(request)
+    return caching.CachedContent._from_obj(response)
+
+def _update_cached_content(key, cached_content, ttl: datetime.timedelta) -> None:
+    """Продлевает cached content от имени ключа (блокирующий вызов SDK)"""
+    request = protos.UpdateCachedContentRequest(
+        cached_content=protos.CachedContent(name=cached_content.name, ttl=ttl),
+        update_mask=field_mask_pb2.FieldMask(paths=["ttl"]),
+    )
+    key.get_client("cache").update_cached_content(request)
+
+def _model_from_cached_content(key, cached_content) -> genai.GenerativeModel:
+    return _bind_to_key(genai.GenerativeModel.from_cached_content(cached_content), key)
+
+async def get_prefix_model(template, model_name: str = GEMINI_MODEL, key=None):
+    """
+    Возвращает модель, привязанную к закэшированной рубрике шаблона (для ключа key).
+
+    Кэш создается один раз на версию шаблона и продлевается до истечения TTL.
+    Если кэш создать не удалось (например, рубрика короче минимального размера),
+    возвращает None, и запрос отправляется целиком.
+    """
+    key = key or get_key_pool().keys[0]
+    cache_key = (key.index, model_name, template.name, template.version)
+    entry = _prefix_caches.get(cache_key)
+    if entry and entry["expires_at"] - time.time() > PREFIX_CACHE_REFRESH_SECONDS:
+        return entry["model"]
+    if _prefix_cache_failures.get(cache_key, 0) > time.time():
+        return None
+
+    lock = _prefix_cache_locks.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        # Пока ждали блокировку, кэш мог создать другой запрос
+        entry = _prefix_caches.get(cache_key)
+        now = time.time()
+        if entry and entry["expires_at"] - now > PREFIX_CACHE_REFRESH_SECONDS:
+            return entry["model"]
+
+        ttl = datetime.timedelta(minutes=GEMINI_PREFIX_CACHE_TTL_MINUTES)
+        try:
+            if entry and entry["expires_at"] > now:
+                await asyncio.to_thread(_update_cached_content, key, entry["cache"], ttl)
+                logger.info(f"Продлен кэш рубрики {template.name} (версия {template.version}, {key.label})")
+            else:
+                cached_content = await asyncio.to_thread(_create_cached_content, key, model_name, template, ttl)
+                entry = {"cache": cached_content, "model": _model_from_cached_content(key, cached_content)}
+                logger.info(f"Создан кэш рубрики {template.name} (версия {template.version}, {key.label}): {cached_content.name}")
+
+                # Записи прежних версий этого шаблона больше не нужны, они истекут сами
+                for old_key in [k for k in _prefix_caches if k[:3] == cache_key[:3] and k != cache_key]:
+                    del _prefix_caches[old_key]
+        except Exception as e:
+            logger.warning(f"Не удалось закэшировать рубрику {template.name} ({key.label}): {e}. Отправляем промпт целиком")
+            _prefix_cache_failures[cache_key] = now + PREFIX_CACHE_RETRY_SECONDS
+            return None
+
+        entry["expires_at"] = now + ttl.total_seconds()
+        _prefix_caches[cache_key] = entry
+        return entry["model"]
+
+def _upload_image(key, image: GraphImage):
+    """Загружает изображение в Files API от имени ключа (блокирующий вызов SDK)"""
+    response = key.get_client("file").create_file(
+        path=io.BytesIO(image.data), mime_type=image.mime_type, display_name=f"checkmate-graph-{image.digest}"
+    )
+    return genai.types.File(response)
+
+async def _upload_image_async(key, image: GraphImage):
+    start = time.monotonic()
+    file = await asyncio.to_thread(_upload_image, key, image)
+    logger.info(f"Изображение {image.digest} загружено в Gemini ({key.label}) за {time.monotonic() - start:.2f} с: {file.name}")
+    return file
+
+def _image_upload_task(key, image: GraphImage) -> asyncio.Task:
+    """
+    Задача загрузки изображения для ключа: одна на ключ и изображение (одинаковые
+    графики разных пользователей загружаются один раз); неудачная или устаревшая
+    загрузка начинается заново.
+    """
+    upload_key = (key.index, image.digest)
+    now = time.time()
+    created_at, task = _image_uploads.get(upload_key, (0.0, None))
+    if (task is None or now - created_at > IMAGE_FILE_TTL_SECONDS
+            or (task.done() and (task.cancelled() or task.exception() is not None))):
+        # Файлы, удаленные Files API по сроку, больше не нужны
+        for old_key in [k for k, (uploaded_at, _) in _image_uploads.items() if now - uploaded_at > IMAGE_FILE_TTL_SECONDS]:
+            del _image_uploads[old_key]
+        task = asyncio.create_task(_upload_image_async(key, image))
+        # Ошибка загрузки заранее проявится в запросе, который будет ждать файл
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        _image_uploads[upload_key] = (now, task)
+    return task
+
+async def get_image_file(image: GraphImage, key=None):
+    """
+    Файл изображения в Files API для ключа key. Изображение загружается один
+    раз: запросы по всем критериям проверки ждут одну и ту же загрузку.
+    """
+    key = key or get_key_pool().keys[0]
+    return await asyncio.shield(_image_upload_task(key, image))
+
+def prefetch_image(image: GraphImage) -> None:
+    """Начинает загрузку изображения заранее (первый ключ пула), не дожидаясь запросов с ним"""
+    _image_upload_task(get_key_pool().keys[0], image)
+
+async def _resolve_images(prompt, key):
+    """Заменяет изображения в промпте ссылками на файлы, загруженные от имени ключа"""
+    if isinstance(prompt, str):
+        return prompt
+    return [await get_image_file(part, key) if isinstance(part, GraphImage) else part for part in prompt]
+
+async def _select_model(key, prompt, model_name: str, template):
+    """Модель ключа для запроса и промпт к отправке (без рубрики, если она закэширована)"""
+    model = get_model(model_name, key)
+    prompt = await _resolve_images(prompt, key)
+    # Рубрика - начало текста промпта (в промпте из частей - первой части)
+    text = prompt if isinstance(prompt, str) else prompt[0]
+    if GEMINI_PREFIX_CACHE and template is not None and isinstance(text, str) and text.startswith(template.prefix):
+        prefix_model = await get_prefix_model(template, model_name, key)
+        if prefix_model is not None:
+            rest = text[len(template.prefix):]
+            return prefix_model, rest if isinstance(prompt, str) else [rest, *prompt[1:]]
+    return model, prompt
+
+async def generate_content(prompt, generation_config: dict = None, model_name: str = GEMINI_MODEL, template=None):
+    """
+    Неблокирующий запрос к Gemini через асинхронный API SDK.
+
+    Запрос отправляется с наименее загруженного ключа пула; ответ 429 ставит
+    этот ключ на паузу для модели model_name.
+
+    Args:
+        prompt: Текст промпта (или список частей контента)
+        generation_config: Параметры генерации
+        model_name: Имя модели Gemini
+        template: Шаблон, из которого собран промпт; если его рубрика закэширована,
+                  отправляется только часть промпта после рубрики
+
+    Returns:
+        Ответ модели (объект с атрибутом text)
+    """
+    pool = get_key_pool()
+    key = pool.acquire(model_name)
+    try:
+        model, prompt = await _select_model(key, prompt, model_name, template)
+
+        async with _semaphore:
+            return await model.generate_content_async(
+                prompt,
+                generation_config=generation_config
+            )
+    except ResourceExhausted:
+        pool.mark_rate_limited(key, model_name)
+        raise
+    finally:
+        pool.release(key)
+
+async def stream_content(prompt, generation_config: dict = None, model_name: str = GEMINI_MODEL, template=None):
+    """
+    Потоковый запрос к Gemini: асинхронный генератор фрагментов ответа (объектов
+    с атрибутами text и usage_metadata) по мере их генерации моделью. Ключ и
+    место в семафоре заняты, пока поток не дочитан или не закрыт.
+
+    Аргументы - как у generate_content.
+    """
+    pool = get_key_pool()
+    key = pool.acquire(model_name)
+    try:
+        model, prompt = await _select_model(key, prompt, model_name, template)
+
+        async with _semaphore:
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                stream=True
+            )
+            async for chunk in response:
+                yield chunk
+    except ResourceExhausted:
+        pool.mark_rate_limited(key, model_name)
+        raise
+    finally:
+        pool.release(key)
@@ -0,0 +1,110 @@
+import time
+import logging
+from collections import deque
+from google.generativeai import client as genai_client
+from config import GEMINI_API_KEYS, GEMINI_MODEL, GEMINI_KEY_COOLDOWN_SECONDS
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# За какое время учитываются недавние ответы 429 при расчете паузы ключа
+RECENT_429_WINDOW_SECONDS = 10 * 60
+# Максимальная пауза ключа после серии ответов 429
+MAX_COOLDOWN_SECONDS = 15 * 60
+
+class ApiKeyState:
+    """Ключ Gemini API со своими клиентами SDK и счетчиками нагрузки"""
+
+    def __init__(self, index: int, api_key: str):
+        self.index = index
+        self.api_key = api_key
+        # В логи и статистику попадают только последние символы ключа
+        self.label = f"ключ {index} (...{api_key[-4:]})"
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        # Квоты Gemini у каждой модели свои: ответы 429 и паузы ключа учитываются по моделям
+        self.recent_429 = {}
+        self.cooldown_until = {}
+        # Отдельный менеджер клиентов SDK: запросы этого ключа не зависят от genai.configure
+        self._clients = genai_client._ClientManager()
+        self._clients.configure(api_key=api_key)
+
+    def get_client(self, name: str):
+        """Клиент SDK для этого ключа: "generative_async", "cache" и т.д."""
+        return self._clients.get_default_client(name)
+
+    def is_healthy(self, now: float, model_name: str = GEMINI_MODEL) -> bool:
+        return now >= self.cooldown_until.get(model_name, 0.0)
+
+class GeminiKeyPool:
+    """
+    Пул ключей Gemini API. Каждый запрос получает наименее загруженный ключ
+    без паузы; после ответа 429 ключ уходит на паузу, которая растет с числом
+    недавних 429 по этому ключу. Паузы ставятся отдельно по моделям: 429 от
+    одной модели не мешает отправлять с этого ключа запросы к другой.
+    """
+
+    def __init__(self, api_keys: list = None, cooldown_seconds: float = GEMINI_KEY_COOLDOWN_SECONDS):
+        api_keys = api_keys if api_keys is not None else GEMINI_API_KEYS
+        self.keys = [ApiKeyState(index, api_key) for index, api_key in enumerate(api_keys, 1)]
+        self.cooldown_seconds = cooldown_seconds
+        logger.info(f"Пул ключей Gemini: {len(self.keys)} ключей")
+
+    def acquire(self, model_name: str = GEMINI_MODEL) -> ApiKeyState:
+        """Выбирает ключ для запроса к модели и учитывает запрос в его нагрузке (освободить - release)"""
+        now = time.time()
+        healthy = [key for key in self.keys if key.is_healthy(now, model_name)]
+        if healthy:
+            key = min(healthy, key=lambda key: (key.in_flight, len(key.recent_429.get(model_name, ())), key.requests))
+        else:
+            # Все ключи на паузе - берем тот, чья пауза закончится раньше
+            key = min(self.keys, key=lambda key: key.cooldown_until[model_name])
+        key.in_flight += 1
+        key.requests += 1
+        return key
+
+    def release(self, key: ApiKeyState) -> None:
+        key.in_flight -= 1
+
+    def mark_rate_limited(self, key: ApiKeyState, model_name: str = GEMINI_MODEL) -> None:
+        """Отмечает ответ 429 по ключу и ставит ключ на паузу для этой модели"""
+        now = time.time()
+        key.rate_limited += 1
+        recent_429 = key.recent_429.setdefault(model_name, deque())
+        recent_429.append(now)
+        while recent_429 and recent_429[0] < now - RECENT_429_WINDOW_SECONDS:
+            recent_429.popleft()
+        cooldown = min(self.cooldown_seconds * 2 ** (len(recent_429) - 1), MAX_COOLDOWN_SECONDS)
+        key.cooldown_until[model_name] = max(key.cooldown_until.get(model_name, 0.0), now + cooldown)
+        logger.warning(f"Gemini {key.label}: квота {model_name} исчерпана, пауза {cooldown:.0f} с")
+
+    def has_healthy_key(self, model_name: str = GEMINI_MODEL) -> bool:
+        now = time.time()
+        return any(key.is_healthy(now, model_name) for key in self.keys)
+
+    def stats(self) -> list:
+        """Состояние ключей: нагрузка, число запросов и ответов 429, оставшиеся паузы по моделям"""
+        now = time.time()
+        return [
+            {
+                "key": key.label,
+                "in_flight": key.in_flight,
+                "requests": key.requests,
+                "rate_limited": key.rate_limited,
+                "cooldown": {
+                    model_name: int(until - now) for model_name, until in key.cooldown_until.items() if until > now
+                },
+            }
+            for key in self.keys
+        ]
+
+# Глобальный экземпляр пула ключей
+_key_pool = None
+
+def get_key_pool() -> GeminiKeyPool:
+    """Получает глобальный экземпляр пула ключей Gemini"""
+    global _key_pool
+    if _key_pool is None:
+        _key_pool = GeminiKeyPool()
+    return _key_pool
@@ -1,86 +1,1077 @@
 import re
+import json
 import time
 import logging
-import os
 import asyncio
-import aiofiles
-import google.generativeai as genai
-from requests.exceptions import Timeout, ConnectionError
-from config import GEMINI_API_KEY
+from google.generativeai import protos
+from services.llm_backend import get_backend, candidate_text, output_token_count
+from services.graph_image import graph_image, graph_fingerprint, prompt_text, prompt_images, IMAGE_TOKENS
+from services.gemini_keys import get_key_pool
+from services.prompt_registry import get_prompt_registry, TASK_PROMPTS
+from services.result_cache import get_result_cache, make_cache_key
+from services.similarity_index import get_near_duplicate_index, solution_fingerprint, task_variant
+from services.submission_history import get_submission_history, format_regrade_notice
+from services.metrics import get_metrics
+from services.rate_limiter import get_rate_limiter
+from services.grading_progress import GradingProgress
+from services.model_cascade import escalation_reason, get_cascade_stats, ESCALATION_REASONS, MAX_SCORES
+from services.token_budget import get_token_budgets
+from services.degraded_mode import get_degraded_mode, NORMAL, SINGLE_CALL, BRIEF, LEVEL_NAMES
+from services.shadow_evaluation import get_shadow_evaluator
+from services.resilience import (
+    get_circuit_breaker, get_latency_tracker, classify_gemini_error, CircuitOpenError, RetryBudget,
+    RETRYABLE, FATAL, QUOTA
+)
+from utils.score_extraction import extract_score
+from utils.text_utils import truncate_words, estimate_tokens
+from config import (
+    GEMINI_MODEL, GEMINI_PARALLEL_CRITERIA, GEMINI_SINGLE_CALL_TASKS, GEMINI_SINGLE_CALL_TIERS,
+    GEMINI_REQUEST_TIMEOUT, GEMINI_HEDGE_PERCENTILE, GEMINI_STREAMING, GEMINI_SHORT_CIRCUIT_K1,
+    GEMINI_MAX_OUTPUT_TOKENS, NEAR_DUPLICATE_MODE, INCREMENTAL_REGRADE,
+    GEMINI_CASCADE, GEMINI_FAST_MODEL, GEMINI_CASCADE_FAST_TIMEOUT, DEGRADED_MAX_OUTPUT_TOKENS
+)
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Конфигурация Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
+# Параметры повторных попыток запроса к Gemini
+MAX_RETRIES = 3
+RETRY_DELAY = 5  # секунд
 
-async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
-    """Проверка задания через Gemini API"""
+# Разбор критерия, который не проверялся из-за нуля баллов по первому критерию
+SKIPPED_CRITERION_RESPONSE = "Критерий не проверялся: по первому критерию выставлено 0 баллов."
+
+# Параметры генерации при проверке работ
+GENERATION_CONFIG = {
+    "temperature": 0.4,
+    "top_p": 0.95,
+    "top_k": 0,
+    "max_output_tokens": GEMINI_MAX_OUTPUT_TOKENS,
+}
+
+# Сколько слов решения проверяется (остальное обрезается)
+MAX_SOLUTION_WORDS = {"37": 154, "38": 275}
+
+# Запас к адаптивному лимиту токенов ответа с кратким разбором, чтобы размышления модели не обрезали JSON
+BRIEF_OUTPUT_MARGIN = 1024
+
+def is_main_model(model_name: str = None) -> bool:
+    """Идет ли запрос к основной модели GEMINI_MODEL (по ее задержкам настроено дублирование запросов)"""
+    return model_name in (None, GEMINI_MODEL)
+
+async def generate_hedged(prompt: str, generation_config: dict, label: str, template=None, tokens: int = 0,
+                          model_name: str = None, timeout: float = None):
+    """
+    Запрос к Gemini с жестким таймаутом и дублированием медленных запросов.
+
+    Если ответа нет дольше перцентиля задержки GEMINI_HEDGE_PERCENTILE, отправляется
+    такой же запрос (если квота RPM/TPM есть прямо сейчас); используется ответ,
+    пришедший первым, второй запрос отменяется. Запросы не к основной модели
+    (model_name) не дублируются и не учитываются в задержках основной модели.
+
+    Raises:
+        TimeoutError: если ни один запрос не ответил за timeout секунд
+                      (по умолчанию - GEMINI_REQUEST_TIMEOUT)
+    """
+    timeout = timeout or GEMINI_REQUEST_TIMEOUT
+    tracker = get_latency_tracker()
+    main_model = is_main_model(model_name)
+    start = time.monotonic()
+    hedge_at = tracker.hedge_delay() if GEMINI_HEDGE_PERCENTILE and main_model else None
+
+    def send():
+        return asyncio.create_task(get_backend().generate_content(
+            prompt, generation_config=generation_config, template=template, model_name=model_name
+        ))
+
+    first = send()
+    pending = {first}
+    # Время отправки каждого из запросов (основного и дублирующего)
+    started_at = {first: start}
+    error = None
+    try:
+        async with asyncio.timeout(timeout):
+            while pending:
+                wait_for = None if hedge_at is None else max(hedge_at - (time.monotonic() - start), 0)
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Ответа нет дольше обычного - дублируем запрос
+                    hedge_at = None
+                    if get_rate_limiter(model_name).try_acquire(tokens):
+                        logger.info(f"Нет ответа от Gemini ({label}) за {time.monotonic() - start:.1f} с, отправляем дублирующий запрос")
+                        get_metrics().increment("gemini_hedged_requests")
+                        task = send()
+                        started_at[task] = time.monotonic()
+                        pending.add(task)
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if main_model:
+                            tracker.record(time.monotonic() - started_at[task])
+                        if len(started_at) > 1:
+                            get_metrics().increment("gemini_hedge_wins" if started_at[task] > start else "gemini_hedge_losses")
+                        return task.result()
+                    error = task.exception()
+            raise error
+    except TimeoutError:
+        get_metrics().increment("gemini_timeouts")
+        raise TimeoutError(f"нет ответа от Gemini за {timeout:.0f} с")
+    finally:
+        # Более медленный запрос больше не нужен
+        for task in pending:
+            task.cancel()
+
+async def _first_chunk(stream) -> tuple:
+    """
+    Ждет первый фрагмент потока с текстом.
+
+    Returns:
+        tuple: (chunk, text) - фрагмент и его текст; если поток закончился без
+               текста - последний фрагмент (None, если фрагментов не было) и ""
+    """
+    chunk = None
+    async for chunk in stream:
+        text = candidate_text(chunk)
+        if text:
+            return chunk, text
+    return chunk, ""
+
+async def generate_streamed(prompt: str, generation_config: dict, label: str, on_text, template=None,
+                            model_name: str = None, timeout: float = None, tokens: int = 0) -> tuple:
+    """
+    Потоковый запрос к Gemini с жестким таймаутом: on_text вызывается с уже
+    полученным текстом ответа после каждого фрагмента с текстом.
+
+    Медленные запросы дублируются по времени до первого фрагмента: если за
+    перцентиль задержки GEMINI_HEDGE_PERCENTILE не пришел даже первый фрагмент,
+    открывается второй такой же поток (если квота RPM/TPM есть прямо сейчас).
+    Дочитывается поток, первым начавший отвечать, второй закрывается.
+    Фрагменты без текста (только с метаданными) пропускаются.
+
+    Returns:
+        tuple: (text, last_chunk) - полный текст ответа и последний фрагмент
+               (в нем причина завершения и число токенов всего ответа)
+
+    Raises:
+        TimeoutError: если ответ не получен полностью за timeout секунд
+                      (по умолчанию - GEMINI_REQUEST_TIMEOUT)
+    """
+    timeout = timeout or GEMINI_REQUEST_TIMEOUT
+    tracker = get_latency_tracker()
+    main_model = is_main_model(model_name)
+    start = time.monotonic()
+    hedge_at = tracker.hedge_delay() if GEMINI_HEDGE_PERCENTILE and main_model else None
+    # Задача первого фрагмента -> (поток, время открытия)
+    streams = {}
+
+    def open_stream():
+        stream = get_backend().stream_content(prompt, generation_config=generation_config, template=template, model_name=model_name)
+        task = asyncio.create_task(_first_chunk(stream))
+        streams[task] = (stream, time.monotonic())
+        return task
+
+    pending = {open_stream()}
+    text = ""
+    chunk = None
+    try:
+        async with asyncio.timeout(timeout):
+            winner = None
+            error = None
+            while winner is None:
+                if not pending:
+                    raise error
+                wait_for = None if hedge_at is None else max(hedge_at - (time.monotonic() - start), 0)
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Поток молчит дольше обычного - открываем дублирующий
+                    hedge_at = None
+                    if get_rate_limiter(model_name).try_acquire(tokens):
+                        logger.info(f"Нет первого фрагмента от Gemini ({label}) за {time.monotonic() - start:.1f} с, открываем дублирующий поток")
+                        get_metrics().increment("gemini_hedged_requests")
+                        pending.add(open_stream())
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+
+            first_chunk_at = time.monotonic()
+            if len(streams) > 1:
+                get_metrics().increment("gemini_hedge_wins" if streams[winner][1] > start else "gemini_hedge_losses")
+            # Второй поток больше не нужен
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            pending = set()
+
+            chunk, text = winner.result()
+            if text:
+                await on_text(text)
+                async for chunk in streams[winner][0]:
+                    chunk_text = candidate_text(chunk)
+                    if not chunk_text:
+                        continue
+                    text += chunk_text
+                    await on_text(text)
+    except TimeoutError:
+        get_metrics().increment("gemini_timeouts")
+        raise TimeoutError(f"нет полного ответа от Gemini за {timeout:.0f} с")
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for stream, _ in streams.values():
+            await stream.aclose()
+
+    total = time.monotonic() - start
+    if main_model:
+        tracker.record(time.monotonic() - streams[winner][1])
+    first_chunk = first_chunk_at - start
+    metrics = get_metrics()
+    metrics.increment("gemini_streamed_requests")
+    metrics.increment("gemini_first_chunk_seconds", round(first_chunk, 3))
+    logger.info(f"Потоковый ответ Gemini ({label}): первый фрагмент через {first_chunk:.2f} с, полный ответ через {total:.2f} с")
+    return text, chunk
+
+def response_usage(response, response_text: str) -> tuple:
+    """
+    Длина ответа Gemini в токенах (вместе с размышлениями) и признак обрезки
+    лимитом max_output_tokens.
+
+    Returns:
+        tuple: (output_tokens, truncated); если Gemini не вернул usage_metadata,
+               длина оценивается по тексту
+    """
+    output_tokens = output_token_count(response) or estimate_tokens(response_text)
+    candidates = getattr(response, "candidates", None)
+    truncated = bool(candidates) and candidates[0].finish_reason == protos.Candidate.FinishReason.MAX_TOKENS
+    return output_tokens, truncated
+
+def check_response_text(response, response_text: str) -> None:
+    """
+    Проверяет, что в ответе Gemini есть текст.
+
+    Raises:
+        ValueError: если текста нет - промпт заблокирован, ответ остановлен
+                    фильтром или лимит токенов ушел на размышления (повтор не поможет)
+    """
+    if response_text.strip():
+        return
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        feedback = getattr(response, "prompt_feedback", None)
+        raise ValueError(f"Gemini не вернул ни одного варианта ответа{f': {feedback}' if feedback else ''}")
+    reason = candidates[0].finish_reason
+    raise ValueError(f"пустой ответ Gemini (причина завершения: {getattr(reason, 'name', reason)})")
+
+async def request_gemini(prompt: str, generation_config: dict, label: str, status_callback=None, status_suffix: str = "",
+                         template=None, retry_budget: RetryBudget = None, on_text=None,
+                         model_name: str = None, timeout: float = None,
+                         attempts: int = MAX_RETRIES) -> str:
+    """
+    Отправляет запрос к Gemini с механизмом повторных попыток.
+
+    Каждая попытка ограничена таймаутом, медленные запросы дублируются
+    (generate_hedged). Для промптов из шаблонов max_output_tokens снижается
+    до адаптивного лимита (TokenBudgets); ответ, обрезанный этим лимитом,
+    запрашивается еще раз с исходным лимитом. Если предохранитель модели открыт, запрос сразу
+    завершается CircuitOpenError без повторных попыток. Квоты, очередь, предохранитель,
+    паузы ключей и адаптивные лимиты у каждой модели свои. Ошибки, которые повтор
+    не исправит (блокировка, пустой ответ, неверный запрос), не повторяются;
+    повторы временных сбоев и 429 берутся из общего бюджета проверки.
+
+    Args:
+        prompt: Текст промпта
+        generation_config: Параметры генерации
+        label: Описание запроса для логов (например, "промпт 2 для задания 38")
+        status_callback: Функция для обновления статуса проверки (повторные попытки, место в очереди)
+        status_suffix: Суффикс статусного сообщения о повторной попытке
+        template: Шаблон, из которого собран промпт (для кэширования рубрики)
+        retry_budget: Бюджет повторных попыток проверки (по умолчанию - отдельный на запрос)
+        on_text: Обработчик частичного ответа; если задан и включен GEMINI_STREAMING,
+                 ответ получается потоком (generate_streamed)
+        model_name: Модель для запроса (по умолчанию - основная модель GEMINI_MODEL)
+        timeout: Таймаут одной попытки, секунд (по умолчанию - GEMINI_REQUEST_TIMEOUT)
+        attempts: Сколько попыток сделать (1 - без повторов)
+
+    Returns:
+        str: Текст ответа модели
+    """
+    logger.info(f"Отправка запроса к Gemini ({label})")
+    if retry_budget is None:
+        retry_budget = RetryBudget(MAX_RETRIES - 1)
+    start_time = time.time()
+    limiter = get_rate_limiter(model_name)
+    breaker = get_circuit_breaker(model_name)
+    metrics = get_metrics()
+    tokens = estimate_tokens(prompt_text(prompt)) + IMAGE_TOKENS * len(prompt_images(prompt))
+
+    budgets = get_token_budgets()
+    ceiling = generation_config.get("max_output_tokens", GEMINI_MAX_OUTPUT_TOKENS)
+    budget_key = None
+    if template is not None:
+        # Длина ответов разных моделей на один промпт различается - лимиты считаются отдельно
+        budget_key = template.name if is_main_model(model_name) else f"{template.name}@{model_name}"
+    budget = budgets.budget(budget_key, ceiling) if budget_key else ceiling
+    budgeted_config = dict(generation_config, max_output_tokens=budget) if budget < ceiling else generation_config
+
+    async def send(config: dict) -> tuple:
+        if on_text is not None and GEMINI_STREAMING:
+            response_text, response = await generate_streamed(prompt, config, label, on_text, template, model_name, timeout, tokens)
+        else:
+            response = await generate_hedged(prompt, config, label, template, tokens, model_name, timeout)
+            # response.text бросает ValueError, если частей нет - и тогда обрезанный ответ не повторился бы
+            response_text = candidate_text(response)
+        return response_text, response
+
+    for attempt in range(attempts):
+        try:
+            breaker.check()
+        except CircuitOpenError:
+            metrics.increment("gemini_circuit_rejections")
+            logger.warning(f"Запрос к Gemini ({label}) не отправлен: предохранитель открыт")
+            raise
+
+        attempt_start = time.time()
+        try:
+            # Обновляем статус при повторной попытке
+            if attempt > 0 and status_callback:
+                await status_callback(f"🔄 Повторная попытка {attempt}/{attempts}...{status_suffix}")
+
+            # Ждем квоту RPM/TPM в общей очереди вместо того, чтобы получить 429
+            waited = await limiter.acquire(tokens, status_callback)
+            if waited > 0.1:
+                metrics.increment("rate_limiter_waits")
+                metrics.increment("rate_limiter_wait_seconds", round(waited, 3))
+
+            response_text, response = await send(budgeted_config)
+            output_tokens, truncated = response_usage(response, response_text)
+            if truncated and budgeted_config is not generation_config:
+                # Ответ длиннее адаптивного лимита - повторяем с исходным
+                budgets.record_truncation(budget_key)
+                metrics.increment("token_budget_truncations", prompt=budget_key)
+                logger.warning(f"Ответ Gemini ({label}) обрезан лимитом {budget} токенов, повторяем с лимитом {ceiling}")
+                await limiter.acquire(tokens, status_callback)
+                response_text, response = await send(generation_config)
+                output_tokens, truncated = response_usage(response, response_text)
+            check_response_text(response, response_text)
+            breaker.record_success()
+            if template is not None:
+                budgets.record(budget_key, output_tokens, time.time() - attempt_start)
+
+            elapsed_time = time.time() - start_time
+            logger.info(f"Получен ответ от Gemini ({label}), время выполнения: {elapsed_time:.2f} секунд")
+            logger.info(f"Начало ответа: {response_text[:100]}...")
+            return response_text
+
+        except asyncio.CancelledError:
+            # Ответ уже не нужен: проверку отменил пользователь или критерий не нужен после 0 баллов по К1
+            breaker.record_neutral()
+            metrics.increment("gemini_requests_cancelled")
+            raise
+        except Exception as e:
+            kind = classify_gemini_error(e)
+            metrics.increment("gemini_errors", kind=kind, error=type(e).__name__)
+            # На предохранитель влияют только сбои самого Gemini
+            if kind == RETRYABLE:
+                breaker.record_failure()
+            else:
+                breaker.record_neutral()
+
+            if kind == FATAL:
+                logger.error(f"Ошибка запроса к Gemini ({label}), повтор не поможет: {type(e).__name__}: {e}")
+                raise
+            if kind == QUOTA:
+                metrics.increment("gemini_rate_limited")
+                logger.warning(f"Квота Gemini исчерпана ({label}), попытка {attempt+1}/{attempts}: {e}")
+            else:
+                logger.error(f"Ошибка при обработке запроса ({label}), попытка {attempt+1}/{attempts}: {type(e).__name__}: {e}")
+
+            if attempt == attempts - 1:
+                logger.error(f"Не удалось получить ответ от Gemini после {attempts} попыток: {str(e)}")
+                raise
+            if not retry_budget.take():
+                metrics.increment("gemini_retry_budget_exhausted")
+                logger.error(f"Бюджет повторных попыток проверки исчерпан ({retry_budget.retries}), запрос ({label}) не повторяем")
+                raise
+
+            if kind == QUOTA:
+                # Ключ, получивший 429, уже на паузе, и повтор уйдет на другой ключ пула;
+                # если пауза у всех ключей, повтор дождется квоты в общей очереди
+                delay = 0
+                if not get_key_pool().has_healthy_key(model_name or GEMINI_MODEL):
+                    limiter.pause(RETRY_DELAY * (attempt + 1))
+            else:
+                delay = RETRY_DELAY * (attempt + 1)
+                logger.warning(f"Повторная попытка {attempt+1}/{attempts} через {delay} секунд...")
+                await asyncio.sleep(delay)
+
+            # Во что обошлась неудачная попытка: время самой попытки и пауза перед повтором
+            cost = time.time() - attempt_start
+            retry_budget.cost_seconds += cost
+            metrics.increment("gemini_retries", kind=kind)
+            metrics.increment("gemini_retry_cost_seconds", round(cost, 3))
+
+async def request_cascade(prompt: str, generation_config: dict, label: str, task_number: str, i: int,
+                          status_callback=None, status_suffix: str = "", template=None,
+                          retry_budget: RetryBudget = None, on_text=None, on_escalate=None) -> str:
+    """
+    Запрос по критерию i через каскад моделей: сначала быстрая модель
+    GEMINI_FAST_MODEL (одна попытка с коротким таймаутом), и только если ее
+    ответ не годится (балл не найден, балл на границе, ответ испорчен или
+    запрос не удался) - основная модель GEMINI_MODEL с обычными повторами.
+
+    Аргументы - как у request_gemini; on_escalate вызывается перед запросом
+    к основной модели (например, чтобы сбросить предварительный балл в статусе).
+
+    Returns:
+        str: Текст принятого ответа
+    """
+    stats = get_cascade_stats()
+    start = time.monotonic()
+    try:
+        response_text = await request_gemini(
+            prompt, generation_config, f"{label}, {GEMINI_FAST_MODEL}", status_callback=status_callback,
+            template=template, on_text=on_text, model_name=GEMINI_FAST_MODEL,
+            timeout=GEMINI_CASCADE_FAST_TIMEOUT, attempts=1
+        )
+        reason = escalation_reason(task_number, i, response_text)
+    except Exception as e:
+        # В том числе CircuitOpenError: предохранитель быстрой модели не закрывает путь к основной
+        logger.warning(f"Быстрая модель не ответила ({label}): {type(e).__name__}: {e}")
+        reason = "error"
+    stats.record("fast", time.monotonic() - start, reason)
+    if reason is None:
+        return response_text
+
+    logger.info(f"Ответ {GEMINI_FAST_MODEL} ({label}) не принят: {ESCALATION_REASONS[reason]}, "
+                f"перепроверяем моделью {GEMINI_MODEL}")
+    if on_escalate:
+        await on_escalate()
+    start = time.monotonic()
+    response_text = await request_gemini(
+        prompt, generation_config, label, status_callback=status_callback, status_suffix=status_suffix,
+        template=template, retry_budget=retry_budget, on_text=on_text
+    )
+    stats.record("strong", time.monotonic() - start)
+    return response_text
+
+def log_retry_cost(task_number: str, retry_budget: RetryBudget) -> None:
+    """Пишет в лог, сколько повторных попыток и времени ушло на проверку задания"""
+    if retry_budget.used:
+        logger.info(f"Проверка задания {task_number}: повторных попыток {retry_budget.used}/{retry_budget.retries}, "
+                    f"потеряно на повторы {retry_budget.cost_seconds:.1f} с")
+
+def extract_criterion_score(task_number: str, i: int, response_text: str) -> int:
+    """
+    Извлекает оценку по критерию i из ответа Gemini по шаблонам промпта этого критерия.
+
+    Если оценку найти не удалось, выставляет 1 и учитывает сбой в счетчике
+    score_extraction_failures.
+    """
+    prompt_name = TASK_PROMPTS[task_number][i-1]
+    score, pattern_name = extract_score(prompt_name, response_text)
+    metrics = get_metrics()
+    if score is None:
+        metrics.increment("score_extraction_failures", prompt=prompt_name)
+        logger.warning(f"Не удалось найти оценку в ответе на {prompt_name} (критерий {i} задания {task_number}). Конец ответа: ...{response_text[-200:]}")
+        logger.warning("Устанавливаем значение по умолчанию: 1")
+        return 1  # Значение по умолчанию
+
+    metrics.increment("score_extraction_matches", prompt=prompt_name, pattern=pattern_name)
+    logger.info(f"Найдена оценка по критерию {i} задания {task_number}: {score} (шаблон «{pattern_name}»)")
+    return score
+
+def extract_score_37(i: int, response_text: str) -> int:
+    """Извлекает оценку по критерию i (1-3) из ответа Gemini для задания 37"""
+    return extract_criterion_score("37", i, response_text)
+
+def extract_score_38(i: int, response_text: str) -> int:
+    """Извлекает оценку по критерию i (1-5) из ответа Gemini для задания 38"""
+    return extract_criterion_score("38", i, response_text)
+
+async def grade_criteria(prompts: list, extract_score, generation_config: dict, task_number: str,
+                         status_callback=None, parallel: bool = None, templates: list = None,
+                         retry_budget: RetryBudget = None, short_circuit: bool = None, reuse: dict = None,
+                         cascade: bool = None) -> tuple:
+    """
+    Проверяет работу по всем критериям: по одному запросу к Gemini на критерий.
+
+    В параллельном режиме все запросы отправляются одновременно, и проверка
+    длится примерно столько же, сколько самый медленный критерий. Ошибка по
+    одному критерию не отменяет остальные.
+
+    Если по первому критерию выставлено 0 баллов, вся работа оценивается в 0,
+    поэтому остальные критерии не нужны: в последовательном режиме их запросы
+    не отправляются, в параллельном - отменяются.
+
+    Args:
+        prompts: Список готовых промптов, по одному на критерий (в порядке критериев)
+        extract_score: Функция (номер критерия, текст ответа) -> балл
+        generation_config: Параметры генерации
+        task_number: Номер задания (для логов)
+        status_callback: Функция для обновления статуса проверки
+        parallel: Отправлять ли запросы по всем критериям одновременно
+                  (по умолчанию - настройка GEMINI_PARALLEL_CRITERIA)
+        templates: Шаблоны, из которых собраны промпты (для кэширования рубрик)
+        retry_budget: Бюджет повторных попыток проверки, общий для всех критериев
+        short_circuit: Прекращать ли проверку при 0 баллов по первому критерию
+                       (по умолчанию - настройка GEMINI_SHORT_CIRCUIT_K1)
+        reuse: Готовые результаты прошлой проверки {номер критерия: (балл, разбор)} -
+               по этим критериям запросы не отправляются
+        cascade: Проверять ли сначала быстрой моделью (request_cascade)
+                 (по умолчанию - настройка GEMINI_CASCADE)
+
+    Returns:
+        tuple: (scores, responses, failed) - баллы и ответы в порядке критериев
+               и список номеров критериев (с 1), которые не удалось проверить;
+               у пропущенных критериев 0 баллов и SKIPPED_CRITERION_RESPONSE
+    """
+    if parallel is None:
+        parallel = GEMINI_PARALLEL_CRITERIA
+    if short_circuit is None:
+        short_circuit = GEMINI_SHORT_CIRCUIT_K1
+    if cascade is None:
+        cascade = GEMINI_CASCADE
+
+    total = len(prompts)
+    templates = templates or [None] * total
+    reuse = reuse or {}
+    scores = [0] * total
+    responses = [""] * total
+    failed = []
+    # Результаты запросов по номерам критериев
+    results = {}
+    # Критерии, пропущенные из-за 0 баллов по первому критерию, и уже извлеченные баллы
+    skipped = []
+    known_scores = {}
+    # При потоковых ответах статус показывает прогресс и предварительные баллы по каждому критерию
+    progress = GradingProgress(task_number, total, status_callback) if status_callback and GEMINI_STREAMING else None
+    if progress:
+        for i, (score, _) in reuse.items():
+            progress.reuse(i, score)
+    pending = [i for i in range(1, total + 1) if i not in reuse]
+
+    async def request_criterion(i: int, status_suffix: str = "") -> str:
+        label = f"промпт {i} для задания {task_number}"
+        on_text = progress.criterion_callback(i) if progress else None
+        start = time.monotonic()
+        if cascade:
+            response_text = await request_cascade(
+                prompts[i-1], generation_config, label, task_number, i,
+                status_callback=status_callback, status_suffix=status_suffix, template=templates[i-1],
+                retry_budget=retry_budget, on_text=on_text,
+                on_escalate=(lambda: progress.escalate(i)) if progress else None
+            )
+        else:
+            response_text = await request_gemini(
+                prompts[i-1], generation_config, label,
+                status_callback=status_callback, status_suffix=status_suffix, template=templates[i-1],
+                retry_budget=retry_budget, on_text=on_text
+            )
+        # Задержка критерия (с очередью и повторами) - один из сигналов нагрузки для упрощенного режима
+        get_degraded_mode().record_latency(time.monotonic() - start)
+        return response_text
+
+    if parallel:
+        logger.info(f"Параллельная проверка задания {task_number}: {len(pending)} критериев одновременно")
+        if status_callback:
+            await status_callback(f"🤖 Отправляю запросы к AI по {len(pending)} критериям...")
+
+        done = len(reuse)
+
+        async def run_criterion(i: int) -> str:
+            nonlocal done
+            response_text = await request_criterion(i)
+            done += 1
+            if progress:
+                await progress.finish(i, response_text)
+            elif status_callback:
+                await status_callback(f"🔍 Анализирую твою работу... Готово {done}/{total} ({done * 100 // total}%)")
+            return response_text
+
+        tasks = {i: asyncio.create_task(run_criterion(i)) for i in pending}
+        try:
+            if short_circuit and total > 1 and 1 in tasks:
+                first = (await asyncio.gather(tasks[1], return_exceptions=True))[0]
+                if not isinstance(first, BaseException):
+                    known_scores[1] = extract_score(1, first)
+                    if known_scores[1] == 0:
+                        # Ответы, пришедшие раньше первого критерия, уже оплачены - их оставляем
+                        skipped = [i for i, task in tasks.items() if i > 1 and not task.done()]
+                        for i in skipped:
+                            tasks[i].cancel()
+            results = dict(zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)))
+        finally:
+            # Если отменена сама проверка, запросы по критериям тоже не нужны
+            for task in tasks.values():
+                task.cancel()
+    else:
+        logger.info(f"Последовательная проверка задания {task_number}: {len(pending)} критериев")
+        for i in pending:
+            percent = i * 100 // total
+            # Обновляем статус
+            if status_callback:
+                await status_callback(f"🤖 Отправляю запрос к AI... Шаг {i}/{total} ({percent}%)")
+            try:
+                results[i] = await request_criterion(i, f" Шаг {i}/{total} ({percent}%)")
+            except asyncio.CancelledError:
+                # Запросы по следующим критериям уже не будут отправлены
+                unsent = [j for j in pending if j > i]
+                if unsent:
+                    get_metrics().increment("criteria_requests_saved", len(unsent), mode="cancelled")
+                raise
+            except Exception as e:
+                results[i] = e
+            # Обновляем статус после получения ответа
+            if progress and not isinstance(results[i], BaseException):
+                await progress.finish(i, results[i])
+            elif status_callback:
+                await status_callback(f"📊 Анализирую ответ... Шаг {i}/{total} ({percent}%)")
+
+            if short_circuit and i == 1 and total > 1 and not isinstance(results[1], BaseException):
+                known_scores[1] = extract_score(1, results[1])
+                if known_scores[1] == 0:
+                    skipped = [j for j in pending if j > 1]
+                    break
+
+    if skipped:
+        metrics = get_metrics()
+        metrics.increment("criteria_short_circuits", mode="parallel" if parallel else "sequential")
+        metrics.increment("criteria_requests_saved", len(skipped), mode="parallel" if parallel else "sequential")
+        logger.info(f"По первому критерию задания {task_number} 0 баллов: критерии {skipped} не проверяются "
+                    f"({'запросы отменены' if parallel else 'запросы не отправлялись'})")
+        if progress:
+            for i in skipped:
+                progress.skip(i)
+            await progress.update(force=True)
+
+    for i in range(1, total + 1):
+        if i in reuse:
+            scores[i-1], responses[i-1] = reuse[i]
+            continue
+        if i in skipped:
+            responses[i-1] = SKIPPED_CRITERION_RESPONSE
+            continue
+        result = results[i]
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, BaseException):
+            logger.error(f"Критерий {i} задания {task_number} не проверен: {result}")
+            failed.append(i)
+            continue
+        responses[i-1] = result
+        scores[i-1] = known_scores[i] if i in known_scores else extract_score(i, result)
+
+    if progress:
+        progress.log_summary()
+
+    # Если не удалось проверить ни один критерий, считаем проверку неудачной
+    if failed and len(failed) == len(pending):
+        raise results[failed[-1]]
+
+    return scores, responses, failed
+
+def use_single_call(task_number: str, user_tier: str = None, level: int = NORMAL) -> bool:
+    """
+    Проверять ли все критерии задания одним запросом для пользователя данного
+    уровня (free/premium); под нагрузкой (level не ниже SINGLE_CALL) - всегда.
+    """
+    if level >= SINGLE_CALL:
+        return True
+    return task_number in GEMINI_SINGLE_CALL_TASKS and (user_tier or "free") in GEMINI_SINGLE_CALL_TIERS
+
+def format_degraded_notice(level: int) -> str:
+    """Уведомление о проверке в упрощенном режиме (пустое при обычной проверке)"""
+    if level == NORMAL:
+        return ""
+    detail = "все критерии одним запросом, с кратким разбором" if level >= BRIEF else "все критерии одним запросом"
+    return (
+        f"⚡ Сейчас много проверок, поэтому работа проверена в упрощенном режиме ({detail}). "
+        f"Позже её можно отправить ещё раз для обычной проверки.\n\n"
+    )
+
+def single_call_schema(total: int) -> dict:
+    """Схема JSON-ответа при проверке одним запросом: {k1..kN, comment_k1..comment_kN}"""
+    properties = {}
+    for i in range(1, total + 1):
+        properties[f"k{i}"] = {"type": "integer"}
+        properties[f"comment_k{i}"] = {"type": "string"}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+class SingleCallFormatError(ValueError):
+    """Ответ проверки одним запросом не соответствует ожидаемому JSON"""
+
+async def grade_single_call(template, values: dict, total: int, generation_config: dict, task_number: str,
+                            status_callback=None, retry_budget: RetryBudget = None, image=None) -> tuple:
+    """
+    Проверяет работу по всем критериям одним запросом к Gemini с ответом в JSON.
+
+    Args:
+        template: Шаблон проверки одним запросом (PromptRegistry.get_single_call_template)
+        values: Значения слотов шаблона
+        total: Число критериев
+        generation_config: Параметры генерации
+        task_number: Номер задания (для логов)
+        status_callback: Функция для обновления статуса проверки
+        retry_budget: Бюджет повторных попыток проверки
+        image: Изображение графика, прикладываемое к промпту (GraphImage)
+
+    Returns:
+        tuple: (scores, responses, failed) - как у grade_criteria
+
+    Raises:
+        SingleCallFormatError: если ответ не удалось разобрать, в нем нет ни одной оценки
+                               или оценка выходит за пределы баллов критерия
+    """
+    prompt = template.render(**values)
+    logger.info(f"Промпт проверки задания {task_number} одним запросом подготовлен (версия {template.version}), длина: {len(prompt)} символов")
+    if image is not None:
+        prompt = [prompt, image]
+
+    if status_callback:
+        await status_callback(f"🤖 Отправляю запрос к AI по всем {total} критериям сразу...")
+
+    json_config = dict(generation_config, response_mime_type="application/json", response_schema=single_call_schema(total))
+    progress = GradingProgress(task_number, total, status_callback) if status_callback and GEMINI_STREAMING else None
+    start = time.monotonic()
+    response_text = await request_gemini(
+        prompt, json_config, f"все критерии задания {task_number}",
+        status_callback=status_callback, template=template, retry_budget=retry_budget,
+        on_text=progress.single_call_callback if progress else None
+    )
+    get_degraded_mode().record_latency(time.monotonic() - start, single_call=True)
+    if progress:
+        progress.log_summary()
+
+    if status_callback:
+        await status_callback("📊 Анализирую ответ...")
+
+    try:
+        data = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        raise SingleCallFormatError(f"ответ не является JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise SingleCallFormatError(f"ожидался JSON-объект, получено: {type(data).__name__}")
+
+    scores = [0] * total
+    responses = [""] * total
+    failed = []
+    for i in range(1, total + 1):
+        score = data.get(f"k{i}")
+        comment = data.get(f"comment_k{i}")
+        if not isinstance(score, int) or isinstance(score, bool) or not isinstance(comment, str) or not comment.strip():
+            logger.error(f"В ответе нет оценки или комментария по критерию {i} задания {task_number}")
+            get_metrics().increment("score_extraction_failures", prompt=template.name)
+            failed.append(i)
+            continue
+        # Балл вне шкалы критерия означает, что модель перепутала критерии или рубрику: ответу целиком нельзя доверять
+        max_score = MAX_SCORES.get(TASK_PROMPTS[task_number][i-1])
+        if score < 0 or (max_score is not None and score > max_score):
+            raise SingleCallFormatError(f"балл {score} по критерию {i} вне допустимого диапазона 0-{max_score}")
+        logger.info(f"Оценка по критерию {i} из JSON-ответа: {score}")
+        scores[i-1] = score
+        responses[i-1] = comment
+
+    if len(failed) == total:
+        raise SingleCallFormatError("в ответе нет оценок ни по одному критерию")
+
+    return scores, responses, failed
+
+async def grade_task_criteria(task_number: str, templates: list, values: dict, extract_score, generation_config: dict,
+                              status_callback=None, single_call: bool = False, retry_budget: RetryBudget = None,
+                              reuse: dict = None, image=None, level: int = NORMAL) -> tuple:
+    """
+    Проверяет работу по всем критериям задания: одним запросом с ответом в JSON
+    (на уровне BRIEF - с кратким разбором) или по запросу на критерий. Если ответ
+    одного запроса не удалось разобрать, работа проверяется по критериям, а под
+    нагрузкой (level выше NORMAL) - повторяется тот же запрос, пока есть бюджет
+    повторов: запросы по каждому критерию только добавили бы нагрузки. Если часть
+    критериев взята из прошлой проверки (reuse), остальные проверяются по
+    критериям; под нагрузкой прошлая проверка не используется, и вся работа
+    проверяется одним запросом. Изображение графика (image) прикладывается после текста каждого
+    промпта, чтобы рубрика оставалась общим префиксом запросов.
+
+    Returns:
+        tuple: (scores, responses, failed) - как у grade_criteria
+
+    Raises:
+        SingleCallFormatError: если под нагрузкой ответ не удалось разобрать и бюджет повторов исчерпан
+    """
+    if single_call and reuse and level > NORMAL:
+        logger.info(f"Под нагрузкой задание {task_number} проверяется одним запросом целиком, без результатов прошлой проверки")
+        reuse = None
+    if single_call and reuse:
+        logger.info(f"Критерии {sorted(reuse)} задания {task_number} взяты из прошлой проверки, остальные проверяются по критериям")
+    elif single_call:
+        brief = level >= BRIEF
+        template = get_prompt_registry().get_single_call_template(task_number, brief)
+        if brief:
+            generation_config = dict(generation_config, max_output_tokens=brief_output_limit(template))
+        while True:
+            try:
+                return await grade_single_call(template, values, len(templates), generation_config, task_number,
+                                               status_callback, retry_budget=retry_budget, image=image)
+            except SingleCallFormatError as e:
+                if level == NORMAL:
+                    logger.warning(f"Не удалось разобрать ответ проверки задания {task_number} одним запросом: {e}. Проверяем по критериям")
+                    break
+                get_metrics().increment("single_call_format_errors", mode=LEVEL_NAMES[level])
+                if retry_budget is None or not retry_budget.take():
+                    logger.error(f"Не удалось разобрать ответ проверки задания {task_number} одним запросом: {e}. Бюджет повторов исчерпан")
+                    raise
+                logger.warning(f"Не удалось разобрать ответ проверки задания {task_number} одним запросом: {e}. Повторяем запрос")
+
+    prompts = []
+    for i, template in enumerate(templates, 1):
+        # Подставляем данные пользователя в промпт
+        prompt = template.render(**values)
+
+        if not reuse or i not in reuse:
+            logger.info(f"Промпт {i} для задания {task_number} подготовлен (версия {template.version}), длина: {len(prompt)} символов")
+        prompts.append([prompt, image] if image is not None else prompt)
+
+    return await grade_criteria(prompts, extract_score, generation_config, task_number, status_callback,
+                                templates=templates, retry_budget=retry_budget, reuse=reuse)
+
+def brief_output_limit(template) -> int:
+    """
+    Лимит выходных токенов проверки одним запросом с кратким разбором: адаптивный
+    лимит шаблона (TokenBudgets, с размышлениями) с запасом BRIEF_OUTPUT_MARGIN,
+    но не меньше DEGRADED_MAX_OUTPUT_TOKENS и не больше GEMINI_MAX_OUTPUT_TOKENS.
+    """
+    budget = get_token_budgets().budget(template.name, GEMINI_MAX_OUTPUT_TOKENS)
+    return min(GEMINI_MAX_OUTPUT_TOKENS, max(DEGRADED_MAX_OUTPUT_TOKENS, budget + BRIEF_OUTPUT_MARGIN))
+
+def limit_solution_words(task_solution: str, max_words: int) -> tuple:
+    """
+    Считает слова в решении и обрезает его до max_words слов.
+
+    Returns:
+        tuple: (task_solution, word_count, truncation_notice) - решение для проверки,
+               число слов в нем и уведомление об обрезке (пустое, если обрезки не было)
+    """
+    truncated_solution, original_word_count = truncate_words(task_solution, max_words)
+    logger.info(f"Количество слов в тексте: {original_word_count}")
+
+    if original_word_count <= max_words:
+        return task_solution, original_word_count, ""
+
+    logger.info(f"Текст обрезан с {original_word_count} до {max_words} слов. Новая длина: {len(truncated_solution)} символов")
+    truncation_notice = f"⚠️ Ваш текст был обрезан до {max_words} слов для проверки (исходное количество слов: {original_word_count}).\n\n"
+    return truncated_solution, max_words, truncation_notice
+
+def format_graph_info(user_data: dict, image=None) -> str:
+    """Сведения о графике задания 38 для слота graph_info промптов"""
+    if image is not None:
+        return "\n\nГрафик к заданию приложен изображением после текста запроса."
+    graph_ocr_text = user_data.get('graph_ocr_text', '')
+    if 'graph_image_id' in user_data and graph_ocr_text:
+        return f"\n\nРаспознанный текст с графика:\n{graph_ocr_text}"
+    return ""
+
+def prompt_values(user_data: dict) -> tuple:
+    """
+    Значения слотов шаблонов задания 37 или 38 и изображение графика -
+    те же, что подставляет проверка (grade_submission).
+
+    Returns:
+        tuple: (values, image)
+    """
+    task_number = user_data['task_number']
+    truncated_solution, word_count = truncate_words(user_data['task_solution'], MAX_SOLUTION_WORDS[task_number])
+    values = {
+        "task_description": user_data['task_description'],
+        "task_solution": user_data['task_solution'] if word_count <= MAX_SOLUTION_WORDS[task_number] else truncated_solution,
+    }
+    image = None
+    if task_number == "38":
+        image = graph_image(user_data)
+        values["graph_info"] = format_graph_info(user_data, image)
+    return values, image
+
+def format_failed_criteria(failed: list) -> str:
+    """Формирует предупреждение о критериях, которые не удалось проверить"""
+    if not failed:
+        return ""
+    numbers = ", ".join(str(i) for i in failed)
+    return f"⚠️ Не удалось проверить критерии: {numbers}. Баллы по ним не начислены, попробуй проверить работу ещё раз.\n\n"
+
+async def check_with_gemini(user_data: dict, status_callback=None, user_id=None) -> tuple:
+    """
+    Проверка задания через Gemini API с кэшем результатов.
+
+    Повторная отправка той же работы (с теми же версиями промптов) возвращает
+    сохраненный результат без запросов к Gemini. Исправленная работа
+    пользователя (при известном user_id) сравнивается с его прошлой отправкой
+    по тому же заданию, и перепроверяются только критерии, затронутые правками.
+    Почти совпадающие работы других пользователей (копии шаблонного текста)
+    только фиксируются в логе и метриках: результат чужой работы с цитатами
+    из нее и ее баллами пользователю не показывается никогда.
+    Под нагрузкой работа проверяется в упрощенном режиме (DegradedMode).
+    """
+    task_number = user_data['task_number']
+    if task_number not in TASK_PROMPTS:
+        return await grade_submission(user_data, status_callback)
+
+    degraded_mode = get_degraded_mode()
+    level = degraded_mode.level()
+    try:
+        registry = get_prompt_registry()
+        template_versions = registry.versions(task_number)
+        if use_single_call(task_number, user_data.get('user_tier'), level):
+            # Результаты проверки одним запросом (и краткие) кэшируются отдельно от проверки по критериям
+            template_versions["single_call"] = registry.get_single_call_template(task_number, level >= BRIEF).version
+        cache_key = make_cache_key(
+            task_number,
+            user_data['task_description'],
+            user_data['task_solution'],
+            graph_fingerprint(user_data),
+            template_versions,
+            # Каскад дает другие ответы, чем одна основная модель, поэтому кэшируется отдельно;
+            # результаты упрощенного режима хранятся с уведомлением о нем - тоже отдельно
+            (f"{GEMINI_FAST_MODEL}>{GEMINI_MODEL}" if GEMINI_CASCADE and "single_call" not in template_versions else GEMINI_MODEL)
+            + (f"@{LEVEL_NAMES[level]}" if level != NORMAL else ""),
+        )
+    except FileNotFoundError:
+        # Отсутствующий промпт обработает сама проверка
+        return await grade_submission(user_data, status_callback)
+
+    cache = get_result_cache()
+    cached_result = await cache.get(cache_key)
+    if cached_result is not None:
+        logger.info(f"Результат проверки задания №{task_number} найден в кэше. Статистика кэша: {cache.stats()}")
+        if status_callback:
+            await status_callback("✅ Эта работа уже проверялась, подготавливаю результаты...")
+        return cached_result
+
+    # Исправленная работа сравнивается с прошлой отправкой того же пользователя; под нагрузкой работа
+    # проверяется одним запросом целиком, и перепроверка по критериям не нужна
+    history = get_submission_history()
+    plan = (
+        history.plan_regrade(user_id, user_data, template_versions)
+        if INCREMENTAL_REGRADE and user_id is not None and level == NORMAL else None
+    )
+    reuse = plan[0] if plan else None
+    if reuse:
+        metrics = get_metrics()
+        metrics.increment("incremental_regrades", task=task_number)
+        metrics.increment("criteria_reused", len(reuse), task=task_number)
+        if status_callback:
+            await status_callback("♻️ Сравниваю с прошлой версией работы: перепроверяю критерии, затронутые правками...")
+
+    # Ищем почти совпадающую работу того же варианта задания (свою прошлую работу пользователь исправил - ее не берем).
+    # Совпадение только учитывается: работа все равно проверяется полностью
+    if NEAR_DUPLICATE_MODE != "off":
+        variant = task_variant(task_number, user_data['task_description'])
+        # MinHash - несколько миллисекунд процессора: считаем вне цикла событий
+        shingles, signature = await asyncio.to_thread(solution_fingerprint, user_data['task_solution'])
+        index = get_near_duplicate_index()
+        near_duplicate = index.find(variant, signature, shingles) if plan is None else None
+        if near_duplicate:
+            result_key, similarity = near_duplicate
+            get_metrics().increment("near_duplicates", task=task_number)
+            logger.info(f"Найдена похожая работа по заданию №{task_number}: сходство {similarity:.2f}, результат {result_key[:12]}. Статистика индекса: {index.stats()}")
+
+    with degraded_mode.grading(level):
+        result = await grade_submission(user_data, status_callback, reuse=reuse, level=level)
+
+    if len(result) == 3 and "failed" in result[2]:
+        score, feedback, extra_info = result
+        if INCREMENTAL_REGRADE and user_id is not None:
+            # Для следующей отправки запоминаем критерии с полноценным результатом; критерий 1 с 0 баллов
+            # перепроверяется всегда - исправление, скорее всего, направлено как раз на него
+            usable = [
+                i for i, response in enumerate(extra_info["responses"], 1)
+                if i not in extra_info["failed"] and response != SKIPPED_CRITERION_RESPONSE
+                and not (i == 1 and extra_info["scores"][0] == 0)
+            ]
+            history.record(user_id, user_data, template_versions, extra_info["scores"], extra_info["responses"], usable)
+
+        # Часть проверок в фоне сравнивается с новыми версиями промптов (под нагрузкой - нет)
+        shadow = get_shadow_evaluator()
+        if shadow.enabled and level == NORMAL:
+            live_scores = {
+                i: score for i, (score, response) in enumerate(zip(extra_info["scores"], extra_info["responses"]), 1)
+                if i not in extra_info["failed"] and response != SKIPPED_CRITERION_RESPONSE
+            }
+            values, image = prompt_values(user_data)
+            shadow.submit(task_number, values, image, GENERATION_CONFIG, live_scores)
+
+        # Уведомление об упрощенном режиме сохраняется в кэше вместе с результатом: повторная отправка получит и его
+        degraded_notice = format_degraded_notice(level)
+        if degraded_notice:
+            feedback = degraded_notice + feedback
+            result = (score, feedback, extra_info)
+
+        # Сохраняем только полноценные результаты, без ошибок по критериям
+        if not extra_info["failed"]:
+            await cache.set(cache_key, result)
+            if NEAR_DUPLICATE_MODE != "off":
+                index.add(variant, signature, shingles, cache_key)
+
+        if plan is not None:
+            result = (score, format_regrade_notice(len(extra_info["scores"]), reuse) + feedback, extra_info)
+    return result
+
+async def grade_submission(user_data: dict, status_callback=None, reuse: dict = None, level: int = NORMAL) -> tuple:
+    """
+    Проверка задания через Gemini API.
+
+    Args:
+        reuse: Результаты прошлой проверки по критериям, которые не нужно перепроверять
+               ({номер критерия: (балл, разбор)}, см. SubmissionHistory.plan_regrade)
+        level: Режим проверки под нагрузкой (NORMAL, SINGLE_CALL, BRIEF из services.degraded_mode)
+    """
     task_number = user_data['task_number']
     task_description = user_data['task_description']
     task_solution = user_data['task_solution']
-    
+
     logger.info(f"Начинаем проверку задания №{task_number}")
     logger.info(f"Формулировка задания: {task_description[:50]}...")
     logger.info(f"Решение: {task_solution[:50]}...")
-    
+
     # Проверяем наличие изображения графика для задания 38
     has_graph_image = 'graph_image_id' in user_data and task_number == "38"
     if has_graph_image:
         logger.info(f"Задание 38 включает изображение графика (ID: {user_data['graph_image_id']})")
-    
+
     # Проверяем наличие OCR-текста из графика для задания 38
     graph_ocr_text = user_data.get('graph_ocr_text', '')
     if graph_ocr_text and task_number == "38":
         logger.info(f"Имеется OCR-текст графика длиной {len(graph_ocr_text)} символов")
-    
-    # Создание модели
-    logger.info("Инициализация модели Gemini 2.5 Flash Preview")
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
+
+    # При GRAPH_MODE=image к промптам задания 38 прикладывается само изображение графика
+    image = graph_image(user_data) if task_number == "38" else None
+    if image is not None:
+        logger.info(f"Изображение графика ({len(image.data)} байт) прикладывается к запросам к Gemini")
+        # Обычно загрузка уже началась, пока пользователь писал работу
+        get_backend().prepare_image(image)
+
+    # Проверка всех критериев одним запросом (зависит от задания и уровня пользователя)
+    single_call = use_single_call(task_number, user_data.get('user_tier'), level)
+    brief = level >= BRIEF
+    if level != NORMAL:
+        logger.info(f"Задание №{task_number} проверяется одним запросом из-за нагрузки{' с кратким разбором' if brief else ''}")
+    elif single_call:
+        logger.info(f"Задание №{task_number} проверяется одним запросом (уровень пользователя: {user_data.get('user_tier', 'free')})")
+
     # Настройка параметров генерации
-    generation_config = {
-        "temperature": 0.4,
-        "top_p": 0.95,
-        "top_k": 0,
-        "max_output_tokens": 8192,
-    }
-    
+    generation_config = dict(GENERATION_CONFIG)
+
+    # Повторы запросов к Gemini ограничены на всю проверку, а не на каждый критерий
+    retry_budget = RetryBudget()
+
     try:
         if task_number == "37":
             # Проверка количества слов для задания 37
             if status_callback:
                 await status_callback("📊 Подсчёт количества слов...")
-            
-            # Подсчет слов в решении
-            words = re.findall(r'\b\w+\b', task_solution)
-            word_count = len(words)
-            logger.info(f"Количество слов в тексте: {word_count}")
-            
-            original_word_count = word_count
-            truncation_notice = ""
-            
-            # Если количество слов превышает 154, обрезаем текст
-            if word_count > 154:
-                logger.info(f"Обрезаем текст с {word_count} до 154 слов")
-                # Получаем первые 154 слова
-                truncated_words = words[:154]
-                # Преобразуем список слов в текст, сохраняя пробелы и пунктуацию
-                pattern = r'\b(' + '|'.join(re.escape(word) for word in truncated_words) + r')\b'
-                matches = list(re.finditer(pattern, task_solution))
-                if matches and len(matches) >= 154:
-                    # Находим позицию последнего слова
-                    last_match = matches[153]
-                    end_pos = last_match.end()
-                    task_solution = task_solution[:end_pos]
-                else:
-                    # Резервный вариант, если регулярное выражение не сработало
-                    task_solution = ' '.join(truncated_words)
-                
-                word_count = 154
-                truncation_notice = f"⚠️ Ваш текст был обрезан до 154 слов для проверки (исходное количество слов: {original_word_count}).\n\n"
-                logger.info(f"Текст обрезан. Новая длина: {len(task_solution)} символов")
-            
+
+            # Подсчет слов в решении и обрезка до 154 слов за один проход
+            task_solution, word_count, truncation_notice = limit_solution_words(task_solution, MAX_SOLUTION_WORDS["37"])
+
             # Если меньше 90 слов, сразу возвращаем 0 баллов
             if word_count < 90:
                 logger.warning(f"Недостаточное количество слов: {word_count} < 90. Выставляем 0 баллов.")
@@ -91,399 +1082,115 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
                     "responses": ["", "", ""]
                 }
                 return 0, error_msg, extra_info
-            
-            # Для задания 37 используем последовательные промпты из файлов
-            logger.info("Используем последовательные промпты для задания 37")
-            all_responses = []
-            scores = [0, 0, 0]  # Оценки по трем критериям
-            
+
+            # Для задания 37 используем промпты из файлов, по одному на критерий
+            logger.info("Используем промпты по критериям для задания 37")
+
             # Статус проверки: начинаем
             if status_callback:
                 await status_callback("🔍 Анализирую твою работу... (0%)")
-            
-            # Проходим по всем трем промптам
-            for i in range(1, 4):
-                # Обновляем статус
-                if status_callback:
-                    await status_callback(f"🔍 Анализирую твою работу... Шаг {i}/3 ({i*33}%)")
-                
-                logger.info(f"Обработка промпта {i}/3")
-                prompt_path = f"prompts/prompt{i}.txt"
-                
-                if not os.path.exists(prompt_path):
-                    logger.error(f"Файл промпта не найден: {prompt_path}")
-                    error_msg = f"Файл промпта не найден: {prompt_path}"
-                    extra_info = {
-                        "scores": [0, 0, 0],
-                        "responses": ["", "", ""]
-                    }
-                    return "Ошибка проверки", error_msg, extra_info
-                
-                async with aiofiles.open(prompt_path, "r", encoding="utf-8") as file:
-                    prompt_template = await file.read()
-                
-                # Подставляем данные пользователя в промпт
-                prompt = prompt_template.replace("[Текст задания из сообщения пользователя в телеграм]", task_description)
-                prompt = prompt.replace("[Текст емейла из сообщения пользователя в телеграм]", task_solution)
-                
-                logger.info(f"Промпт {i} подготовлен, длина: {len(prompt)} символов")
-                logger.info(f"Начало промпта {i}: {prompt[:100]}...")
-                
-                # Отправляем запрос к Gemini с механизмом повторных попыток
-                logger.info(f"Отправка запроса к Gemini (промпт {i})")
-                start_time = time.time()
-                
-                # Обновляем статус
-                if status_callback:
-                    await status_callback(f"🤖 Отправляю запрос к AI... Шаг {i}/3 ({i*33}%)")
-                
-                max_retries = 3
-                retry_delay = 5  # секунд
-                
-                for attempt in range(max_retries):
-                    try:
-                        # Обновляем статус при повторной попытке
-                        if attempt > 0 and status_callback:
-                            await status_callback(f"🔄 Повторная попытка {attempt}/{max_retries}... Шаг {i}/3 ({i*33}%)")
-                        
-                        response = model.generate_content(
-                            prompt,
-                            generation_config=generation_config
-                        )
-                        
-                        elapsed_time = time.time() - start_time
-                        logger.info(f"Получен ответ от Gemini (промпт {i}), время выполнения: {elapsed_time:.2f} секунд")
-                        logger.info(f"Начало ответа: {response.text[:100]}...")
-                        all_responses.append(response.text)
-                        break  # Успешно получили ответ
-                        
-                    except (Timeout, ConnectionError) as e:
-                        if attempt < max_retries - 1:
-                            delay = retry_delay * (attempt + 1)
-                            logger.warning(f"Таймаут при запросе к Gemini (промпт {i}), попытка {attempt+1}/{max_retries}. Ожидание {delay} секунд...")
-                            await asyncio.sleep(delay)
-                        else:
-                            logger.error(f"Не удалось получить ответ от Gemini после {max_retries} попыток: {str(e)}")
-                            raise
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке промпта {i}: {str(e)}")
-                        if attempt < max_retries - 1:
-                            delay = retry_delay * (attempt + 1)
-                            logger.warning(f"Повторная попытка {attempt+1}/{max_retries} через {delay} секунд...")
-                            await asyncio.sleep(delay)
-                        else:
-                            raise
-                
-                # Обновляем статус после получения ответа
-                if status_callback:
-                    await status_callback(f"📊 Анализирую ответ... Шаг {i}/3 ({i*33}%)")
-                
-                # Извлекаем оценку в зависимости от номера промпта
-                response_text = response.text
-                
-                if i == 1:
-                    # Для первого промпта ищем "Итоговый балл: X" в различных форматах
-                    logger.info("Извлечение оценки из первого промпта (критерий 1)")
-                    # Проверяем несколько вариантов форматирования
-                    score_matches = re.search(r'Итоговый балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'итоговый балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'ИТОГОВЫЙ БАЛЛ:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        # Ищем любой балл в последнем абзаце итоговой оценки
-                        last_section = response_text.split("ИТОГОВАЯ ОЦЕНКА")[-1] if "ИТОГОВАЯ ОЦЕНКА" in response_text else response_text
-                        score_matches = re.search(r'(\d+)\s*балл', last_section)
-                        
-                    if score_matches:
-                        scores[0] = int(score_matches.group(1))
-                        logger.info(f"Найдена оценка по критерию 1: {scores[0]}")
-                    else:
-                        logger.warning("Не удалось найти оценку в первом промпте. Устанавливаем значение по умолчанию: 1")
-                        scores[0] = 1  # Значение по умолчанию
-                
-                elif i == 2:
-                    # Для второго промпта ищем "Балл: X" в различных форматах
-                    logger.info("Извлечение оценки из второго промпта (критерий 2)")
-                    # Проверяем несколько вариантов форматирования
-                    score_matches = re.search(r'Балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'получает\s*\*\*(\d+)\s*балл', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'оценка:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    
-                    if score_matches:
-                        scores[1] = int(score_matches.group(1))
-                        logger.info(f"Найдена оценка по критерию 2: {scores[1]}")
-                    else:
-                        logger.warning("Не удалось найти оценку во втором промпте. Устанавливаем значение по умолчанию: 1")
-                        scores[1] = 1  # Значение по умолчанию
-                
-                elif i == 3:
-                    # Для третьего промпта ищем "Общий балл: X" в различных форматах
-                    logger.info("Извлечение оценки из третьего промпта (критерий 3)")
-                    
-                    # Сначала проверяем блок ИТОГОВАЯ ОЦЕНКА, если он есть
-                    if "ИТОГОВАЯ ОЦЕНКА" in response_text:
-                        logger.info("Найден блок ИТОГОВАЯ ОЦЕНКА в ответе для критерия 3")
-                        итоговая_оценка_блок = response_text.split("ИТОГОВАЯ ОЦЕНКА")[1].split("\n\n")[0]
-                        общий_балл_match = re.search(r'Общий балл:?\s*(\d+)', итоговая_оценка_блок)
-                        if общий_балл_match:
-                            scores[2] = int(общий_балл_match.group(1))
-                            logger.info(f"Найдена оценка по критерию 3 в блоке ИТОГОВАЯ ОЦЕНКА: {scores[2]}")
-                            continue
-                    
-                    # Проверяем несколько вариантов форматирования
-                    score_matches = re.search(r'Общий балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'общий балл:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    if not score_matches:
-                        score_matches = re.search(r'ОБЩИЙ БАЛЛ:?\s*(\d+)(?:\s*балл|\.|\s|$)', response_text)
-                    
-                    if score_matches:
-                        scores[2] = int(score_matches.group(1))
-                        logger.info(f"Найдена оценка по критерию 3: {scores[2]}")
-                    else:
-                        logger.warning("Не удалось найти оценку в третьем промпте. Устанавливаем значение по умолчанию: 1")
-                        scores[2] = 1  # Значение по умолчанию
-            
+
+            # Готовим промпты по всем трем критериям
+            try:
+                templates = get_prompt_registry().get_task_templates(task_number)
+            except FileNotFoundError as e:
+                logger.error(f"Файл промпта не найден: {e.filename}")
+                error_msg = f"Файл промпта не найден: {e.filename}"
+                extra_info = {
+                    "scores": [0, 0, 0],
+                    "responses": ["", "", ""]
+                }
+                return "Ошибка проверки", error_msg, extra_info
+
+            values = {"task_description": task_description, "task_solution": task_solution}
+            scores, all_responses, failed = await grade_task_criteria(
+                task_number, templates, values, extract_score_37, generation_config, status_callback, single_call,
+                retry_budget=retry_budget, reuse=reuse, level=level
+            )
+            log_retry_cost(task_number, retry_budget)
+            failed_notice = format_failed_criteria(failed)
+
             # Проверяем первый критерий - если 0, то вся работа оценивается в 0 баллов
-            if scores[0] == 0:
+            if scores[0] == 0 and 1 not in failed:
                 logger.info("Оценка по первому критерию равна 0, выставляем 0 за всю работу")
                 final_score = 0
-                scores_info = truncation_notice
+                scores_info = truncation_notice + failed_notice
                 scores_info += f"Так как оценка по первому критерию (Решение коммуникативной задачи) равна 0, за всю работу выставляется 0 баллов.\n\n"
                 scores_info += f"Баллы по критериям:\n1. Решение коммуникативной задачи: {scores[0]}\n2. Организация текста: {scores[1]}\n3. Языковое оформление: {scores[2]}\n\nОбщий балл: {final_score}\n\n---\n\n"
             else:
                 # Суммируем баллы по всем критериям
                 final_score = sum(scores)
                 logger.info(f"Баллы по критериям: {scores}. Итоговая сумма: {final_score}")
-                scores_info = truncation_notice
+                scores_info = truncation_notice + failed_notice
                 scores_info += f"Баллы по критериям:\n1. Решение коммуникативной задачи: {scores[0]}\n2. Организация текста: {scores[1]}\n3. Языковое оформление: {scores[2]}\n\nОбщий балл: {final_score}\n\n---\n\n"
-            
+
             # Обновляем статус: завершено
             if status_callback:
                 await status_callback("✅ Проверка завершена! Подготавливаю результаты...")
-            
+
             # Объединяем все ответы с явным обозначением разделов
             combined_response = scores_info
             combined_response += "📝 КРИТЕРИЙ 1: РЕШЕНИЕ КОММУНИКАТИВНОЙ ЗАДАЧИ\n\n" + all_responses[0] + "\n\n"
             combined_response += "🔠 КРИТЕРИЙ 2: ОРГАНИЗАЦИЯ ТЕКСТА\n\n" + all_responses[1] + "\n\n"
             combined_response += "📚 КРИТЕРИЙ 3: ЯЗЫКОВОЕ ОФОРМЛЕНИЕ\n\n" + all_responses[2]
-            
+
             # Для задания 37 возвращаем дополнительную информацию для отправки на бэкенд
             extra_info = {
                 "scores": scores,
-                "responses": all_responses
+                "responses": all_responses,
+                "failed": failed
             }
-            
+
             return final_score, combined_response, extra_info
-        
+
         elif task_number == "38":
-            # Для задания 38 используем последовательные промпты из файлов (всего 5)
-            logger.info("Используем последовательные промпты для задания 38 (всего 5)")
-            all_responses = []
-            scores = [0, 0, 0, 0, 0]  # Оценки по пяти критериям
-            
+            # Для задания 38 используем промпты из файлов, по одному на критерий (всего 5)
+            logger.info("Используем промпты по критериям для задания 38 (всего 5)")
+
             # Проверка количества слов для задания 38
             if status_callback:
                 await status_callback("📊 Подсчёт количества слов...")
-            
-            # Подсчет слов в решении
-            words = re.findall(r'\b\w+\b', task_solution)
-            word_count = len(words)
-            logger.info(f"Количество слов в тексте: {word_count}")
-            
+
+            # Подсчет слов в решении и обрезка до 275 слов за один проход
+            task_solution, word_count, truncation_notice = limit_solution_words(task_solution, MAX_SOLUTION_WORDS["38"])
+
             # Если меньше 180 слов, сразу возвращаем 0 баллов
             if word_count < 180:
                 logger.warning(f"Недостаточное количество слов для задания 38: {word_count} < 180. Выставляем 0 баллов.")
                 return 0, f"Количество слов в тексте ({word_count}) меньше минимального требуемого (180).\n\nВ соответствии с критериями оценивания за такую работу выставляется 0 баллов."
-            
-            original_word_count = word_count
-            truncation_notice = ""
-            
-            # Если количество слов превышает 275, обрезаем текст
-            if word_count > 275:
-                logger.info(f"Обрезаем текст с {word_count} до 275 слов")
-                # Получаем первые 275 слов
-                truncated_words = words[:275]
-                # Преобразуем список слов в текст, сохраняя пробелы и пунктуацию
-                pattern = r'\b(' + '|'.join(re.escape(word) for word in truncated_words) + r')\b'
-                matches = list(re.finditer(pattern, task_solution))
-                if matches and len(matches) >= 275:
-                    # Находим позицию последнего слова
-                    last_match = matches[274]
-                    end_pos = last_match.end()
-                    task_solution = task_solution[:end_pos]
-                else:
-                    # Резервный вариант, если регулярное выражение не сработало
-                    task_solution = ' '.join(truncated_words)
-                
-                word_count = 275
-                truncation_notice = f"⚠️ Ваш текст был обрезан до 275 слов для проверки (исходное количество слов: {original_word_count}).\n\n"
-                logger.info(f"Текст обрезан. Новая длина: {len(task_solution)} символов")
-            
+
             # Статус проверки: начинаем
             if status_callback:
                 await status_callback("🔍 Анализирую твою работу... (0%)")
-            
-            # Проходим по всем пяти промптам
-            for i in range(1, 6):
-                # Обновляем статус
-                if status_callback:
-                    await status_callback(f"🔍 Анализирую твою работу... Шаг {i}/5 ({i*20}%)")
-                
-                logger.info(f"Обработка промпта {i}/5 для задания 38")
-                prompt_path = f"prompts/prompt38_{i}.txt"
-                
-                if not os.path.exists(prompt_path):
-                    logger.error(f"Файл промпта не найден: {prompt_path}")
-                    error_msg = f"Файл промпта не найден: {prompt_path}"
-                    # Для заданий 37 и 38 возвращаем 3 значения даже при ошибке
-                    if task_number in ["37", "38"]:
-                        extra_info = {
-                            "scores": [0, 0, 0] if task_number == "37" else [0, 0, 0, 0, 0],
-                            "responses": [""] * (3 if task_number == "37" else 5)
-                        }
-                        return 0, error_msg, extra_info
-                    else:
-                        return "Ошибка проверки", error_msg
-                
-                async with aiofiles.open(prompt_path, "r", encoding="utf-8") as file:
-                    prompt_template = await file.read()
-                
-                # Подготавливаем информацию о графике, если есть
-                graph_info = ""
-                if has_graph_image and graph_ocr_text:
-                    graph_info = f"\n\nРаспознанный текст с графика:\n{graph_ocr_text}"
-                
-                # Подставляем данные пользователя в промпт
-                prompt = prompt_template.replace("[Текст задания из сообщения пользователя в телеграм]", task_description)
-                prompt = prompt.replace("[Текст описания графика из сообщения пользователя в телеграм]", task_solution)
-                prompt = prompt.replace("[Распознанный текст графика]", graph_info)
-                
-                logger.info(f"Промпт {i} для задания 38 подготовлен, длина: {len(prompt)} символов")
-                logger.info(f"Начало промпта {i}: {prompt[:100]}...")
-                
-                # Отправляем запрос к Gemini с механизмом повторных попыток
-                logger.info(f"Отправка запроса к Gemini (промпт {i} для задания 38)")
-                start_time = time.time()
-                
-                # Обновляем статус
-                if status_callback:
-                    await status_callback(f"🤖 Отправляю запрос к AI... Шаг {i}/5 ({i*20}%)")
-                
-                max_retries = 3
-                retry_delay = 5  # секунд
-                
-                for attempt in range(max_retries):
-                    try:
-                        # Обновляем статус при повторной попытке
-                        if attempt > 0 and status_callback:
-                            await status_callback(f"🔄 Повторная попытка {attempt}/{max_retries}... Шаг {i}/5 ({i*20}%)")
-                        
-                        response = model.generate_content(
-                            prompt,
-                            generation_config=generation_config
-                        )
-                        
-                        elapsed_time = time.time() - start_time
-                        logger.info(f"Получен ответ от Gemini (промпт {i} для задания 38), время выполнения: {elapsed_time:.2f} секунд")
-                        logger.info(f"Начало ответа: {response.text[:100]}...")
-                        all_responses.append(response.text)
-                        break  # Успешно получили ответ
-                        
-                    except (Timeout, ConnectionError) as e:
-                        if attempt < max_retries - 1:
-                            delay = retry_delay * (attempt + 1)
-                            logger.warning(f"Таймаут при запросе к Gemini (промпт {i} для задания 38), попытка {attempt+1}/{max_retries}. Ожидание {delay} секунд...")
-                            await asyncio.sleep(delay)
-                        else:
-                            logger.error(f"Не удалось получить ответ от Gemini после {max_retries} попыток: {str(e)}")
-                            raise
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке промпта {i} для задания 38: {str(e)}")
-                        if attempt < max_retries - 1:
-                            delay = retry_delay * (attempt + 1)
-                            logger.warning(f"Повторная попытка {attempt+1}/{max_retries} через {delay} секунд...")
-                            await asyncio.sleep(delay)
-                        else:
-                            raise
-                
-                # Обновляем статус после получения ответа
-                if status_callback:
-                    await status_callback(f"📊 Анализирую ответ... Шаг {i}/5 ({i*20}%)")
-                
-                # Извлекаем оценку в зависимости от номера промпта
-                response_text = response.text
-                logger.info(f"Начинаем извлечение оценки для критерия {i}")
-                logger.info(f"Конец ответа для критерия {i}: ...{response_text[-200:]}")
-                
-                # Сначала ищем в блоке ИТОГОВАЯ ОЦЕНКА
-                score_found = False
-                if "ИТОГОВАЯ ОЦЕНКА" in response_text:
-                    logger.info(f"Найден блок ИТОГОВАЯ ОЦЕНКА для критерия {i}")
-                    # Извлекаем блок ИТОГОВАЯ ОЦЕНКА
-                    итоговая_блоки = response_text.split("ИТОГОВАЯ ОЦЕНКА")
-                    if len(итоговая_блоки) > 1:
-                        # Берем текст после "ИТОГОВАЯ ОЦЕНКА"
-                        итоговая_текст = итоговая_блоки[1]
-                        
-                        # Удаляем пустые строки в начале
-                        итоговая_текст = итоговая_текст.lstrip('\n\r\t ')
-                        
-                        # Берем до следующего двойного переноса или конца (но не менее 100 символов для поиска балла)
-                        итоговая_секция_части = итоговая_текст.split("\n\n")
-                        итоговая_секция = итоговая_секция_части[0]
-                        
-                        # Если первая часть слишком короткая, берем больше текста
-                        if len(итоговая_секция) < 50 and len(итоговая_секция_части) > 1:
-                            итоговая_секция = итоговая_секция + "\n\n" + итоговая_секция_части[1]
-                        
-                        logger.info(f"Секция ИТОГОВАЯ ОЦЕНКА для критерия {i}: {итоговая_секция}")
-                        
-                        # Ищем "Балл: X" в этой секции
-                        балл_match = re.search(r'Балл:?\s*(\d+)', итоговая_секция)
-                        if балл_match:
-                            scores[i-1] = int(балл_match.group(1))
-                            logger.info(f"Найдена оценка для критерия {i} в блоке ИТОГОВАЯ ОЦЕНКА: {scores[i-1]}")
-                            score_found = True
-                        else:
-                            logger.warning(f"Не найден паттерн 'Балл: X' в секции ИТОГОВАЯ ОЦЕНКА для критерия {i}")
-                else:
-                    logger.warning(f"Не найден блок ИТОГОВАЯ ОЦЕНКА для критерия {i}")
-                
-                # Если не нашли в блоке ИТОГОВАЯ ОЦЕНКА, используем общие паттерны
-                if not score_found:
-                    logger.info(f"Поиск оценки общими паттернами для критерия {i}")
-                    # Общий шаблон для извлечения оценки из разных промптов
-                    score_patterns = [
-                        r'Балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
-                        r'Итоговый балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
-                        r'Финальный балл:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
-                        r'ОЦЕНКА:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
-                        r'Оценка:?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)',
-                        r'получает\s*\*\*(\d+)\s*балл'
-                    ]
-                    
-                    # Извлекаем оценку с использованием разных паттернов
-                    for pattern in score_patterns:
-                        score_matches = re.search(pattern, response_text)
-                        if score_matches:
-                            scores[i-1] = int(score_matches.group(1))
-                            logger.info(f"Найдена оценка для критерия {i} паттерном '{pattern}': {scores[i-1]}")
-                            score_found = True
-                            break
-                
-                if not score_found:
-                    logger.warning(f"Не удалось найти оценку в промпте {i} для задания 38. Устанавливаем значение по умолчанию: 1")
-                    scores[i-1] = 1  # Значение по умолчанию
-            
+
+            # Подготавливаем информацию о графике, если есть
+            graph_info = format_graph_info(user_data, image)
+
+            # Готовим промпты по всем пяти критериям
+            try:
+                templates = get_prompt_registry().get_task_templates(task_number)
+            except FileNotFoundError as e:
+                logger.error(f"Файл промпта не найден: {e.filename}")
+                error_msg = f"Файл промпта не найден: {e.filename}"
+                extra_info = {
+                    "scores": [0, 0, 0, 0, 0],
+                    "responses": [""] * 5
+                }
+                return 0, error_msg, extra_info
+
+            values = {"task_description": task_description, "task_solution": task_solution, "graph_info": graph_info}
+            scores, all_responses, failed = await grade_task_criteria(
+                task_number, templates, values, extract_score_38, generation_config, status_callback, single_call,
+                retry_budget=retry_budget, reuse=reuse, image=image, level=level
+            )
+            log_retry_cost(task_number, retry_budget)
+            failed_notice = format_failed_criteria(failed)
+
             # Проверяем первый критерий - если 0, то вся работа оценивается в 0 баллов
-            if scores[0] == 0:
+            if scores[0] == 0 and 1 not in failed:
                 logger.info("Оценка по первому критерию равна 0, выставляем 0 за всю работу")
                 final_score = 0
-                scores_info = truncation_notice  # Добавляем уведомление об обрезке текста, если оно есть
+                scores_info = truncation_notice + failed_notice  # Добавляем уведомления об обрезке текста и ошибках, если они есть
                 scores_info += f"Так как оценка по первому критерию (Решение коммуникативной задачи) равна 0, за всю работу выставляется 0 баллов.\n\n"
                 scores_info += f"Баллы по критериям:\n"
                 scores_info += f"1. Решение коммуникативной задачи: {scores[0]}\n"
@@ -496,9 +1203,9 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
                 # Суммируем баллы по всем критериям
                 final_score = sum(scores)
                 logger.info(f"Баллы по критериям (задание 38): {scores}. Итоговая сумма: {final_score}")
-            
+
                 # Формируем сводку баллов
-                scores_info = truncation_notice  # Добавляем уведомление об обрезке текста, если оно есть
+                scores_info = truncation_notice + failed_notice  # Добавляем уведомления об обрезке текста и ошибках, если они есть
                 scores_info += f"Баллы по критериям:\n"
                 scores_info += f"1. Решение коммуникативной задачи: {scores[0]}\n"
                 scores_info += f"2. Организация текста: {scores[1]}\n"
@@ -506,11 +1213,11 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
                 scores_info += f"4. Языковое оформление (грамматика): {scores[3]}\n"
                 scores_info += f"5. Орфография и пунктуация: {scores[4]}\n\n"
                 scores_info += f"Общий балл: {final_score}\n\n---\n\n"
-            
+
             # Обновляем статус: завершено
             if status_callback:
                 await status_callback("✅ Проверка завершена! Подготавливаю результаты...")
-            
+
             # Объединяем все ответы с явным обозначением разделов
             combined_response = scores_info
             combined_response += "📝 КРИТЕРИЙ 1: РЕШЕНИЕ КОММУНИКАТИВНОЙ ЗАДАЧИ\n\n" + all_responses[0] + "\n\n"
@@ -518,67 +1225,35 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
             combined_response += "📚 КРИТЕРИЙ 3: ЯЗЫКОВОЕ ОФОРМЛЕНИЕ (ЛЕКСИКА)\n\n" + all_responses[2] + "\n\n"
             combined_response += "📖 КРИТЕРИЙ 4: ЯЗЫКОВОЕ ОФОРМЛЕНИЕ (ГРАММАТИКА)\n\n" + all_responses[3] + "\n\n"
             combined_response += "✏️ КРИТЕРИЙ 5: ОРФОГРАФИЯ И ПУНКТУАЦИЯ\n\n" + all_responses[4]
-            
+
             # Формируем extra_info для задания 38
             extra_info = {
                 "scores": scores,
-                "responses": all_responses
+                "responses": all_responses,
+                "failed": failed
             }
-            
+
             return final_score, combined_response, extra_info
-            
+
         else:
             # Для других заданий используем стандартный промпт
             logger.info(f"Используем стандартный промпт для задания {task_number}")
             prompt = f"""
             Проверь, пожалуйста, решение задания №{task_number}.
-            
+
             Формулировка задания:
             {task_description}
-            
+
             Решение:
             {task_solution}
-            
+
             Оцени решение по 10-балльной шкале. В ответе укажи только количество баллов (число от 0 до 10).
             """
-            
-            logger.info(f"Отправка запроса к Gemini")
-            start_time = time.time()
-            
-            max_retries = 3
-            retry_delay = 5  # секунд
-            
-            for attempt in range(max_retries):
-                try:
-                    response = model.generate_content(
-                        prompt,
-                        generation_config=generation_config
-                    )
-                    
-                    elapsed_time = time.time() - start_time
-                    logger.info(f"Получен ответ от Gemini, время выполнения: {elapsed_time:.2f} секунд")
-                    break  # Успешно получили ответ
-                    
-                except (Timeout, ConnectionError) as e:
-                    if attempt < max_retries - 1:
-                        delay = retry_delay * (attempt + 1)
-                        logger.warning(f"Таймаут при запросе к Gemini, попытка {attempt+1}/{max_retries}. Ожидание {delay} секунд...")
-                        await asyncio.sleep(delay)
-                    else:
-                        logger.error(f"Не удалось получить ответ от Gemini после {max_retries} попыток: {str(e)}")
-                        raise
-                except Exception as e:
-                    logger.error(f"Ошибка при запросе к Gemini: {str(e)}")
-                    if attempt < max_retries - 1:
-                        delay = retry_delay * (attempt + 1)
-                        logger.warning(f"Повторная попытка {attempt+1}/{max_retries} через {delay} секунд...")
-                        await asyncio.sleep(delay)
-                    else:
-                        raise
-            
-            response_text = response.text.strip()
+
+            response_text = await request_gemini(prompt, generation_config, f"задание {task_number}")
+            response_text = response_text.strip()
             logger.info(f"Ответ Gemini: {response_text}")
-            
+
             # Извлекаем оценку
             score_matches = re.search(r'(\d+(?:\.\d+)?)\s*(?:балл|из|\/|\s*10)', response_text)
             if score_matches:
@@ -595,18 +1270,22 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
                         score = digits[0]
                     else:
                         score = "7"  # Значение по умолчанию, если не удалось найти число
-            
+
             logger.info(f"Извлечена оценка: {score}")
             return score, response_text
-            
+
     except Exception as e:
-        error_msg = f"Ошибка при использовании Gemini API: {e}"
+        if isinstance(e, CircuitOpenError):
+            # Понятное сообщение вместо технической ошибки: Gemini временно недоступен
+            error_msg = f"⚠️ {e}"
+        else:
+            error_msg = f"Ошибка при использовании Gemini API: {e}"
         logger.error(error_msg)
-        
+
         # Обновляем статус при ошибке
         if status_callback:
             await status_callback("❌ Произошла ошибка при проверке")
-        
+
         # Для заданий 37 и 38 возвращаем 3 значения даже при ошибке
         if task_number in ["37", "38"]:
             extra_info = {
@@ -615,4 +1294,4 @@ async def check_with_gemini(user_data: dict, status_callback=None) -> tuple:
             }
             return 0, error_msg, extra_info
         else:
-            return "Ошибка проверки", error_msg 
\ No newline at end of file
+            return "Ошибка проверки", error_msg
@@ -0,0 +1,140 @@
+import re
+import time
+import logging
+from services.metrics import get_metrics
+from services.prompt_registry import TASK_PROMPTS
+from utils.score_extraction import extract_score
+from config import GEMINI_STREAM_STATUS_INTERVAL
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Оценка критерия в еще не дописанном JSON-ответе проверки одним запросом: "k2": 1,
+PARTIAL_JSON_SCORE_RE = re.compile(r'"k(\d+)"\s*:\s*(\d+)\s*[,}]')
+
+class GradingProgress:
+    """
+    Прогресс проверки по критериям для статусного сообщения при потоковых
+    ответах Gemini: сколько текста разбора уже получено и предварительные
+    баллы, найденные в еще не законченных ответах.
+
+    Статус обновляется не чаще раза в interval секунд (Telegram ограничивает
+    частоту правки сообщений); окончательные баллы считаются по полному ответу.
+    """
+
+    def __init__(self, task_number: str, total: int, status_callback, interval: float = GEMINI_STREAM_STATUS_INTERVAL):
+        self.task_number = task_number
+        self.total = total
+        self.status_callback = status_callback
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self.first_score_at = None
+        self.last_update_at = 0.0
+        self.chars = [0] * total
+        self.scores = [None] * total
+        self.done = [False] * total
+        self.skipped = [False] * total
+        self.reused = [False] * total
+        self.escalated = [False] * total
+
+    def _observe_score(self, i: int, score: int) -> None:
+        if score is None or self.scores[i-1] is not None:
+            return
+        self.scores[i-1] = score
+        if self.first_score_at is None:
+            self.first_score_at = time.monotonic()
+            logger.info(f"Первый предварительный балл задания {self.task_number} (критерий {i}) "
+                        f"через {self.first_score_at - self.started_at:.2f} с")
+
+    def _prompt_name(self, i: int) -> str:
+        return TASK_PROMPTS[self.task_number][i-1] if self.task_number in TASK_PROMPTS else None
+
+    def criterion_callback(self, i: int):
+        """Обработчик потокового ответа по критерию i: (текст ответа на данный момент) -> None"""
+        prompt_name = self._prompt_name(i)
+
+        async def on_text(text: str) -> None:
+            self.chars[i-1] = len(text)
+            if prompt_name and self.scores[i-1] is None:
+                self._observe_score(i, extract_score(prompt_name, text)[0])
+            await self.update()
+
+        return on_text
+
+    async def single_call_callback(self, text: str) -> None:
+        """Обработчик потокового JSON-ответа проверки одним запросом по всем критериям"""
+        for match in PARTIAL_JSON_SCORE_RE.finditer(text):
+            i = int(match.group(1))
+            if 1 <= i <= self.total:
+                self._observe_score(i, int(match.group(2)))
+        self.chars = [len(text)] * self.total
+        await self.update()
+
+    async def finish(self, i: int, text: str) -> None:
+        """Отмечает, что ответ по критерию i получен полностью, и сразу обновляет статус"""
+        self.done[i-1] = True
+        prompt_name = self._prompt_name(i)
+        if prompt_name:
+            # Балл по полному ответу: в неполном мог сработать менее приоритетный шаблон
+            self.scores[i-1] = extract_score(prompt_name, text)[0]
+        await self.update(force=True)
+
+    def reuse(self, i: int, score: int) -> None:
+        """Отмечает критерий i как взятый из прошлой проверки (правки его не затронули)"""
+        self.done[i-1] = True
+        self.reused[i-1] = True
+        self.scores[i-1] = score
+
+    async def escalate(self, i: int) -> None:
+        """Ответ быстрой модели по критерию i не принят: разбор пишется заново основной моделью"""
+        self.chars[i-1] = 0
+        self.scores[i-1] = None
+        self.escalated[i-1] = True
+        await self.update(force=True)
+
+    def skip(self, i: int) -> None:
+        """Отмечает критерий i как пропущенный (0 баллов по первому критерию)"""
+        self.skipped[i-1] = True
+
+    async def update(self, force: bool = False) -> None:
+        if not self.status_callback:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_update_at < self.interval:
+            return
+        self.last_update_at = now
+        await self.status_callback(self.render())
+
+    def render(self) -> str:
+        done = sum(self.done)
+        lines = [f"🔍 Анализирую твою работу... Готово {done}/{self.total} ({done * 100 // self.total}%)"]
+        for i in range(1, self.total + 1):
+            score = self.scores[i-1]
+            if self.skipped[i-1]:
+                lines.append(f"К{i}: ⏭ не нужен: по К1 0 баллов")
+            elif self.reused[i-1]:
+                lines.append(f"К{i}: ♻️ {score} б. из прошлой проверки")
+            elif self.done[i-1]:
+                lines.append(f"К{i}: ✅ {score} б." if score is not None else f"К{i}: ✅ разбор готов")
+            elif score is not None:
+                lines.append(f"К{i}: предварительно {score} б., дописываю разбор ({self.chars[i-1]} симв.)")
+            elif self.chars[i-1]:
+                lines.append(f"К{i}: ✍️ пишу разбор ({self.chars[i-1]} симв.)")
+            elif self.escalated[i-1]:
+                lines.append(f"К{i}: 🔁 перепроверяю основной моделью")
+            else:
+                lines.append(f"К{i}: ⏳ жду ответа")
+        return "\n".join(lines)
+
+    def log_summary(self) -> None:
+        """Пишет в лог время до первого предварительного балла рядом с общим временем проверки"""
+        total_time = time.monotonic() - self.started_at
+        if self.first_score_at is None:
+            logger.info(f"Проверка задания {self.task_number}: предварительных баллов не было, общее время {total_time:.2f} с")
+            return
+        first_score = self.first_score_at - self.started_at
+        metrics = get_metrics()
+        metrics.increment("grading_first_score_checks")
+        metrics.increment("grading_first_score_seconds", round(first_score, 3))
+        logger.info(f"Проверка задания {self.task_number}: первый предварительный балл через {first_score:.2f} с, "
+                    f"общее время {total_time:.2f} с")
@@ -0,0 +1,54 @@
+import hashlib
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько входных токенов Gemini засчитывает за одно изображение
+IMAGE_TOKENS = 258
+
+class GraphImage:
+    """
+    Изображение графика задания 38 - часть промпта наравне с текстом
+    (промпт - список [текст, GraphImage]).
+
+    В Gemini изображение загружается через Files API один раз на ключ
+    (gemini_client.get_image_file), и запросы по всем критериям ссылаются
+    на загруженный файл.
+    """
+
+    def __init__(self, data: bytes, mime_type: str = "image/jpeg"):
+        self.data = data
+        self.mime_type = mime_type
+        self.digest = hashlib.sha1(data).hexdigest()[:16]
+
+    def __repr__(self) -> str:
+        # Не зависит от адреса объекта: по нему считаются ключи записей в кассете
+        return f"GraphImage({self.digest})"
+
+def graph_image(user_data: dict):
+    """Изображение графика из данных пользователя (при GRAPH_MODE=image) или None"""
+    data = user_data.get('graph_image')
+    return GraphImage(data) if data else None
+
+def graph_fingerprint(user_data: dict) -> str:
+    """
+    Чем задан график работы для кэша результатов и истории отправок:
+    распознанный текст или хэш изображения.
+    """
+    image = graph_image(user_data)
+    if image is not None:
+        return f"image:{image.digest}"
+    return user_data.get('graph_ocr_text', '')
+
+def prompt_text(prompt) -> str:
+    """Текстовая часть промпта (строки или списка частей)"""
+    if isinstance(prompt, str):
+        return prompt
+    return "".join(part for part in prompt if isinstance(part, str))
+
+def prompt_images(prompt) -> list:
+    """Изображения в промпте"""
+    if isinstance(prompt, str):
+        return []
+    return [part for part in prompt if isinstance(part, GraphImage)]
@@ -0,0 +1,111 @@
+import logging
+from abc import ABC, abstractmethod
+from services import gemini_client
+from config import LLM_BACKEND, CASSETTE_MODE, GEMINI_MODEL
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class LLMBackend(ABC):
+    """
+    Модель, к которой обращается проверка работ.
+
+    Ответ generate_content и фрагменты stream_content - объекты с атрибутами
+    usage_metadata (candidates_token_count) и candidates (content.parts,
+    finish_reason), как у ответов google.generativeai; текст из них читает
+    candidate_text, длину ответа - output_token_count. Ошибки - исключения google.api_core,
+    чтобы повторы, пул ключей и предохранитель работали одинаково для всех моделей.
+    model_name - имя модели (None - основная модель GEMINI_MODEL). Промпт -
+    строка или список частей: строк и изображений GraphImage.
+
+    generate_content и stream_content обязательны: модель без одного из них
+    не создается (TypeError), а не падает посреди проверки.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        """Запрос к модели; возвращает ответ целиком"""
+
+    @abstractmethod
+    def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        """Потоковый запрос к модели: асинхронный генератор фрагментов ответа"""
+
+    def prepare_image(self, image) -> None:
+        """Начинает загрузку изображения заранее, до запросов с ним (по умолчанию - ничего)"""
+
+def candidate_text(response) -> str:
+    """
+    Текст ответа или фрагмента потока из частей первого кандидата; пустая
+    строка, если частей нет. В отличие от response.text не бросает ValueError
+    на фрагменте без текста или на ответе, обрезанном до начала текста.
+    """
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return ""
+    return "".join(part.text for part in candidates[0].content.parts)
+
+def output_token_count(response) -> int:
+    """
+    Выходные токены ответа вместе с токенами размышлений: у моделей с
+    размышлениями max_output_tokens ограничивает и их (0, если Gemini не
+    вернул usage_metadata).
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0
+    candidates = getattr(usage, "candidates_token_count", 0) or 0
+    thoughts = getattr(usage, "thoughts_token_count", None)
+    if thoughts is None:
+        # SDK 0.8.5 не знает поля thoughts_token_count, но размышления входят в total_token_count
+        total = getattr(usage, "total_token_count", 0) or 0
+        thoughts = max(total - (getattr(usage, "prompt_token_count", 0) or 0) - candidates, 0) if total else 0
+    return candidates + thoughts
+
+class GeminiBackend(LLMBackend):
+    """Gemini API через google.generativeai (пул ключей, кэш рубрик, ограничение параллельности)"""
+
+    name = "gemini"
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        return await gemini_client.generate_content(prompt, generation_config=generation_config,
+                                                    model_name=model_name or GEMINI_MODEL, template=template)
+
+    def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        return gemini_client.stream_content(prompt, generation_config=generation_config,
+                                            model_name=model_name or GEMINI_MODEL, template=template)
+
+    def prepare_image(self, image) -> None:
+        gemini_client.prefetch_image(image)
+
+# Глобальный экземпляр модели
+_backend = None
+
+def get_backend() -> LLMBackend:
+    """
+    Получает глобальный экземпляр модели, выбранной настройкой LLM_BACKEND
+    (gemini или fake); при CASSETTE_MODE=record/replay - с записью в кассету
+    или воспроизведением из нее.
+    """
+    global _backend
+    if _backend is None:
+        # fake_backend и cassette_backend сами импортируют этот модуль, поэтому импорт здесь
+        if CASSETTE_MODE == "replay":
+            from services.cassette_backend import CassetteBackend
+            _backend = CassetteBackend()
+        elif LLM_BACKEND == "fake":
+            from services.fake_backend import FakeBackend
+            _backend = FakeBackend()
+        else:
+            _backend = GeminiBackend()
+        if CASSETTE_MODE == "record":
+            from services.cassette_backend import CassetteBackend
+            _backend = CassetteBackend(_backend)
+        logger.info(f"Модель для проверки: {_backend.name}")
+    return _backend
+
+def set_backend(backend: LLMBackend) -> None:
+    """Подменяет модель для проверки (нагрузочные тесты, бенчмарки)"""
+    global _backend
+    _backend = backend
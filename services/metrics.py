@@ -0,0 +1,55 @@
+import time
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class Metrics:
+    """Счетчики событий бота в памяти процесса (сбрасываются при перезапуске)"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        # (имя счетчика, ((метка, значение), ...)) -> значение
+        self.counters = {}
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        """Увеличивает счетчик name с метками labels на amount"""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def get(self, name: str, **labels) -> float:
+        """Значение счетчика name с метками labels (0, если событий не было)"""
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def total(self, name: str) -> float:
+        """Сумма счетчика name по всем меткам"""
+        return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def snapshot(self) -> dict:
+        """Все счетчики в виде {"имя{метка=значение,...}": значение}"""
+        result = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            label_text = ",".join(f"{label}={label_value}" for label, label_value in labels)
+            result[f"{name}{{{label_text}}}" if label_text else name] = value
+        return result
+
+    def format_report(self) -> str:
+        """Текстовый отчет по счетчикам для администраторов"""
+        uptime_hours = (time.time() - self.started_at) / 3600
+        lines = [f"⏱ Время работы: {uptime_hours:.1f} ч"]
+        snapshot = self.snapshot()
+        if not snapshot:
+            lines.append("Событий пока не было")
+        for name, value in snapshot.items():
+            lines.append(f"• {name}: {value:g}")
+        return "\n".join(lines)
+
+# Глобальный экземпляр счетчиков
+_metrics = None
+
+def get_metrics() -> Metrics:
+    """Получает глобальный экземпляр счетчиков"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
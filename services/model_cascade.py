@@ -0,0 +1,111 @@
+import logging
+from collections import deque
+from services.metrics import get_metrics
+from services.prompt_registry import TASK_PROMPTS
+from utils.score_extraction import extract_score
+from config import GEMINI_CASCADE_BOUNDARY_SCORES
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Максимальный балл по критерию каждого промпта
+MAX_SCORES = {
+    "prompt1": 2,
+    "prompt2": 2,
+    "prompt3": 2,
+    "prompt38_1": 3,
+    "prompt38_2": 3,
+    "prompt38_3": 3,
+    "prompt38_4": 3,
+    "prompt38_5": 2,
+}
+
+# Ответ короче этого числа символов не может содержать разбор по рубрике
+MIN_RESPONSE_CHARS = 200
+
+# Причины перехода к основной модели
+ESCALATION_REASONS = {
+    "no_score": "балл не найден",
+    "boundary": "балл на границе",
+    "malformed": "ответ испорчен",
+    "error": "запрос не удался",
+}
+
+# Сколько последних замеров задержки хранить для каждой модели каскада
+LATENCY_SAMPLES = 500
+
+def escalation_reason(task_number: str, i: int, response_text: str):
+    """
+    Причина не принимать ответ быстрой модели по критерию i (ключ ESCALATION_REASONS)
+    или None, если ответ годится.
+    """
+    prompt_name = TASK_PROMPTS[task_number][i-1]
+    if len(response_text.strip()) < MIN_RESPONSE_CHARS:
+        return "malformed"
+    score, _ = extract_score(prompt_name, response_text)
+    if score is None:
+        return "no_score"
+    if score > MAX_SCORES.get(prompt_name, score):
+        return "malformed"
+    if score in GEMINI_CASCADE_BOUNDARY_SCORES:
+        return "boundary"
+    return None
+
+def _percentile(samples, p: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+class CascadeStats:
+    """
+    Статистика каскада моделей: сколько ответов быстрой модели принято,
+    сколько запросов ушло к основной модели и по каким причинам, задержки
+    каждой ступени.
+    """
+
+    def __init__(self):
+        self.requests = {"fast": 0, "strong": 0}
+        self.accepted = 0
+        self.escalations = {}
+        self.latencies = {"fast": deque(maxlen=LATENCY_SAMPLES), "strong": deque(maxlen=LATENCY_SAMPLES)}
+
+    def record(self, tier: str, latency: float, reason: str = None) -> None:
+        """
+        Учитывает запрос ступени tier (fast или strong); для быстрой модели
+        reason - причина перехода к основной (None - ответ принят).
+        """
+        metrics = get_metrics()
+        self.requests[tier] += 1
+        self.latencies[tier].append(latency)
+        metrics.increment("cascade_requests", tier=tier)
+        if tier != "fast":
+            return
+        if reason is None:
+            self.accepted += 1
+        else:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+            metrics.increment("cascade_escalations", reason=reason)
+
+    def stats(self) -> dict:
+        """Доля принятых ответов быстрой модели, переходы по причинам и задержки ступеней (p50/p95)"""
+        fast = self.requests["fast"]
+        return {
+            "fast_requests": fast,
+            "hit_rate": self.accepted / fast if fast else 0.0,
+            "escalations": dict(self.escalations),
+            "latency": {
+                tier: (_percentile(samples, 50), _percentile(samples, 95))
+                for tier, samples in self.latencies.items()
+            },
+        }
+
+# Глобальный экземпляр статистики каскада
+_cascade_stats = None
+
+def get_cascade_stats() -> CascadeStats:
+    """Получает глобальный экземпляр статистики каскада моделей"""
+    global _cascade_stats
+    if _cascade_stats is None:
+        _cascade_stats = CascadeStats()
+    return _cascade_stats
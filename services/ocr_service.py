@@ -1,11 +1,22 @@
 import aiohttp
 import aiofiles
 import os
+import hashlib
 import logging
+from services.cassette import cassette_call
 from config import OCR_API_KEY, OCR_API_URL
 
 logger = logging.getLogger(__name__)
 
+def _image_key(image_path):
+    """Ключ записи в кассете: содержимое изображения (имя временного файла меняется от раза к разу)"""
+    try:
+        with open(image_path, 'rb') as f:
+            return (hashlib.sha1(f.read()).hexdigest(),)
+    except OSError:
+        return (os.path.basename(image_path),)
+
+@cassette_call("ocr", key_func=_image_key)
 async def process_image_ocr(image_path):
     """Обработка изображения через OCR.space API с Engine 2"""
     try:
@@ -9,6 +9,9 @@ from yookassa import Configuration, Payment
 # Импортируем хранилище подписок из payment_callbacks
 from services.payment_callbacks import USER_SUBSCRIPTIONS, get_all_active_subscriptions
 
+# Запись и воспроизведение внешних вызовов
+from services.cassette import cassette_call
+
 # Импортируем конфигурацию YooKassa из config.py
 from config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
 
@@ -89,6 +92,11 @@ def format_subscription_message(subscription_data: Dict[str, Any]) -> str:
     else:
         return "Ваша подписка истекла"
 
+def _scrub_payment_link(url: str) -> str:
+    """Ссылка на оплату для кассеты: рабочая ссылка на платеж в файл не записывается"""
+    return "https://yookassa.ru/checkout/payment?cassette=1"
+
+@cassette_call("yookassa", scrub=_scrub_payment_link)
 async def create_payment_link(user_id: int, amount: float = 149.00) -> str:
     """
     Создаёт ссылку для оплаты через Юкассу.
@@ -0,0 +1,264 @@
+import os
+import re
+import hashlib
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = "prompts"
+# Общие фрагменты промптов (подключаются строкой {{include имя}} или {{include имя N}})
+FRAGMENTS_DIR = "fragments"
+
+# Промпты по критериям для каждого задания (в порядке критериев)
+TASK_PROMPTS = {
+    "37": ["prompt1", "prompt2", "prompt3"],
+    "38": ["prompt38_1", "prompt38_2", "prompt38_3", "prompt38_4", "prompt38_5"],
+}
+
+# Места в шаблонах, куда подставляются данные пользователя, и имена слотов
+PLACEHOLDERS = {
+    "[Текст задания из сообщения пользователя в телеграм]": "task_description",
+    "[Текст емейла из сообщения пользователя в телеграм]": "task_solution",
+    "[Текст описания графика из сообщения пользователя в телеграм]": "task_solution",
+    "[Распознанный текст графика]": "graph_info",
+}
+
+_PLACEHOLDER_RE = re.compile("|".join(re.escape(placeholder) for placeholder in PLACEHOLDERS))
+
+# Подключение фрагмента: {{include имя}} или {{include имя N}} - пункты "1. ", "2. " фрагмента
+# перенумеровываются начиная с N, чтобы фрагмент продолжал нумерованный список промпта
+_INCLUDE_RE = re.compile(r"\{\{include (\w+)(?: (\d+))?\}\}\n?")
+_NUMBERED_ITEM_RE = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+# Вступление и формат ответа для проверки всех критериев одним запросом
+SINGLE_CALL_HEADER = (
+    "Ниже приведены инструкции по проверке работы по каждому критерию ({total} критериев). "
+    "Проверь работу по всем критериям, для каждого критерия строго следуя его инструкции.\n\n"
+)
+# Раздел с фрагментами, общими для инструкций всех критериев (в них самих они опускаются)
+SINGLE_CALL_SHARED = "=== ОБЩИЕ ТРЕБОВАНИЯ К РАЗБОРУ ПО ВСЕМ КРИТЕРИЯМ ===\n\n{rules}\n\n"
+SINGLE_CALL_FOOTER = (
+    "\n\nВерни ответ строго в формате JSON. Для каждого критерия N (от 1 до {total}) заполни поле kN - "
+    "итоговый балл по критерию (целое число) и поле comment_kN - полный разбор работы по этому критерию "
+    "в том виде, который требует его инструкция, включая блок ИТОГОВАЯ ОЦЕНКА."
+)
+# Окончание шаблона для краткого разбора (упрощенная проверка под нагрузкой)
+SINGLE_CALL_BRIEF_FOOTER = (
+    "\n\nВерни ответ строго в формате JSON. Для каждого критерия N (от 1 до {total}) заполни поле kN - "
+    "итоговый балл по критерию (целое число) и поле comment_kN - краткий разбор по этому критерию: "
+    "2-3 предложения о главных ошибках и о том, за что снижен балл, без подробного анализа и цитат."
+)
+
+class PromptTemplate:
+    """Шаблон промпта, заранее разбитый на статические части и слоты"""
+
+    def __init__(self, name: str, path: str, text: str, mtime: float, source: str = None, fragments: tuple = ()):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.text = text
+        # Исходный текст файла с директивами {{include}} и подключенные фрагменты
+        self.source = source if source is not None else text
+        self.fragments = fragments
+        # Версия шаблона - короткий хэш содержимого
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+        # segments[i] - статический текст перед slots[i]; последний сегмент идет после всех слотов
+        self.segments = []
+        self.slots = []
+        position = 0
+        for match in _PLACEHOLDER_RE.finditer(text):
+            self.segments.append(text[position:match.start()])
+            self.slots.append(PLACEHOLDERS[match.group(0)])
+            position = match.end()
+        self.segments.append(text[position:])
+
+        # Статическая часть до первого слота (рубрика) - общий префикс всех запросов по шаблону
+        self.prefix = self.segments[0]
+
+    def render(self, **values) -> str:
+        """Подставляет значения слотов одним проходом (отсутствующие слоты заменяются пустой строкой)"""
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(values.get(slot, ""))
+            parts.append(segment)
+        return "".join(parts)
+
+class PromptRegistry:
+    """
+    Реестр шаблонов промптов: загружает все файлы один раз и перечитывает
+    файл только при изменении его mtime и содержимого.
+
+    Реестр кандидатов (новых версий промптов) задается каталогом кандидатов,
+    fallback_dir - каталогом текущих промптов, из которого берутся файлы,
+    которых среди кандидатов нет, и namespace - приставкой к именам шаблонов,
+    чтобы их кэш рубрик и статистика не смешивались с текущими.
+    """
+
+    def __init__(self, prompts_dir: str = PROMPTS_DIR, normalize: bool = True, fallback_dir: str = None,
+                 namespace: str = ""):
+        self.prompts_dir = prompts_dir
+        self.fallback_dir = fallback_dir
+        self.namespace = namespace
+        # Убирать ли из собранных промптов пробелы в концах строк и лишние пустые строки
+        self.normalize = normalize
+        self.templates = {}
+        # Шаблоны проверки одним запросом: (номер задания, краткий разбор) -> (версии исходных шаблонов, шаблон)
+        self.single_call_templates = {}
+
+    def _resolve(self, *parts: str) -> str:
+        path = os.path.join(self.prompts_dir, *parts)
+        if self.fallback_dir and not os.path.exists(path):
+            return os.path.join(self.fallback_dir, *parts)
+        return path
+
+    def _path(self, name: str) -> str:
+        return self._resolve(f"{name}.txt")
+
+    def _fragment_path(self, name: str) -> str:
+        return self._resolve(FRAGMENTS_DIR, f"{name}.txt")
+
+    def _read(self, path: str) -> str:
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def _mtime(self, name: str, fragments: tuple = ()) -> float:
+        """Время последнего изменения шаблона с учетом подключенных в нем фрагментов"""
+        return max([os.stat(self._path(name)).st_mtime] + [os.stat(self._fragment_path(fragment)).st_mtime for fragment in fragments])
+
+    def expand(self, source: str, omit: tuple = ()) -> str:
+        """
+        Собирает текст промпта: подставляет фрагменты вместо {{include}}
+        (фрагменты из omit опускаются) и, если включено normalize, убирает пробелы
+        в концах строк и лишние пустые строки - на смысл промпта они не влияют,
+        но стоят токенов.
+
+        Raises:
+            FileNotFoundError: если файла фрагмента нет
+        """
+        def include(match) -> str:
+            if match.group(1) in omit:
+                return ""
+            fragment = self._read(self._fragment_path(match.group(1))).strip("\n") + "\n"
+            if match.group(2):
+                shift = int(match.group(2)) - 1
+                fragment = _NUMBERED_ITEM_RE.sub(lambda item: f"{int(item.group(1)) + shift}. ", fragment)
+            return fragment
+
+        text = _INCLUDE_RE.sub(include, source)
+        if not self.normalize:
+            return text
+        text = "\n".join(line.rstrip() for line in text.split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", text).strip("\n")
+
+    def _load(self, name: str) -> PromptTemplate:
+        path = self._path(name)
+        source = self._read(path)
+        fragments = tuple(dict.fromkeys(match.group(1) for match in _INCLUDE_RE.finditer(source)))
+        template_name = f"{self.namespace}/{name}" if self.namespace else name
+        template = PromptTemplate(template_name, path, self.expand(source), self._mtime(name, fragments), source, fragments)
+        logger.info(
+            f"Загружен шаблон промпта {template.name} (версия {template.version}, {len(template.text)} символов, "
+            f"слотов: {len(template.slots)}, фрагментов: {len(fragments)})"
+        )
+        return template
+
+    def load_all(self) -> None:
+        """Загружает все шаблоны из каталога промптов (вызывается при старте бота)"""
+        for filename in sorted(os.listdir(self.prompts_dir)):
+            if filename.endswith(".txt"):
+                self.get(filename[:-4])
+        logger.info(f"Реестр промптов: загружено шаблонов - {len(self.templates)}")
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Возвращает шаблон промпта по имени файла (без .txt).
+
+        Raises:
+            FileNotFoundError: если файла шаблона нет
+        """
+        template = self.templates.get(name)
+        if template is not None and template.mtime == self._mtime(name, template.fragments):
+            return template
+
+        new_template = self._load(name)
+        if template is not None and template.version == new_template.version:
+            # Файлы "потрогали", но содержимое не изменилось - оставляем прежний шаблон
+            template.mtime = new_template.mtime
+            return template
+
+        if template is not None:
+            logger.info(f"Шаблон промпта {new_template.name} изменился: {template.version} -> {new_template.version}")
+        self.templates[name] = new_template
+        return new_template
+
+    def get_task_templates(self, task_number: str) -> list:
+        """Возвращает шаблоны по всем критериям задания в порядке критериев"""
+        return [self.get(name) for name in TASK_PROMPTS[task_number]]
+
+    def versions(self, task_number: str) -> dict:
+        """Версии шаблонов задания: {имя шаблона: версия}"""
+        return {template.name: template.version for template in self.get_task_templates(task_number)}
+
+    def get_single_call_template(self, task_number: str, brief: bool = False) -> PromptTemplate:
+        """
+        Возвращает шаблон для проверки всех критериев задания одним запросом
+        (brief - с кратким разбором вместо полного).
+
+        Шаблон собирается из рубрик по критериям (статических частей до первого слота),
+        за которыми один раз идут данные пользователя в разметке первого шаблона.
+        Фрагменты, подключенные в рубриках всех критериев, выносятся в общий раздел
+        и повторяются в запросе один раз, а не по разу на критерий.
+        Пересобирается при изменении любого из шаблонов по критериям.
+        """
+        templates = self.get_task_templates(task_number)
+        versions = tuple(template.version for template in templates)
+        cached = self.single_call_templates.get((task_number, brief))
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        total = len(templates)
+        parts = [SINGLE_CALL_HEADER.format(total=total)]
+        shared = self.shared_fragments(templates)
+        if shared:
+            # Пункты общих фрагментов нумеруются подряд
+            rules, start = [], 1
+            for fragment in shared:
+                rules.append(self.expand(f"{{{{include {fragment} {start}}}}}"))
+                start += len(_NUMBERED_ITEM_RE.findall(rules[-1]))
+            parts.append(SINGLE_CALL_SHARED.format(rules="\n".join(rules)))
+        for i, template in enumerate(templates, 1):
+            prefix = PromptTemplate(template.name, "", self.expand(template.source, omit=shared), 0).prefix
+            # Последняя строка рубрики - подпись к данным пользователя ("Боевое задание:"), она идет в конце один раз
+            rubric = prefix.rstrip().rsplit("\n", 1)[0]
+            parts.append(f"=== КРИТЕРИЙ {i} ===\n\n{rubric.strip()}\n\n")
+        first = templates[0]
+        label_start = first.prefix.rstrip().rfind("\n") + 1
+        parts.append(first.text[label_start:].rstrip())
+        parts.append((SINGLE_CALL_BRIEF_FOOTER if brief else SINGLE_CALL_FOOTER).format(total=total))
+
+        name = f"single_{task_number}_brief" if brief else f"single_{task_number}"
+        template = PromptTemplate(name, "", "".join(parts), 0)
+        self.single_call_templates[(task_number, brief)] = (versions, template)
+        logger.info(f"Собран шаблон проверки задания {task_number} одним запросом (версия {template.version}, {len(template.text)} символов)")
+        return template
+
+    def shared_fragments(self, templates: list) -> tuple:
+        """Фрагменты рубрик (без слотов), подключенные во всех шаблонах списка"""
+        shared = []
+        for fragment in templates[0].fragments:
+            if all(fragment in template.fragments for template in templates[1:]):
+                if not _PLACEHOLDER_RE.search(self._read(self._fragment_path(fragment))):
+                    shared.append(fragment)
+        return tuple(shared)
+
+# Глобальный экземпляр реестра
+_prompt_registry = None
+
+def get_prompt_registry() -> PromptRegistry:
+    """Получает глобальный экземпляр реестра промптов"""
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = PromptRegistry()
+    return _prompt_registry
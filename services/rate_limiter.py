@@ -0,0 +1,171 @@
+import time
+import asyncio
+import logging
+from config import (
+    GEMINI_API_KEYS, GEMINI_MODEL, GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT, GEMINI_FAST_MODEL,
+    GEMINI_FAST_RPM_LIMIT, GEMINI_FAST_TPM_LIMIT
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """
+    Ограничитель запросов к модели Gemini на весь процесс: два "ведра токенов" -
+    запросы в минуту (RPM) и оценка входных токенов в минуту (TPM).
+
+    Запросы, которым не хватает квоты, ждут в очереди в порядке поступления
+    (asyncio.Lock пропускает ожидающих по очереди), а не получают ошибку 429.
+    Лимит 0 отключает соответствующее ведро.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        # Ведра полны при старте: квоту минуты можно использовать сразу
+        self.available_requests = float(rpm)
+        self.available_tokens = float(tpm)
+        self.updated_at = time.monotonic()
+        # Пауза для всех запросов после ответа 429 от Gemini
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+        # Очередь: число ожидающих запросов и сумма их токенов
+        self.queue_depth = 0
+        self.queued_tokens = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.available_requests = min(self.rpm, self.available_requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.available_tokens = min(self.tpm, self.available_tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, requests: float, tokens: float) -> float:
+        """Сколько секунд ждать, пока в ведрах наберется квота на requests запросов и tokens токенов"""
+        wait = max(self.paused_until - time.monotonic(), 0.0)
+        if self.rpm and requests > self.available_requests:
+            wait = max(wait, (requests - self.available_requests) * 60 / self.rpm)
+        if self.tpm and tokens > self.available_tokens:
+            wait = max(wait, (tokens - self.available_tokens) * 60 / self.tpm)
+        return wait
+
+    def estimate_wait(self) -> float:
+        """Оценка ожидания для нового запроса с учетом всей очереди, в секундах"""
+        self._refill()
+        return self._wait_time(self.queue_depth + 1, self.queued_tokens)
+
+    async def acquire(self, tokens: int, status_callback=None) -> float:
+        """
+        Ждет квоту на один запрос с tokens входными токенами.
+
+        Args:
+            tokens: Оценка числа входных токенов запроса
+            status_callback: Функция для сообщения пользователю о месте в очереди
+
+        Returns:
+            float: Сколько секунд запрос провел в очереди
+        """
+        if not self.rpm and not self.tpm:
+            return 0.0
+
+        # Запрос больше всей минутной квоты иначе не прошел бы никогда
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        start = time.monotonic()
+        self.queue_depth += 1
+        self.queued_tokens += tokens
+        try:
+            wait = self.estimate_wait()
+            if status_callback and (self._lock.locked() or wait > 0):
+                await status_callback(
+                    f"⏳ Сейчас много проверок, твоя работа в очереди: запросов перед ней - {self.queue_depth - 1}, "
+                    f"ожидание около {max(wait, 1):.0f} с"
+                )
+
+            async with self._lock:
+                while True:
+                    self._refill()
+                    wait = self._wait_time(1, tokens)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                if self.rpm:
+                    self.available_requests -= 1
+                if self.tpm:
+                    self.available_tokens -= tokens
+        finally:
+            self.queue_depth -= 1
+            self.queued_tokens -= tokens
+
+        waited = time.monotonic() - start
+        if waited > 0.1:
+            logger.info(f"Запрос к Gemini ждал в очереди {waited:.1f} с (в очереди: {self.queue_depth})")
+        return waited
+
+    def try_acquire(self, tokens: int, requests: int = 1) -> bool:
+        """
+        Берет квоту на requests запросов с tokens входными токенами на всех, только
+        если она есть прямо сейчас и очередь пуста (без ожидания). Квота берется
+        целиком или не берется совсем.
+        """
+        if not self.rpm and not self.tpm:
+            return True
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        self._refill()
+        if self.queue_depth or self._lock.locked() or self._wait_time(requests, tokens) > 0:
+            return False
+        if self.rpm:
+            self.available_requests -= requests
+        if self.tpm:
+            self.available_tokens -= tokens
+        return True
+
+    def headroom(self) -> float:
+        """Доля свободной квоты минуты (меньшая из RPM и TPM); 0, пока есть очередь или пауза после 429"""
+        if not self.rpm and not self.tpm:
+            return 1.0
+        self._refill()
+        if self.queue_depth or self._lock.locked() or self.paused_until > time.monotonic():
+            return 0.0
+        shares = []
+        if self.rpm:
+            shares.append(self.available_requests / self.rpm)
+        if self.tpm:
+            shares.append(self.available_tokens / self.tpm)
+        return max(min(shares), 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает все запросы на seconds секунд (после ответа 429 от Gemini)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning(f"Квота Gemini исчерпана, запросы приостановлены на {seconds} с")
+
+    def stats(self) -> dict:
+        """Текущее состояние очереди и ведер"""
+        self._refill()
+        return {
+            "queue_depth": self.queue_depth,
+            "available_requests": int(self.available_requests),
+            "available_tokens": int(self.available_tokens),
+        }
+
+# Квоты моделей на один ключ: (RPM, TPM); у остальных моделей - квоты основной
+MODEL_LIMITS = {
+    GEMINI_FAST_MODEL: (GEMINI_FAST_RPM_LIMIT, GEMINI_FAST_TPM_LIMIT),
+    GEMINI_MODEL: (GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT),
+}
+
+# Глобальные ограничители по моделям: квоты Gemini у каждой модели свои
+_rate_limiters = {}
+
+def get_rate_limiter(model_name: str = None) -> RateLimiter:
+    """Получает глобальный ограничитель запросов к модели (по умолчанию - к основной GEMINI_MODEL)"""
+    model_name = model_name or GEMINI_MODEL
+    if model_name not in _rate_limiters:
+        rpm, tpm = MODEL_LIMITS.get(model_name, (GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT))
+        # Квоты задаются на ключ, общий лимит растет с числом ключей в пуле
+        _rate_limiters[model_name] = RateLimiter(rpm * len(GEMINI_API_KEYS), tpm * len(GEMINI_API_KEYS))
+    return _rate_limiters[model_name]
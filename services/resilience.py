@@ -0,0 +1,207 @@
+import time
+import logging
+from collections import deque
+from requests.exceptions import Timeout, ConnectionError
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import BlockedPromptException, StopCandidateException
+from config import (
+    GEMINI_RETRY_BUDGET, GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_DELAY, GEMINI_REQUEST_TIMEOUT,
+    GEMINI_BREAKER_ERROR_RATE, GEMINI_BREAKER_MIN_REQUESTS, GEMINI_BREAKER_WINDOW_SECONDS,
+    GEMINI_BREAKER_OPEN_SECONDS, GEMINI_MODEL
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько последних успешных запросов учитывать при расчете перцентиля задержки
+LATENCY_SAMPLES = 200
+# Минимум замеров, после которого задержка дублирования считается по перцентилю
+MIN_LATENCY_SAMPLES = 20
+
+class CircuitOpenError(Exception):
+    """Gemini временно считается недоступным: запросы не отправляются"""
+
+    def __init__(self, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(
+            f"Сервис проверки сейчас перегружен или недоступен. Попробуй отправить работу через {max(int(retry_in), 1)} с."
+        )
+
+# Типы ошибок Gemini
+RETRYABLE = "retryable"  # временный сбой: таймаут, 5xx, обрыв соединения
+FATAL = "fatal"          # повтор не поможет: блокировка безопасности, пустой ответ, неверный запрос
+QUOTA = "quota"          # 429: квота ключа исчерпана
+
+def classify_gemini_error(error: Exception) -> str:
+    """Определяет тип ошибки запроса к Gemini: RETRYABLE, FATAL или QUOTA"""
+    if isinstance(error, google_exceptions.TooManyRequests):
+        return QUOTA
+    # ServerError - все 5xx, включая DeadlineExceeded (504)
+    if isinstance(error, (Timeout, ConnectionError, TimeoutError, OSError, google_exceptions.ServerError)):
+        return RETRYABLE
+    # Остальные 4xx, блокировки промпта и ответа; ValueError - ответ без текста (check_response_text)
+    if isinstance(error, (google_exceptions.ClientError, BlockedPromptException, StopCandidateException, ValueError)):
+        return FATAL
+    return RETRYABLE
+
+class RetryBudget:
+    """
+    Бюджет повторных попыток на одну проверку работы, общий для всех ее
+    запросов к Gemini (по всем критериям).
+    """
+
+    def __init__(self, retries: int = GEMINI_RETRY_BUDGET):
+        self.retries = retries
+        self.used = 0
+        # Время, потерянное на неудачные попытки и паузы перед повтором
+        self.cost_seconds = 0.0
+
+    def take(self) -> bool:
+        """Берет одну повторную попытку из бюджета; False, если бюджет исчерпан"""
+        if self.used >= self.retries:
+            return False
+        self.used += 1
+        return True
+
+class LatencyTracker:
+    """Задержки последних успешных запросов к Gemini для выбора момента дублирования запроса"""
+
+    def __init__(self, percentile: float = GEMINI_HEDGE_PERCENTILE, min_delay: float = GEMINI_HEDGE_MIN_DELAY):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def value(self, percentile: float) -> float:
+        """Перцентиль задержки по последним замерам (None, если замеров мало)"""
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+    def hedge_delay(self) -> float:
+        """Через сколько секунд без ответа отправлять дублирующий запрос"""
+        latency = self.value(self.percentile)
+        if latency is None:
+            # Пока замеров мало, дублируем только очень долгие запросы
+            return max(self.min_delay, GEMINI_REQUEST_TIMEOUT / 2)
+        return max(self.min_delay, latency)
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self.samples),
+            "p50": self.value(50),
+            "p95": self.value(95),
+            "p99": self.value(99),
+            "hedge_delay": round(self.hedge_delay(), 1),
+        }
+
+class CircuitBreaker:
+    """
+    Предохранитель для запросов к одной модели Gemini.
+
+    closed - запросы идут как обычно; если за последние window секунд доля
+    ошибок превысила error_rate (при минимум min_requests запросах), переходит
+    в open - запросы сразу завершаются CircuitOpenError. Через open_seconds
+    пропускается один пробный запрос (half_open): успех закрывает предохранитель,
+    ошибка снова открывает его.
+    """
+
+    def __init__(self, error_rate: float = GEMINI_BREAKER_ERROR_RATE, min_requests: int = GEMINI_BREAKER_MIN_REQUESTS,
+                 window: float = GEMINI_BREAKER_WINDOW_SECONDS, open_seconds: float = GEMINI_BREAKER_OPEN_SECONDS,
+                 name: str = "Gemini"):
+        # Имя модели для логов
+        self.name = name
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        # (время, успех) по последним запросам
+        self.outcomes = deque()
+
+    def _trim(self, now: float) -> None:
+        while self.outcomes and self.outcomes[0][0] < now - self.window:
+            self.outcomes.popleft()
+
+    def check(self) -> None:
+        """
+        Проверяет, можно ли отправить запрос.
+
+        Raises:
+            CircuitOpenError: если предохранитель открыт
+        """
+        if self.state == "closed":
+            return
+        now = time.time()
+        retry_in = self.opened_at + self.open_seconds - now
+        if self.state == "open" and retry_in <= 0:
+            self.state = "half_open"
+            logger.info(f"Предохранитель {self.name}: пробный запрос")
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return
+        raise CircuitOpenError(max(retry_in, 1))
+
+    def record_success(self) -> None:
+        now = time.time()
+        if self.state != "closed":
+            logger.info(f"Предохранитель {self.name} закрыт: пробный запрос успешен")
+            self.state = "closed"
+            self.probe_in_flight = False
+            self.outcomes.clear()
+        self.outcomes.append((now, True))
+        self._trim(now)
+
+    def record_neutral(self) -> None:
+        """Запрос завершился без признаков сбоя Gemini (429, отмена): только освобождает пробный запрос"""
+        if self.state == "half_open":
+            self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        now = time.time()
+        if self.state == "half_open":
+            self._open(now, "пробный запрос завершился ошибкой")
+            return
+        self.outcomes.append((now, False))
+        self._trim(now)
+        failures = sum(1 for _, success in self.outcomes if not success)
+        if self.state == "closed" and len(self.outcomes) >= self.min_requests and failures / len(self.outcomes) >= self.error_rate:
+            self._open(now, f"ошибок {failures} из {len(self.outcomes)} за {self.window:.0f} с")
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.probe_in_flight = False
+        logger.error(f"Предохранитель {self.name} открыт на {self.open_seconds:.0f} с: {reason}")
+
+    def stats(self) -> dict:
+        self._trim(time.time())
+        return {
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "failures": sum(1 for _, success in self.outcomes if not success),
+        }
+
+# Глобальные экземпляры
+_latency_tracker = None
+# Предохранители по моделям: сбои одной модели не останавливают запросы к другой
+_circuit_breakers = {}
+
+def get_latency_tracker() -> LatencyTracker:
+    """Получает глобальный экземпляр статистики задержек Gemini"""
+    global _latency_tracker
+    if _latency_tracker is None:
+        _latency_tracker = LatencyTracker()
+    return _latency_tracker
+
+def get_circuit_breaker(model_name: str = None) -> CircuitBreaker:
+    """Получает глобальный предохранитель модели Gemini (по умолчанию - основной GEMINI_MODEL)"""
+    model_name = model_name or GEMINI_MODEL
+    if model_name not in _circuit_breakers:
+        _circuit_breakers[model_name] = CircuitBreaker(name=model_name)
+    return _circuit_breakers[model_name]
@@ -0,0 +1,195 @@
+import os
+import re
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import aiofiles
+from collections import OrderedDict
+from config import GRADING_CACHE_SIZE, GRADING_CACHE_TTL_HOURS, GRADING_CACHE_DIR, GRADING_CACHE_DISK_MAX_MB
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+_SPACES_RE = re.compile(r'[ \t\u00a0]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+# Как часто чистить дисковый уровень кэша (устаревшие записи и превышение размера), секунд
+DISK_SWEEP_INTERVAL = 600
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализует текст для ключа кэша: убирает лишние пробелы и пустые строки,
+    но сохраняет регистр и деление на абзацы (они влияют на оценку).
+    """
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+def make_cache_key(task_number: str, task_description: str, task_solution: str,
+                   graph: str, template_versions: dict, model_name: str = "") -> str:
+    """
+    Строит ключ кэша по содержимому работы и версиям шаблонов промптов
+    (graph - распознанный текст графика или хэш изображения, см. graph_fingerprint)
+    """
+    material = json.dumps({
+        "task_number": task_number,
+        "task_description": normalize_text(task_description),
+        "task_solution": normalize_text(task_solution),
+        # Имя поля прежнее, чтобы ключи записей дискового кэша не изменились
+        "graph_ocr_text": normalize_text(graph),
+        "templates": template_versions,
+        "model": model_name,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class GradingResultCache:
+    """
+    Кэш результатов проверки: LRU в памяти и, опционально, файлы на диске.
+    Записи старше TTL считаются устаревшими и удаляются при обращении.
+    Дисковый уровень раз в DISK_SWEEP_INTERVAL секунд очищается в фоне:
+    удаляются устаревшие файлы и, если каталог больше max_disk_bytes, самые
+    старые записи. Каждое обращение получает свою копию результата.
+    """
+
+    def __init__(self, max_entries: int = GRADING_CACHE_SIZE, ttl_seconds: float = GRADING_CACHE_TTL_HOURS * 3600,
+                 cache_dir: str = GRADING_CACHE_DIR, max_disk_bytes: int = int(GRADING_CACHE_DISK_MAX_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir or None
+        self.max_disk_bytes = max_disk_bytes
+        self.last_sweep = 0.0
+        self._sweep_task = None
+        self.entries = OrderedDict()  # key -> (created_at, result)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, result: tuple) -> None:
+        self.entries[key] = (created_at, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, key: str):
+        """Возвращает сохраненный результат проверки или None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            created_at, result = entry
+            if not self._is_expired(created_at):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(result)
+            del self.entries[key]
+
+        if self.cache_dir:
+            result = await self._read_disk(key)
+            if result is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                return copy.deepcopy(result)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: tuple) -> None:
+        """Сохраняет результат проверки"""
+        created_at = time.time()
+        # Вызывающий код может дальше изменять extra_info результата
+        self._remember(key, created_at, copy.deepcopy(result))
+
+        if self.cache_dir:
+            try:
+                async with aiofiles.open(self._disk_path(key), "w", encoding="utf-8") as file:
+                    await file.write(json.dumps({"created_at": created_at, "result": list(result)}, ensure_ascii=False))
+            except Exception as e:
+                logger.error(f"Ошибка при записи результата в дисковый кэш: {e}")
+            if created_at - self.last_sweep >= DISK_SWEEP_INTERVAL and (self._sweep_task is None or self._sweep_task.done()):
+                self.last_sweep = created_at
+                self._sweep_task = asyncio.create_task(asyncio.to_thread(self.sweep_disk))
+
+    def sweep_disk(self) -> int:
+        """
+        Удаляет из каталога кэша устаревшие записи и, пока каталог больше
+        max_disk_bytes, самые старые. Возвращает число удаленных файлов.
+        """
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            # Время записи файла совпадает со временем сохранения результата
+            if not self._is_expired(mtime) and total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"Из дискового кэша результатов удалено записей: {removed}, размер каталога: {total // 1024} КБ")
+        return removed
+
+    async def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as file:
+                data = json.loads(await file.read())
+        except Exception as e:
+            logger.error(f"Ошибка при чтении результата из дискового кэша: {e}")
+            return None
+
+        created_at = data.get("created_at", 0)
+        if self._is_expired(created_at):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        result = tuple(data["result"])
+        self._remember(key, created_at, result)
+        return result
+
+    def stats(self) -> dict:
+        """Статистика кэша: попадания, промахи, размер"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self.entries),
+        }
+
+# Глобальный экземпляр кэша
+_result_cache = None
+
+def get_result_cache() -> GradingResultCache:
+    """Получает глобальный экземпляр кэша результатов проверки"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = GradingResultCache()
+    return _result_cache
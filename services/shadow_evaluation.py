@@ -0,0 +1,285 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from services.llm_backend import get_backend, candidate_text, output_token_count
+from services.prompt_registry import PromptRegistry, get_prompt_registry, PROMPTS_DIR, TASK_PROMPTS
+from services.graph_image import prompt_text, prompt_images, IMAGE_TOKENS
+from services.metrics import get_metrics
+from services.rate_limiter import get_rate_limiter
+from services.resilience import get_circuit_breaker, CircuitOpenError
+from services.token_budget import percentile
+from utils.score_extraction import extract_score
+from utils.text_utils import estimate_tokens
+from config import (
+    SHADOW_SAMPLE_RATE, SHADOW_PROMPTS_DIR, SHADOW_MAX_CONCURRENCY, SHADOW_MIN_HEADROOM, GEMINI_REQUEST_TIMEOUT
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сравниваемые версии промптов: текущие и кандидаты
+SIDES = ("live", "candidate")
+SIDE_TITLES = {"live": "текущий", "candidate": "кандидат"}
+
+# Сколько последних замеров хранить по каждому промпту
+SHADOW_SAMPLES = 1000
+# Сколько работ может ждать теневой проверки на один разрешенный одновременный запрос
+PENDING_PER_REQUEST = 4
+
+class PromptComparison:
+    """Замеры текущей версии промпта и кандидата по одному критерию"""
+
+    def __init__(self):
+        self.changed = False
+        self.latencies = {side: deque(maxlen=SHADOW_SAMPLES) for side in SIDES}
+        self.input_tokens = {side: deque(maxlen=SHADOW_SAMPLES) for side in SIDES}
+        self.output_tokens = {side: deque(maxlen=SHADOW_SAMPLES) for side in SIDES}
+        self.responses = {side: 0 for side in SIDES}
+        self.extracted = {side: 0 for side in SIDES}
+        self.errors = {side: 0 for side in SIDES}
+        # Сравнение с баллом, выставленным пользователю: [сравнено, совпало, отличается не больше чем на 1, сумма разниц]
+        self.agreement = {side: [0, 0, 0, 0] for side in SIDES}
+
+    def record(self, side: str, latency: float, input_tokens: int, output_tokens: int, score, live_score) -> None:
+        """Учитывает ответ; score - извлеченный балл (None - не найден), live_score - балл проверки пользователя"""
+        self.responses[side] += 1
+        self.latencies[side].append(latency)
+        self.input_tokens[side].append(input_tokens)
+        self.output_tokens[side].append(output_tokens)
+        if score is None:
+            return
+        self.extracted[side] += 1
+        if live_score is not None:
+            agreement = self.agreement[side]
+            agreement[0] += 1
+            agreement[1] += score == live_score
+            agreement[2] += abs(score - live_score) <= 1
+            agreement[3] += score - live_score
+
+    def record_error(self, side: str) -> None:
+        self.errors[side] += 1
+
+    def stats(self) -> dict:
+        """По каждой версии: задержка и токены (p50/p95), доля извлеченных баллов и совпадение с проверкой"""
+        result = {"changed": self.changed}
+        for side in SIDES:
+            responses = self.responses[side]
+            compared, exact, within_one, diff = self.agreement[side]
+            result[side] = {
+                "responses": responses,
+                "errors": self.errors[side],
+                "latency": (percentile(self.latencies[side], 50), percentile(self.latencies[side], 95)),
+                "input_tokens": percentile(self.input_tokens[side], 50),
+                "output_tokens": (percentile(self.output_tokens[side], 50), percentile(self.output_tokens[side], 95)),
+                "extraction_rate": self.extracted[side] / responses if responses else None,
+                "compared": compared,
+                "agreement": exact / compared if compared else None,
+                "within_one": within_one / compared if compared else None,
+                "mean_diff": diff / compared if compared else None,
+            }
+        return result
+
+class ShadowEvaluator:
+    """
+    Теневая проверка новых версий промптов на реальных работах.
+
+    Доля sample_rate проверок после ответа пользователю проверяется в фоне
+    еще раз по каждому критерию: промптом-кандидатом из prompts_dir и, в те
+    же моменты и с теми же параметрами, текущим промптом. Поэтому задержка и
+    токены сравниваются в одинаковых условиях, а совпадение текущего промпта
+    с баллом пользователя показывает, насколько модель расходится сама с
+    собой - от этого уровня и стоит отсчитывать совпадение кандидата.
+
+    Теневые запросы не мешают пользователям: идет не больше max_concurrency
+    запросов одновременно (ждут проверки не больше PENDING_PER_REQUEST работ
+    на запрос, остальные выборки пропускаются), работа берется в выборку, только
+    если свободно не меньше min_headroom минутной квоты Gemini, квота на пару
+    запросов берется сразу на оба и только свободная (без очереди), а при
+    открытом предохранителе критерий не проверяется.
+    Повторов и дублирования нет, на предохранитель и лимиты токенов теневые
+    запросы не влияют.
+    """
+
+    def __init__(self, prompts_dir: str = SHADOW_PROMPTS_DIR, sample_rate: float = SHADOW_SAMPLE_RATE,
+                 max_concurrency: int = SHADOW_MAX_CONCURRENCY, timeout: float = GEMINI_REQUEST_TIMEOUT,
+                 seed: int = None, min_headroom: float = SHADOW_MIN_HEADROOM):
+        self.prompts_dir = prompts_dir
+        self.sample_rate = sample_rate
+        self.min_headroom = min_headroom
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.enabled = sample_rate > 0 and os.path.isdir(prompts_dir)
+        if sample_rate > 0 and not self.enabled:
+            logger.warning(f"Теневая проверка выключена: нет каталога промптов-кандидатов {prompts_dir}")
+        self.registry = PromptRegistry(prompts_dir, fallback_dir=PROMPTS_DIR, namespace="candidate")
+        self.random = random.Random(seed)
+        # Запросы идут парами (текущий промпт и кандидат одновременно)
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency // 2))
+        self.tasks = set()
+        # Имя промпта -> PromptComparison
+        self.comparisons = {}
+        # Итог выборок: evaluated, busy, headroom, error; пропущенные критерии: quota, breaker
+        self.checks = {}
+
+    def _count(self, result: str) -> None:
+        self.checks[result] = self.checks.get(result, 0) + 1
+        get_metrics().increment("shadow_checks", result=result)
+
+    def submit(self, task_number: str, values: dict, image, generation_config: dict, live_scores: dict) -> bool:
+        """
+        Отправляет проверенную работу на теневую проверку (с вероятностью sample_rate).
+
+        Args:
+            values: Значения слотов шаблонов (gemini_service.prompt_values)
+            image: Изображение графика, прикладываемое к промптам (или None)
+            generation_config: Параметры генерации проверки
+            live_scores: Баллы, выставленные пользователю, {номер критерия: балл}
+
+        Returns:
+            bool: Запущена ли теневая проверка
+        """
+        if not self.enabled or task_number not in TASK_PROMPTS or self.random.random() >= self.sample_rate:
+            return False
+        if len(self.tasks) >= self.max_concurrency * PENDING_PER_REQUEST:
+            self._count("busy")
+            return False
+        # Квота нужнее пользователям: под нагрузкой теневая проверка не запускается
+        if get_rate_limiter().headroom() < self.min_headroom:
+            self._count("headroom")
+            return False
+        task = asyncio.create_task(self._evaluate(task_number, values, image, generation_config, live_scores))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def _evaluate(self, task_number: str, values: dict, image, generation_config: dict, live_scores: dict) -> None:
+        try:
+            live_templates = get_prompt_registry().get_task_templates(task_number)
+            candidate_templates = self.registry.get_task_templates(task_number)
+        except FileNotFoundError as e:
+            logger.error(f"Теневая проверка задания {task_number} невозможна: нет файла {e.filename}")
+            self._count("error")
+            return
+
+        scores = await asyncio.gather(*(
+            self._compare(task_number, i, live_templates[i-1], candidate_templates[i-1],
+                          values, image, generation_config, live_scores.get(i))
+            for i in range(1, len(live_templates) + 1)
+        ))
+        self._count("evaluated")
+        logger.info(
+            f"Теневая проверка задания {task_number}: баллы пользователя {[live_scores.get(i) for i in range(1, len(scores) + 1)]}, "
+            f"текущие промпты {[pair[0] for pair in scores]}, кандидаты {[pair[1] for pair in scores]}"
+        )
+
+    async def _compare(self, task_number: str, i: int, live_template, candidate_template, values: dict, image,
+                       generation_config: dict, live_score) -> tuple:
+        """Проверяет критерий текущим промптом и кандидатом одновременно; возвращает их баллы"""
+        prompt_name = TASK_PROMPTS[task_number][i-1]
+        comparison = self.comparisons.setdefault(prompt_name, PromptComparison())
+        comparison.changed = live_template.version != candidate_template.version
+        prompts = {}
+        for side, template in (("live", live_template), ("candidate", candidate_template)):
+            prompt = template.render(**values)
+            prompts[side] = [prompt, image] if image is not None else prompt
+
+        async with self.semaphore:
+            try:
+                get_circuit_breaker().check()
+            except CircuitOpenError:
+                self._count("breaker")
+                return None, None
+            limiter = get_rate_limiter()
+            tokens = {side: estimate_tokens(prompt_text(prompt)) + IMAGE_TOKENS * len(prompt_images(prompt))
+                      for side, prompt in prompts.items()}
+            # Квота на пару берется сразу: иначе без второго запроса зря пропала бы квота первого
+            if not limiter.try_acquire(tokens["live"] + tokens["candidate"], requests=2):
+                self._count("quota")
+                return None, None
+            return tuple(await asyncio.gather(
+                self._request(comparison, "live", prompt_name, prompts["live"], live_template, tokens["live"],
+                              generation_config, live_score),
+                self._request(comparison, "candidate", prompt_name, prompts["candidate"], candidate_template,
+                              tokens["candidate"], generation_config, live_score),
+            ))
+
+    async def _request(self, comparison: PromptComparison, side: str, prompt_name: str, prompt, template,
+                       tokens: int, generation_config: dict, live_score):
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.timeout):
+                response = await get_backend().generate_content(prompt, generation_config, template=template)
+            response_text = candidate_text(response)
+        except Exception as e:
+            comparison.record_error(side)
+            get_metrics().increment("shadow_errors", side=side, error=type(e).__name__)
+            logger.warning(f"Теневой запрос ({prompt_name}, {SIDE_TITLES[side]}) не удался: {type(e).__name__}: {e}")
+            return None
+        latency = time.monotonic() - start
+
+        output_tokens = output_token_count(response) or estimate_tokens(response_text)
+        score, _ = extract_score(prompt_name, response_text)
+        comparison.record(side, latency, tokens, output_tokens, score, live_score)
+        get_metrics().increment("shadow_requests", side=side)
+        return score
+
+    def stats(self) -> dict:
+        """Итоги выборок и сравнение версий по промптам (PromptComparison.stats)"""
+        return {
+            "enabled": self.enabled,
+            "checks": dict(self.checks),
+            "running": len(self.tasks),
+            "prompts": {name: comparison.stats() for name, comparison in sorted(self.comparisons.items())},
+        }
+
+    def format_report(self, time_scale: float = 1.0) -> str:
+        """Отчет сравнения для администратора: по каждому промпту текущая версия -> кандидат"""
+        stats = self.stats()
+        if not stats["enabled"]:
+            return f"Теневая проверка выключена (SHADOW_SAMPLE_RATE={self.sample_rate}, каталог {self.prompts_dir})"
+        checks = stats["checks"]
+        lines = [
+            f"Кандидаты: {self.prompts_dir}, выборка {self.sample_rate:.0%}, выполняется {stats['running']}",
+            f"Работ сравнено {checks.get('evaluated', 0)}, пропущено: занято {checks.get('busy', 0)}, "
+            f"мало свободной квоты {checks.get('headroom', 0)}, ошибок {checks.get('error', 0)}; "
+            f"критериев без свободной квоты {checks.get('quota', 0)}, при открытом предохранителе {checks.get('breaker', 0)}",
+        ]
+
+        def pair(values: dict, key: str, format_value) -> str:
+            return " → ".join(format_value(values[side][key]) for side in SIDES)
+
+        def share(value) -> str:
+            return "—" if value is None else f"{value:.0%}"
+
+        def seconds(value) -> str:
+            return "—" if value[0] is None else f"{value[0] / time_scale:.1f}/{value[1] / time_scale:.1f} с"
+
+        def tokens(value) -> str:
+            return "—" if value is None or value[0] is None else f"{value[0]}/{value[1]}"
+
+        for name, values in stats["prompts"].items():
+            lines.append(f"• {name}{'' if values['changed'] else ' (без изменений)'}: ответов {pair(values, 'responses', str)}, ошибок {pair(values, 'errors', str)}")
+            lines.append(f"   задержка p50/p95: {pair(values, 'latency', seconds)}")
+            lines.append(f"   токены: вход {pair(values, 'input_tokens', lambda value: '—' if value is None else str(value))}, "
+                         f"выход p50/p95 {pair(values, 'output_tokens', tokens)}")
+            lines.append(f"   балл извлечен: {pair(values, 'extraction_rate', share)}")
+            candidate = values["candidate"]
+            shift = "" if candidate["mean_diff"] is None else f", сдвиг кандидата {candidate['mean_diff']:+.2f}"
+            lines.append(
+                f"   совпадение с баллом пользователя: {pair(values, 'agreement', share)} "
+                f"(±1: {pair(values, 'within_one', share)}){shift}"
+            )
+        return "\n".join(lines)
+
+# Глобальный экземпляр теневой проверки
+_shadow_evaluator = None
+
+def get_shadow_evaluator() -> ShadowEvaluator:
+    """Получает глобальный экземпляр теневой проверки промптов"""
+    global _shadow_evaluator
+    if _shadow_evaluator is None:
+        _shadow_evaluator = ShadowEvaluator()
+    return _shadow_evaluator
@@ -0,0 +1,174 @@
+import re
+import random
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from config import NEAR_DUPLICATE_MAX_ENTRIES, NEAR_DUPLICATE_THRESHOLD
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры MinHash/LSH: 64 хэш-функции, 8 полос по 8 строк.
+# Порог срабатывания LSH ~ (1/8)^(1/8) = 0.77: работу со сходством 0.95 LSH пропускает
+# с вероятностью (1 - 0.95^8)^8 < 0.0002. Кандидаты сверяются по точному коэффициенту Жаккара
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Ограничение длины корзины: при массовом списывании хватает самых свежих работ
+MAX_BUCKET_SIZE = 64
+
+_PRIME = 4294967311  # простое число больше 2^32
+_MASK = 0xFFFFFFFF
+_rng = random.Random(37_38)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD_RE = re.compile(r'\w+')
+
+def task_variant(task_number: str, task_description: str) -> str:
+    """Идентификатор варианта задания: работы сравниваются только внутри одного варианта"""
+    normalized = " ".join(_WORD_RE.findall(task_description.lower()))
+    return f"{task_number}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]}"
+
+def _stable_hash(shingle: str) -> int:
+    # Встроенный hash() строк рандомизирован между запусками, blake2b дает одинаковый результат всегда
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+def shingle_hashes(text: str) -> array:
+    """Отсортированные 32-битные хэши словесных шинглов текста"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return array("I", sorted({_stable_hash(shingle) for shingle in shingles}))
+
+def minhash_signature(shingles: array) -> array:
+    """MinHash-сигнатура по хэшам шинглов (NUM_PERM 32-битных значений)"""
+    return array("I", (min((a * h + b) % _PRIME for h in shingles) & _MASK for a, b in _PERMUTATIONS))
+
+def solution_fingerprint(text: str) -> tuple:
+    """
+    Хэши шинглов и MinHash-сигнатура текста работы (shingles, signature).
+    Расчет занимает несколько миллисекунд процессора - вызывать через asyncio.to_thread.
+    """
+    shingles = shingle_hashes(text)
+    return shingles, minhash_signature(shingles)
+
+def jaccard_similarity(first: array, second: array) -> float:
+    """Точный коэффициент Жаккара по хэшам шинглов"""
+    first, second = set(first), set(second)
+    union = len(first | second)
+    return len(first & second) / union if union else 1.0
+
+class NearDuplicateIndex:
+    """
+    LSH-индекс MinHash-сигнатур ранее проверенных работ.
+
+    LSH по сигнатурам отбирает кандидатов, а решение принимается по точному
+    коэффициенту Жаккара: оценка по сигнатуре при пороге 0.95 заметную долю
+    копий с одним измененным словом пропускала бы. На каждую работу хранятся
+    хэши шинглов (около 1 КБ), ключи полос и ключ результата в кэше; при
+    превышении max_entries вытесняются самые давние записи.
+    """
+
+    def __init__(self, max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict()  # entry_id -> (variant, band_keys, shingles, result_key)
+        # band_key -> entry_id или список entry_id: у большинства корзин одна запись,
+        # и хранение числа вместо списка заметно экономит память
+        self.buckets = {}
+        self.next_id = 0
+        self.lookups = 0
+        self.matches = 0
+
+    @staticmethod
+    def _band_keys(variant: str, signature: array) -> array:
+        # Ключи корзин нужны только внутри процесса, поэтому здесь достаточно hash()
+        return array("q", (hash((variant, band, tuple(signature[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)))
+
+    def add(self, variant: str, signature: array, shingles: array, result_key: str) -> None:
+        """Добавляет проверенную работу в индекс"""
+        entry_id = self.next_id
+        self.next_id += 1
+        band_keys = self._band_keys(variant, signature)
+        self.entries[entry_id] = (variant, band_keys, shingles, result_key)
+        for band_key in band_keys:
+            bucket = self.buckets.get(band_key)
+            if bucket is None:
+                self.buckets[band_key] = entry_id
+            elif isinstance(bucket, int):
+                self.buckets[band_key] = [bucket, entry_id]
+            else:
+                bucket.append(entry_id)
+                if len(bucket) > MAX_BUCKET_SIZE:
+                    del bucket[0]
+
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, (_, band_keys, _, _) = self.entries.popitem(last=False)
+        for band_key in band_keys:
+            bucket = self.buckets.get(band_key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, int):
+                if bucket == entry_id:
+                    del self.buckets[band_key]
+                continue
+            if entry_id in bucket:
+                bucket.remove(entry_id)
+            if len(bucket) == 1:
+                self.buckets[band_key] = bucket[0]
+
+    def find(self, variant: str, signature: array, shingles: array):
+        """
+        Ищет наиболее похожую ранее проверенную работу того же варианта.
+
+        Returns:
+            tuple: (result_key, similarity) или None, если сходство ниже порога
+        """
+        self.lookups += 1
+        best_key, best_similarity = None, 0.0
+        seen = set()
+        for band_key in self._band_keys(variant, signature):
+            bucket = self.buckets.get(band_key, ())
+            if isinstance(bucket, int):
+                bucket = (bucket,)
+            for entry_id in bucket:
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry_variant, _, entry_shingles, result_key = self.entries[entry_id]
+                if entry_variant != variant:
+                    continue
+                similarity = jaccard_similarity(shingles, entry_shingles)
+                if similarity > best_similarity:
+                    best_key, best_similarity = result_key, similarity
+
+        if best_key is None or best_similarity < self.threshold:
+            return None
+        self.matches += 1
+        return best_key, best_similarity
+
+    def stats(self) -> dict:
+        """Статистика индекса: размер, число поисков и найденных совпадений"""
+        return {
+            "size": len(self.entries),
+            "buckets": len(self.buckets),
+            "lookups": self.lookups,
+            "matches": self.matches,
+        }
+
+# Глобальный экземпляр индекса
+_near_duplicate_index = None
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """Получает глобальный экземпляр индекса похожих работ"""
+    global _near_duplicate_index
+    if _near_duplicate_index is None:
+        _near_duplicate_index = NearDuplicateIndex()
+    return _near_duplicate_index
@@ -0,0 +1,158 @@
+import re
+import time
+import difflib
+import logging
+from collections import OrderedDict
+from services.result_cache import normalize_text
+from services.graph_image import graph_fingerprint
+from config import INCREMENTAL_REGRADE_THRESHOLD, SUBMISSION_HISTORY_SIZE, SUBMISSION_HISTORY_TTL_HOURS
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Что оценивает каждый критерий задания: content - содержание (любая правка может добавить
+# или убрать аспект), structure - организация текста, language - языковое оформление
+# (любая правка может исправить или добавить ошибку)
+CRITERION_SCOPES = {
+    "37": ["content", "structure", "language"],
+    "38": ["content", "structure", "language", "language", "language"],
+}
+
+_WORD_RE = re.compile(r"\w+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+class SolutionDiff:
+    """Отличия новой версии решения от прежней"""
+
+    def __init__(self, old_solution: str, new_solution: str):
+        old_text = normalize_text(old_solution)
+        new_text = normalize_text(new_solution)
+        # Правки только в пробелах и пустых строках
+        self.identical = old_text == new_text
+        # Изменен сам текст, а не только пробелы и деление на строки и абзацы
+        self.text_changed = _WHITESPACE_RE.sub(" ", old_text) != _WHITESPACE_RE.sub(" ", new_text)
+
+        # Доля измененных слов (без учета регистра и пунктуации) - насколько затронуто содержание
+        old_words = _WORD_RE.findall(old_text.lower())
+        new_words = _WORD_RE.findall(new_text.lower())
+        matcher = difflib.SequenceMatcher(None, old_words, new_words, autojunk=False)
+        self.changed_words = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+        self.changed_ratio = self.changed_words / max(len(old_words), len(new_words), 1)
+        # Деление на абзацы (организация текста)
+        self.paragraphs_changed = self._paragraphs(old_text) != self._paragraphs(new_text)
+
+    @staticmethod
+    def _paragraphs(text: str) -> int:
+        return sum(1 for line in text.split("\n") if line.strip())
+
+    def affects(self, scope: str, threshold: float = INCREMENTAL_REGRADE_THRESHOLD) -> bool:
+        """
+        Затрагивают ли правки критерии с данной областью оценки. Содержание и
+        язык перепроверяются при любой правке текста (даже одно слово может
+        раскрыть аспект или исправить ошибку), организация текста - при
+        изменении деления на абзацы или доли слов больше threshold.
+        """
+        if scope == "structure":
+            return self.paragraphs_changed or self.changed_ratio > threshold
+        return self.text_changed
+
+class SubmissionHistory:
+    """
+    Последние проверенные отправки пользователей по заданиям (LRU в памяти):
+    по ним повторная отправка исправленной работы перепроверяется только
+    по критериям, которые затронули правки.
+    """
+
+    def __init__(self, max_entries: int = SUBMISSION_HISTORY_SIZE, ttl_seconds: float = SUBMISSION_HISTORY_TTL_HOURS * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (user_id, task_number) -> запись о последней проверке
+        self.entries = OrderedDict()
+
+    def get(self, user_id, task_number: str):
+        """Возвращает запись о последней проверке пользователя по заданию или None"""
+        key = (user_id, task_number)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            del self.entries[key]
+            return None
+        return entry
+
+    def record(self, user_id, user_data: dict, template_versions: dict, scores: list, responses: list, usable: list) -> None:
+        """
+        Сохраняет результат проверки.
+
+        Args:
+            usable: Номера критериев (с 1), результат которых можно переиспользовать
+                    (без ошибок и пропусков)
+        """
+        key = (user_id, user_data['task_number'])
+        self.entries[key] = {
+            "created_at": time.time(),
+            "task_description": normalize_text(user_data['task_description']),
+            "graph": normalize_text(graph_fingerprint(user_data)),
+            "task_solution": user_data['task_solution'],
+            "templates": dict(template_versions),
+            "scores": list(scores),
+            "responses": list(responses),
+            "usable": set(usable),
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def plan_regrade(self, user_id, user_data: dict, template_versions: dict):
+        """
+        Сравнивает работу с прошлой отправкой пользователя по тому же заданию.
+
+        Returns:
+            tuple: (reuse, diff) - {номер критерия: (балл, разбор)} для критериев,
+                   которые правки не затронули, и отличия решений; None, если
+                   сравнивать не с чем (нет прошлой отправки, изменились задание,
+                   график или промпты)
+        """
+        task_number = user_data['task_number']
+        previous = self.get(user_id, task_number)
+        if previous is None or task_number not in CRITERION_SCOPES:
+            return None
+        if (previous["task_description"] != normalize_text(user_data['task_description'])
+                or previous["graph"] != normalize_text(graph_fingerprint(user_data))
+                or previous["templates"] != template_versions):
+            return None
+
+        diff = SolutionDiff(previous["task_solution"], user_data['task_solution'])
+        reuse = {}
+        for i, scope in enumerate(CRITERION_SCOPES[task_number], 1):
+            if i in previous["usable"] and not diff.affects(scope):
+                reuse[i] = (previous["scores"][i-1], previous["responses"][i-1])
+        logger.info(
+            f"Работа по заданию №{task_number} сравнена с прошлой отправкой: изменено слов {diff.changed_words} "
+            f"({diff.changed_ratio:.0%}), абзацы {'изменены' if diff.paragraphs_changed else 'без изменений'}; "
+            f"без перепроверки критерии {sorted(reuse) or 'нет'}"
+        )
+        return reuse, diff
+
+def format_regrade_notice(total: int, reuse: dict) -> str:
+    """Сообщение о том, какие критерии перепроверены после правок, а какие взяты из прошлой проверки"""
+    rechecked = [i for i in range(1, total + 1) if i not in reuse]
+    if not reuse:
+        return "♻️ Работа сравнена с твоей прошлой отправкой: правки затронули все критерии, поэтому она проверена заново полностью.\n\n"
+    if not rechecked:
+        return "♻️ Текст не изменился с прошлой отправки, поэтому использованы оценки прошлой проверки.\n\n"
+    kept = ", ".join(str(i) for i in sorted(reuse))
+    return (
+        f"♻️ Работа сравнена с твоей прошлой отправкой. Перепроверены критерии: {', '.join(str(i) for i in rechecked)}. "
+        f"Правки не затронули критерии {kept}, поэтому оценки и разбор по ним взяты из прошлой проверки.\n\n"
+    )
+
+# Глобальный экземпляр истории отправок
+_submission_history = None
+
+def get_submission_history() -> SubmissionHistory:
+    """Получает глобальный экземпляр истории отправок"""
+    global _submission_history
+    if _submission_history is None:
+        _submission_history = SubmissionHistory()
+    return _submission_history
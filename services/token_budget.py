@@ -0,0 +1,89 @@
+import math
+import logging
+from collections import deque
+from config import (
+    GEMINI_MAX_OUTPUT_TOKENS, GEMINI_TOKEN_BUDGETS, GEMINI_TOKEN_BUDGET_PERCENTILE,
+    GEMINI_TOKEN_BUDGET_HEADROOM, GEMINI_TOKEN_BUDGET_MIN
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Сколько последних ответов по промпту учитывать
+BUDGET_SAMPLES = 200
+# Минимум ответов, после которого лимит токенов считается по наблюдениям
+MIN_BUDGET_SAMPLES = 20
+
+def percentile(values, p: float):
+    """Перцентиль p (0-100) по списку значений (None для пустого списка)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+class TokenBudgets:
+    """
+    Лимиты выходных токенов (max_output_tokens) по промптам.
+
+    Для каждого промпта запоминаются длина ответа в токенах (вместе с
+    размышлениями, которые тоже ограничивает max_output_tokens) и задержка
+    последних запросов. Когда ответов набралось достаточно, лимит промпта -
+    перцентиль GEMINI_TOKEN_BUDGET_PERCENTILE длины ответа с запасом
+    GEMINI_TOKEN_BUDGET_HEADROOM, но не больше лимита из generation_config.
+    Лимит пересчитывается с каждым ответом, поэтому следует за изменениями
+    промптов и модели.
+    """
+
+    def __init__(self, enabled: bool = GEMINI_TOKEN_BUDGETS, percentile: float = GEMINI_TOKEN_BUDGET_PERCENTILE,
+                 headroom: float = GEMINI_TOKEN_BUDGET_HEADROOM, minimum: int = GEMINI_TOKEN_BUDGET_MIN):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.headroom = headroom
+        self.minimum = minimum
+        # имя промпта -> (выходные токены, задержка в секундах) последних ответов
+        self.samples = {}
+        # имя промпта -> число ответов, обрезанных лимитом
+        self.truncations = {}
+
+    def record(self, prompt_name: str, output_tokens: int, latency: float) -> None:
+        """Запоминает длину ответа и задержку запроса по промпту"""
+        self.samples.setdefault(prompt_name, deque(maxlen=BUDGET_SAMPLES)).append((output_tokens, latency))
+
+    def record_truncation(self, prompt_name: str) -> None:
+        """Отмечает ответ, обрезанный лимитом токенов"""
+        self.truncations[prompt_name] = self.truncations.get(prompt_name, 0) + 1
+
+    def budget(self, prompt_name: str, ceiling: int) -> int:
+        """Лимит выходных токенов для запроса по промпту (ceiling, пока наблюдений мало)"""
+        samples = self.samples.get(prompt_name)
+        if not self.enabled or not samples or len(samples) < MIN_BUDGET_SAMPLES:
+            return ceiling
+        observed = percentile([tokens for tokens, _ in samples], self.percentile)
+        return min(ceiling, max(self.minimum, math.ceil(observed * (1 + self.headroom))))
+
+    def stats(self, ceiling: int = GEMINI_MAX_OUTPUT_TOKENS) -> dict:
+        """Статистика по промптам: p50/p95 выходных токенов и задержки, текущий лимит"""
+        result = {}
+        for prompt_name, samples in sorted(self.samples.items()):
+            tokens = [tokens for tokens, _ in samples]
+            latencies = [latency for _, latency in samples]
+            result[prompt_name] = {
+                "samples": len(samples),
+                "tokens_p50": percentile(tokens, 50),
+                "tokens_p95": percentile(tokens, 95),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "budget": self.budget(prompt_name, ceiling),
+                "truncations": self.truncations.get(prompt_name, 0),
+            }
+        return result
+
+# Глобальный экземпляр лимитов токенов
+_token_budgets = None
+
+def get_token_budgets() -> TokenBudgets:
+    """Получает глобальный экземпляр лимитов выходных токенов"""
+    global _token_budgets
+    if _token_budgets is None:
+        _token_budgets = TokenBudgets()
+    return _token_budgets
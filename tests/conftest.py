@@ -0,0 +1,6 @@
+import os
+
+# config.py требует наличия ключей; в тестах сеть не используется, подойдут любые значения
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("OCR_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test")
@@ -0,0 +1,64 @@
+import gzip
+import asyncio
+
+import pytest
+
+from services import cassette as cassette_module
+from services.cassette import Cassette, cassette_call, REDACTED
+from services.cassette_backend import CassetteBackend
+from services.fake_backend import FakeResponse
+from services.llm_backend import LLMBackend, candidate_text
+
+class RecordedBackend(LLMBackend):
+    name = "recorded"
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        return FakeResponse("Итоговый балл: 2", 40, 1)
+
+    async def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        for text in ("Балл: ", "", "3"):
+            yield FakeResponse(text)
+
+calls = []
+
+@cassette_call("checkmate_api")
+async def login(username: str) -> dict:
+    calls.append(username)
+    return {"access_token": "secret-token", "user": username}
+
+@cassette_call("checkmate_api")
+async def send(data: dict) -> bool:
+    raise ConnectionError("401 for Authorization: Bearer secret-token")
+
+def use_cassette(monkeypatch, mode: str, path) -> Cassette:
+    cassette = Cassette(mode=mode, path=str(path), time_scale=0)
+    monkeypatch.setattr(cassette_module, "_cassette", cassette)
+    return cassette
+
+async def session(backend: LLMBackend) -> tuple:
+    token = await login("bot")
+    with pytest.raises(ConnectionError):
+        await send({"score": 5})
+    response = await backend.generate_content("промпт", {"temperature": 0})
+    chunks = [candidate_text(chunk) async for chunk in backend.stream_content("промпт", {"temperature": 0})]
+    return token, candidate_text(response), chunks
+
+def test_record_and_replay_round_trip(monkeypatch, tmp_path):
+    path = tmp_path / "session.jsonl.gz"
+    calls.clear()
+
+    use_cassette(monkeypatch, "record", path)
+    recorded = asyncio.run(session(CassetteBackend(RecordedBackend())))
+    cassette_module.get_cassette()._file.close()
+
+    use_cassette(monkeypatch, "replay", path)
+    replayed = asyncio.run(session(CassetteBackend()))
+
+    assert recorded[0]["access_token"] == "secret-token"
+    assert replayed[0] == {"access_token": REDACTED, "user": "bot"}
+    assert replayed[1:] == recorded[1:] == ("Итоговый балл: 2", ["Балл: ", "", "3"])
+    # При воспроизведении внешний вызов не выполняется
+    assert calls == ["bot"]
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert "secret-token" not in f.read()
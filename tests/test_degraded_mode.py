@@ -0,0 +1,24 @@
+from services.degraded_mode import DegradedMode, MIN_LATENCY_SAMPLES
+
+def latency_signal(mode: DegradedMode):
+    return mode.signals()["latency"]
+
+def test_single_call_latency_is_scaled_to_criteria():
+    mode = DegradedMode(enabled=True, latency=10)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        mode.record_latency(4.0)
+        mode.record_latency(12.0, single_call=True)
+    assert latency_signal(mode) == 4.0
+
+    # Запросов по критериям больше нет: задержка запросов по всем критериям приводится к их масштабу
+    mode.latencies.clear()
+    for _ in range(MIN_LATENCY_SAMPLES):
+        mode.record_latency(24.0, single_call=True)
+    assert latency_signal(mode) == 8.0
+
+def test_single_call_latency_is_ignored_until_ratio_is_known():
+    mode = DegradedMode(enabled=True, latency=10)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        mode.record_latency(30.0, single_call=True)
+
+    assert latency_signal(mode) is None
@@ -0,0 +1,17 @@
+import pytest
+from google.generativeai import caching
+
+from services import gemini_client
+
+def test_missing_sdk_internals_fail_at_import(monkeypatch):
+    monkeypatch.delattr(caching.CachedContent, "_from_obj")
+
+    with pytest.raises(ImportError, match="CachedContent._from_obj"):
+        gemini_client._check_sdk_internals()
+
+def test_other_sdk_version_is_reported(monkeypatch, caplog):
+    monkeypatch.setattr(gemini_client.genai, "__version__", "0.9.0")
+
+    gemini_client._check_sdk_internals()
+
+    assert "0.9.0" in caplog.text
@@ -0,0 +1,27 @@
+from config import GEMINI_MODEL
+from services.gemini_keys import GeminiKeyPool
+
+FAST_MODEL = "fast-model"
+
+def test_cooldown_applies_only_to_rate_limited_model():
+    pool = GeminiKeyPool(["key-aaaa", "key-bbbb"], cooldown_seconds=60)
+    first, second = pool.keys
+
+    pool.mark_rate_limited(first, FAST_MODEL)
+
+    assert pool.acquire(FAST_MODEL) is second
+    # Ключ на паузе для быстрой модели остается доступен основной
+    assert first.is_healthy(0, GEMINI_MODEL)
+    assert pool.acquire(GEMINI_MODEL) is first
+    assert set(pool.stats()[0]["cooldown"]) == {FAST_MODEL}
+    assert pool.stats()[1]["cooldown"] == {}
+
+def test_has_healthy_key_per_model():
+    pool = GeminiKeyPool(["key-aaaa"], cooldown_seconds=60)
+
+    pool.mark_rate_limited(pool.keys[0], FAST_MODEL)
+
+    assert not pool.has_healthy_key(FAST_MODEL)
+    assert pool.has_healthy_key(GEMINI_MODEL)
+    # Все ключи на паузе - запрос все равно получает ключ
+    assert pool.acquire(FAST_MODEL) is pool.keys[0]
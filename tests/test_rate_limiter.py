@@ -0,0 +1,31 @@
+from services import shadow_evaluation
+from services.rate_limiter import RateLimiter
+
+def test_paired_acquire_is_all_or_nothing():
+    limiter = RateLimiter(rpm=3, tpm=1000)
+    assert limiter.try_acquire(100)
+
+    # На пару осталось 2 запроса, но не 1000 токенов: не берется ни один
+    assert not limiter.try_acquire(500 + 500, requests=2)
+    assert int(limiter.available_requests) == 2
+    assert int(limiter.available_tokens) == 900
+    assert limiter.try_acquire(400 + 400, requests=2)
+    assert not limiter.try_acquire(1)
+
+def test_headroom_is_smallest_free_share():
+    limiter = RateLimiter(rpm=10, tpm=1000)
+    limiter.try_acquire(800)
+
+    assert abs(limiter.headroom() - 0.2) < 0.01
+    limiter.pause(60)
+    assert limiter.headroom() == 0.0
+    assert RateLimiter(rpm=0, tpm=0).headroom() == 1.0
+
+def test_shadow_sampling_needs_headroom(monkeypatch, tmp_path):
+    limiter = RateLimiter(rpm=10, tpm=1000)
+    limiter.try_acquire(800)
+    monkeypatch.setattr(shadow_evaluation, "get_rate_limiter", lambda: limiter)
+    evaluator = shadow_evaluation.ShadowEvaluator(str(tmp_path), sample_rate=1.0, min_headroom=0.5)
+
+    assert not evaluator.submit("37", {}, None, {}, {})
+    assert evaluator.checks == {"headroom": 1}
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from google.generativeai import protos
+
+from config import GEMINI_FAST_MODEL, GEMINI_MODEL
+from services import gemini_service, resilience
+from services.fake_backend import FakeResponse
+from services.llm_backend import LLMBackend, set_backend, output_token_count
+from services.token_budget import TokenBudgets
+
+FinishReason = protos.Candidate.FinishReason
+
+class Template:
+    name = "prompt1"
+
+class QueuedBackend(LLMBackend):
+    """Отдает заготовленные ответы по очереди и запоминает лимиты токенов и модели запросов"""
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.limits = []
+        self.models = []
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        self.limits.append(generation_config.get("max_output_tokens"))
+        self.models.append(model_name)
+        return self.responses.pop(0)
+
+    def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        raise AssertionError("ответ запрашивается без потока")
+
+def request(monkeypatch, responses: list, budgets: TokenBudgets) -> tuple:
+    backend = QueuedBackend(responses)
+    set_backend(backend)
+    monkeypatch.setattr(gemini_service, "get_token_budgets", lambda: budgets)
+    try:
+        text = asyncio.run(gemini_service.request_gemini(
+            "промпт", {"max_output_tokens": 8192}, "тест", template=Template(), attempts=1
+        ))
+    finally:
+        set_backend(None)
+    return text, backend.limits
+
+def trained_budgets(output_tokens: int) -> TokenBudgets:
+    budgets = TokenBudgets(enabled=True, percentile=99, headroom=0.2, minimum=100)
+    for _ in range(50):
+        budgets.record("prompt1", output_tokens, 1.0)
+    return budgets
+
+def test_truncated_response_without_parts_is_retried_with_full_limit(monkeypatch):
+    # Лимит ушел на размышления: кандидат без частей с причиной MAX_TOKENS
+    responses = [FakeResponse("", 1200, FinishReason.MAX_TOKENS), FakeResponse("Итоговый балл: 2", 1500, FinishReason.STOP)]
+
+    text, limits = request(monkeypatch, responses, trained_budgets(1000))
+
+    assert text == "Итоговый балл: 2"
+    assert limits == [1200, 8192]
+
+def test_empty_response_is_fatal_without_retry(monkeypatch):
+    responses = [FakeResponse("", None, FinishReason.SAFETY)]
+
+    with pytest.raises(ValueError, match="SAFETY"):
+        request(monkeypatch, responses, TokenBudgets(enabled=False))
+
+def test_budget_counts_thinking_tokens(monkeypatch):
+    response = FakeResponse("Итоговый балл: 2", 300, FinishReason.STOP)
+    response.usage_metadata = protos.GenerateContentResponse.UsageMetadata(
+        prompt_token_count=1000, candidates_token_count=300, total_token_count=2500
+    )
+    budgets = TokenBudgets(enabled=True)
+
+    request(monkeypatch, [response], budgets)
+
+    assert output_token_count(response) == 1500
+    assert budgets.samples["prompt1"][0][0] == 1500
+
+def test_fast_model_budget_is_kept_apart(monkeypatch):
+    budgets = trained_budgets(1000)
+    backend = QueuedBackend([FakeResponse("Итоговый балл: 2", 3000, FinishReason.STOP)])
+    set_backend(backend)
+    monkeypatch.setattr(gemini_service, "get_token_budgets", lambda: budgets)
+    try:
+        asyncio.run(gemini_service.request_gemini(
+            "промпт", {"max_output_tokens": 8192}, "тест", template=Template(), model_name=GEMINI_FAST_MODEL, attempts=1
+        ))
+    finally:
+        set_backend(None)
+
+    # Лимит основной модели не применяется к быстрой, и ее ответы не смешиваются с ответами основной
+    assert backend.limits == [8192]
+    assert len(budgets.samples["prompt1"]) == 50
+    assert budgets.samples[f"prompt1@{GEMINI_FAST_MODEL}"][0][0] == 3000
+
+def test_open_fast_breaker_escalates_to_main_model(monkeypatch):
+    fast_breaker = resilience.CircuitBreaker(min_requests=1, open_seconds=3600, name=GEMINI_FAST_MODEL)
+    fast_breaker.record_failure()
+    monkeypatch.setattr(resilience, "_circuit_breakers", {GEMINI_FAST_MODEL: fast_breaker})
+    backend = QueuedBackend([FakeResponse("Разбор ответа. Итоговый балл: 2", 100, FinishReason.STOP)])
+    set_backend(backend)
+    monkeypatch.setattr(gemini_service, "get_token_budgets", lambda: TokenBudgets(enabled=False))
+    try:
+        text = asyncio.run(gemini_service.request_cascade(
+            "промпт", {"max_output_tokens": 8192}, "тест", "37", 1, template=Template()
+        ))
+    finally:
+        set_backend(None)
+
+    assert text == "Разбор ответа. Итоговый балл: 2"
+    assert backend.models == [None]
+    assert resilience.get_circuit_breaker(GEMINI_MODEL).state == "closed"
+
+def test_backend_without_streaming_is_rejected():
+    class PartialBackend(LLMBackend):
+        async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialBackend()
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from requests.exceptions import ConnectionError, Timeout
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import BlockedPromptException, StopCandidateException
+
+from config import GEMINI_MODEL
+from services import resilience
+from services.resilience import (
+    classify_gemini_error, get_circuit_breaker, CircuitBreaker, CircuitOpenError, RetryBudget, RETRYABLE, FATAL, QUOTA
+)
+
+@pytest.mark.parametrize("error,kind", [
+    (google_exceptions.TooManyRequests("quota"), QUOTA),
+    (google_exceptions.ResourceExhausted("quota"), QUOTA),
+    (google_exceptions.InternalServerError("boom"), RETRYABLE),
+    (google_exceptions.ServiceUnavailable("down"), RETRYABLE),
+    (google_exceptions.DeadlineExceeded("slow"), RETRYABLE),
+    (asyncio.TimeoutError(), RETRYABLE),
+    (Timeout(), RETRYABLE),
+    (ConnectionError(), RETRYABLE),
+    (ConnectionResetError(), RETRYABLE),
+    (google_exceptions.InvalidArgument("bad request"), FATAL),
+    (google_exceptions.PermissionDenied("key"), FATAL),
+    (BlockedPromptException("blocked"), FATAL),
+    (StopCandidateException("safety"), FATAL),
+    (ValueError("no parts"), FATAL),
+    (RuntimeError("unknown"), RETRYABLE),
+])
+def test_classify_gemini_error(error, kind):
+    assert classify_gemini_error(error) == kind
+
+def test_retry_budget_is_shared_until_exhausted():
+    budget = RetryBudget(retries=2)
+
+    assert [budget.take() for _ in range(3)] == [True, True, False]
+
+def test_breaker_opens_on_error_rate_and_closes_after_probe():
+    breaker = CircuitBreaker(error_rate=0.5, min_requests=4, window=60, open_seconds=0)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # open_seconds=0: первый запрос - пробный, второй ждет его результата
+    breaker.check()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_breakers_are_kept_per_model(monkeypatch):
+    monkeypatch.setattr(resilience, "_circuit_breakers", {})
+
+    assert get_circuit_breaker() is get_circuit_breaker(GEMINI_MODEL)
+    assert get_circuit_breaker("fast-model") is not get_circuit_breaker()
+    assert get_circuit_breaker("fast-model").name == "fast-model"
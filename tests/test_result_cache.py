@@ -0,0 +1,64 @@
+import os
+import time
+import asyncio
+
+from services import gemini_service
+from services.degraded_mode import DegradedMode, NORMAL, SINGLE_CALL
+from services.result_cache import GradingResultCache
+
+def test_hits_get_independent_copies():
+    cache = GradingResultCache()
+
+    async def scenario():
+        await cache.set("key", (5, "feedback", {"scores": [2, 2, 1]}))
+        first = await cache.get("key")
+        first[2]["scores"].append(0)
+        return await cache.get("key")
+
+    assert asyncio.run(scenario())[2]["scores"] == [2, 2, 1]
+
+def test_sweep_removes_expired_and_oldest_over_limit(tmp_path):
+    cache = GradingResultCache(cache_dir=str(tmp_path), ttl_seconds=3600, max_disk_bytes=250)
+    now = time.time()
+    for i, age in enumerate((7200, 300, 200, 100)):
+        path = tmp_path / f"entry{i}.json"
+        path.write_text("x" * 100)
+        os.utime(path, (now - age, now - age))
+
+    assert cache.sweep_disk() == 2
+    assert sorted(os.listdir(tmp_path)) == ["entry2.json", "entry3.json"]
+
+class Degraded(DegradedMode):
+    """Переключатель, который все время держит заданный уровень"""
+
+    def __init__(self, level: int):
+        super().__init__(enabled=True)
+        self.current = level
+
+    def level(self) -> int:
+        return self.current
+
+def check_twice(monkeypatch, level: int) -> tuple:
+    calls = []
+
+    async def grade_submission(user_data, status_callback=None, reuse=None, level=NORMAL):
+        calls.append(level)
+        return 5, "разбор", {"scores": [2, 2, 1], "responses": ["a", "b", "c"], "failed": []}
+
+    cache = GradingResultCache(cache_dir=None)
+    monkeypatch.setattr(gemini_service, "grade_submission", grade_submission)
+    monkeypatch.setattr(gemini_service, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(gemini_service, "get_degraded_mode", lambda: Degraded(level))
+    user_data = {"task_number": "37", "task_description": "Задание", "task_solution": "Решение"}
+
+    async def scenario():
+        return [await gemini_service.check_with_gemini(dict(user_data)) for _ in range(2)]
+
+    return asyncio.run(scenario()), calls
+
+def test_degraded_result_keeps_notice_on_cache_hit(monkeypatch):
+    (first, second), calls = check_twice(monkeypatch, SINGLE_CALL)
+
+    assert calls == [SINGLE_CALL]
+    assert first[1] == second[1]
+    assert second[1].startswith("⚡") and second[1].endswith("разбор")
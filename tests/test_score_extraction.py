@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks.bench_score_extraction import ENDINGS, legacy, make_response
+from utils.score_extraction import extract_score
+
+# Ответы, на которых шаблоны и прежний каскад re.search должны давать один балл
+EXTRA_ENDINGS = {
+    "prompt1": ["итоговый балл: 1", "ИТОГОВЫЙ БАЛЛ 2.", "ИТОГОВАЯ ОЦЕНКА\n\nРабота получает 0 баллов"],
+    "prompt2": ["Балл: 0\n", "оценка: 1 балл", "Оценка: 2"],
+    "prompt3": ["ИТОГОВАЯ ОЦЕНКА\nОбщий балл 1\n\nОбщий балл: 2", "ОБЩИЙ БАЛЛ: 0", "общий балл: 2 балла"],
+    "prompt38_1": [
+        "ИТОГОВАЯ ОЦЕНКА\n\n- Балл: 2\n\nФинальный балл: 3",
+        "Финальный балл: 1 из 3",
+        "ОЦЕНКА: 2",
+        "Оценка: 1.",
+        "Работа получает **2 балла**",
+        "итоговый балл: 3",
+        "балл: 2",
+    ],
+}
+
+CASES = [
+    (prompt_name, ending)
+    for endings in (ENDINGS, EXTRA_ENDINGS)
+    for prompt_name, prompt_endings in endings.items()
+    for ending in prompt_endings
+]
+
+@pytest.mark.parametrize("prompt_name,ending", CASES)
+@pytest.mark.parametrize("size_kb", [0, 5])
+def test_matches_legacy_cascade(prompt_name, ending, size_kb):
+    text = make_response(size_kb, ending, seed=1) if size_kb else ending
+
+    assert extract_score(prompt_name, text)[0] == legacy(prompt_name, text)
+
+def test_task_38_keywords_stay_case_sensitive():
+    assert extract_score("prompt38_1", "балл: 2 и оценка: 3") == (None, None)
+
+def test_mixed_case_summary_phrase_is_found():
+    assert extract_score("prompt1", "Итоговый Балл: 2") == (2, "итоговый балл")
+    assert extract_score("prompt3", "Общий Балл: 1") == (1, "общий балл")
@@ -0,0 +1,53 @@
+import random
+
+from services.similarity_index import NearDuplicateIndex, shingle_hashes, solution_fingerprint
+
+VOCABULARY = [f"word{i}" for i in range(3000)]
+
+def make_essay(rng: random.Random, words: int = 230) -> list:
+    return [rng.choice(VOCABULARY) for _ in range(words)]
+
+def add(index: NearDuplicateIndex, variant: str, text: str, result_key: str) -> None:
+    shingles, signature = solution_fingerprint(text)
+    index.add(variant, signature, shingles, result_key)
+
+def find(index: NearDuplicateIndex, variant: str, text: str):
+    shingles, signature = solution_fingerprint(text)
+    return index.find(variant, signature, shingles)
+
+def test_copy_with_one_edited_word_is_found():
+    rng = random.Random(1)
+    index = NearDuplicateIndex(max_entries=1000, threshold=0.95)
+    essays = [make_essay(rng) for _ in range(50)]
+    for i, essay in enumerate(essays):
+        add(index, "38:variant", " ".join(essay), f"essay{i}")
+
+    for i, essay in enumerate(essays):
+        edited = list(essay)
+        edited[rng.randrange(len(edited))] = "changed"
+        result_key, similarity = find(index, "38:variant", " ".join(edited))
+        assert result_key == f"essay{i}"
+        assert similarity >= 0.95
+
+def test_unrelated_essay_and_other_variant_are_not_matched():
+    rng = random.Random(2)
+    index = NearDuplicateIndex(max_entries=1000, threshold=0.95)
+    essay = " ".join(make_essay(rng))
+    add(index, "38:variant", essay, "original")
+
+    assert find(index, "38:variant", " ".join(make_essay(rng))) is None
+    assert find(index, "38:other", essay) is None
+
+def test_shingle_hashes_are_stable():
+    # Значения не зависят от PYTHONHASHSEED и регистра
+    assert shingle_hashes("Один ДВА три").tolist() == [1047400257]
+
+def test_oldest_entries_are_evicted():
+    rng = random.Random(3)
+    index = NearDuplicateIndex(max_entries=2, threshold=0.95)
+    essays = [" ".join(make_essay(rng)) for _ in range(3)]
+    for i, essay in enumerate(essays):
+        add(index, "38:variant", essay, f"essay{i}")
+
+    assert find(index, "38:variant", essays[0]) is None
+    assert find(index, "38:variant", essays[2])[0] == "essay2"
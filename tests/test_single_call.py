@@ -0,0 +1,117 @@
+import json
+import asyncio
+
+import pytest
+
+from config import GEMINI_MAX_OUTPUT_TOKENS, DEGRADED_MAX_OUTPUT_TOKENS
+from services import gemini_service
+from services.degraded_mode import SINGLE_CALL, BRIEF
+from services.fake_backend import FakeBackend
+from services.gemini_service import grade_single_call, brief_output_limit, SingleCallFormatError, BRIEF_OUTPUT_MARGIN
+from services.resilience import RetryBudget
+from services.token_budget import TokenBudgets
+
+class Template:
+    name = "single_37"
+    version = "test"
+
+    def render(self, **values):
+        return "промпт"
+
+def grade(monkeypatch, answer) -> tuple:
+    async def request_gemini(*args, **kwargs):
+        return answer if isinstance(answer, str) else json.dumps(answer)
+
+    monkeypatch.setattr(gemini_service, "request_gemini", request_gemini)
+    return asyncio.run(grade_single_call(Template(), {}, 3, {}, "37"))
+
+def test_scores_and_comments_are_parsed(monkeypatch):
+    answer = {"k1": 2, "comment_k1": "ок", "k2": 0, "comment_k2": "нет", "k3": 1, "comment_k3": "частично"}
+
+    assert grade(monkeypatch, answer) == ([2, 0, 1], ["ок", "нет", "частично"], [])
+
+def test_missing_criterion_is_failed(monkeypatch):
+    answer = {"k1": 2, "comment_k1": "ок", "k2": "2", "comment_k2": "нет", "k3": 1, "comment_k3": " "}
+
+    assert grade(monkeypatch, answer) == ([2, 0, 0], ["ок", "", ""], [2, 3])
+
+@pytest.mark.parametrize("score", [3, -1])
+def test_out_of_range_score_rejects_answer(monkeypatch, score):
+    answer = {"k1": 2, "comment_k1": "ок", "k2": score, "comment_k2": "нет", "k3": 1, "comment_k3": "частично"}
+
+    with pytest.raises(SingleCallFormatError, match="вне допустимого диапазона"):
+        grade(monkeypatch, answer)
+
+@pytest.mark.parametrize("answer", ["не JSON", [1, 2, 3], {"k1": "2"}])
+def test_malformed_answer_is_rejected(monkeypatch, answer):
+    with pytest.raises(SingleCallFormatError):
+        grade(monkeypatch, answer)
+
+class Registry:
+    def get_single_call_template(self, task_number, brief=False):
+        return Template()
+
+def grade_degraded(monkeypatch, errors: int, retries: int, reuse: dict = None, level: int = BRIEF) -> tuple:
+    calls = []
+
+    async def grade_single_call(template, values, total, generation_config, *args, **kwargs):
+        calls.append(generation_config)
+        if len(calls) <= errors:
+            raise SingleCallFormatError("не JSON")
+        return [2, 1, 1], ["ок"] * 3, []
+
+    async def grade_criteria(*args, **kwargs):
+        raise AssertionError("под нагрузкой работа не проверяется по критериям")
+
+    monkeypatch.setattr(gemini_service, "grade_single_call", grade_single_call)
+    monkeypatch.setattr(gemini_service, "grade_criteria", grade_criteria)
+    monkeypatch.setattr(gemini_service, "get_prompt_registry", lambda: Registry())
+    result = asyncio.run(gemini_service.grade_task_criteria(
+        "37", [Template()] * 3, {}, None, {"max_output_tokens": 8192}, single_call=True,
+        retry_budget=RetryBudget(retries), reuse=reuse, level=level
+    ))
+    return result, calls
+
+def test_degraded_format_error_repeats_single_call(monkeypatch):
+    result, calls = grade_degraded(monkeypatch, errors=1, retries=1)
+
+    assert result == ([2, 1, 1], ["ок"] * 3, [])
+    assert len(calls) == 2
+
+def test_degraded_format_error_without_budget_is_raised(monkeypatch):
+    with pytest.raises(SingleCallFormatError):
+        grade_degraded(monkeypatch, errors=1, retries=0)
+
+def test_reuse_under_load_grades_in_single_call(monkeypatch):
+    result, calls = grade_degraded(monkeypatch, errors=0, retries=0, reuse={1: (2, "прошлый разбор")}, level=SINGLE_CALL)
+
+    assert result == ([2, 1, 1], ["ок"] * 3, [])
+    assert len(calls) == 1
+
+def test_brief_limit_follows_token_budget(monkeypatch):
+    budgets = TokenBudgets(enabled=True, percentile=99, headroom=0.2, minimum=100)
+    monkeypatch.setattr(gemini_service, "get_token_budgets", lambda: budgets)
+
+    # Пока ответов мало - полный лимит
+    assert brief_output_limit(Template()) == GEMINI_MAX_OUTPUT_TOKENS
+    for _ in range(50):
+        budgets.record(Template.name, 5000, 1.0)
+    assert brief_output_limit(Template()) == min(GEMINI_MAX_OUTPUT_TOKENS, 6000 + BRIEF_OUTPUT_MARGIN)
+    budgets.samples.clear()
+    for _ in range(50):
+        budgets.record(Template.name, 500, 1.0)
+    assert brief_output_limit(Template()) == DEGRADED_MAX_OUTPUT_TOKENS
+
+@pytest.mark.parametrize("task_number,total", [("37", 3), ("38", 5)])
+def test_fake_backend_answers_pass_grading(monkeypatch, task_number, total):
+    backend = FakeBackend(seed=1)
+    template = Template()
+    template.name = f"single_{task_number}_brief"
+
+    async def request_gemini(prompt, generation_config, *args, template=None, **kwargs):
+        return backend.response_text(generation_config, template)
+
+    monkeypatch.setattr(gemini_service, "request_gemini", request_gemini)
+    for _ in range(200):
+        scores, _, failed = asyncio.run(grade_single_call(template, {}, total, {}, task_number))
+        assert not failed and len(scores) == total
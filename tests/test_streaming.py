@@ -0,0 +1,57 @@
+import asyncio
+
+from services import gemini_service
+from services.fake_backend import FakeResponse
+from services.llm_backend import LLMBackend, set_backend
+from services.metrics import get_metrics
+
+class StreamingBackend(LLMBackend):
+    """Потоки по очереди: первый молчит stall секунд, остальные отвечают сразу"""
+
+    def __init__(self, chunks: list, stall: float = 0.0):
+        self.chunks = chunks
+        self.stall = stall
+        self.opened = 0
+
+    async def generate_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        raise AssertionError("ответ запрашивается только потоком")
+
+    async def stream_content(self, prompt, generation_config: dict = None, template=None, model_name: str = None):
+        self.opened += 1
+        if self.opened == 1 and self.stall:
+            await asyncio.sleep(self.stall)
+        for chunk in self.chunks:
+            yield chunk
+
+def stream(backend: LLMBackend) -> tuple:
+    set_backend(backend)
+    seen = []
+
+    async def on_text(text):
+        seen.append(text)
+
+    try:
+        text, last = asyncio.run(gemini_service.generate_streamed("промпт", {}, "тест", on_text, timeout=5))
+    finally:
+        set_backend(None)
+    return text, last, seen
+
+def test_chunks_without_parts_are_skipped():
+    backend = StreamingBackend([FakeResponse(""), FakeResponse("Балл: "), FakeResponse(""), FakeResponse("2", 5, 1)])
+
+    text, last, seen = stream(backend)
+
+    assert text == "Балл: 2"
+    assert seen == ["Балл: ", "Балл: 2"]
+    assert last.usage_metadata.candidates_token_count == 5
+
+def test_silent_stream_is_hedged_on_first_chunk(monkeypatch):
+    monkeypatch.setattr(gemini_service.get_latency_tracker(), "hedge_delay", lambda: 0.05)
+    backend = StreamingBackend([FakeResponse("Балл: 2", 5, 1)], stall=2)
+    hedged = get_metrics().get("gemini_hedged_requests")
+
+    text, _, _ = stream(backend)
+
+    assert text == "Балл: 2"
+    assert backend.opened == 2
+    assert get_metrics().get("gemini_hedged_requests") == hedged + 1
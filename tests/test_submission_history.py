@@ -0,0 +1,45 @@
+from services.submission_history import SubmissionHistory
+
+ESSAY = (
+    "Hello! I would like to tell you about my favourite hobby.\n\n"
+    "I enjoy reading books because they help me relax after school.\n\n"
+    "Best wishes, Anna"
+)
+
+def submission(solution: str) -> dict:
+    return {"task_number": "37", "task_description": "Write a letter", "task_solution": solution}
+
+def plan(new_solution: str, usable=(1, 2, 3)):
+    history = SubmissionHistory()
+    history.record(1, submission(ESSAY), {"prompt1": "v1"}, [2, 2, 1], ["k1", "k2", "k3"], list(usable))
+    return history.plan_regrade(1, submission(new_solution), {"prompt1": "v1"})
+
+def test_whitespace_only_changes_reuse_everything():
+    reuse, _ = plan(ESSAY.replace("my favourite", "my   favourite") + "\n")
+
+    assert reuse == {1: (2, "k1"), 2: (2, "k2"), 3: (1, "k3")}
+
+def test_one_word_edit_regrades_content_and_language():
+    reuse, diff = plan(ESSAY.replace("books", "novels"))
+
+    assert diff.changed_words == 1
+    assert reuse == {2: (2, "k2")}
+
+def test_paragraph_split_regrades_only_structure():
+    reuse, _ = plan(ESSAY.replace("Best wishes,", "Best wishes,\n\n"))
+
+    assert reuse == {1: (2, "k1"), 3: (1, "k3")}
+
+def test_large_rewrite_regrades_everything():
+    reuse, _ = plan(ESSAY.replace("I enjoy reading books because they help me relax after school.",
+                                  "My hobby is football, I play it with friends every weekend."))
+
+    assert reuse == {}
+
+def test_unusable_criteria_and_changed_prompts_are_not_reused():
+    assert plan(ESSAY, usable=(2, 3))[0] == {2: (2, "k2"), 3: (1, "k3")}
+
+    history = SubmissionHistory()
+    history.record(1, submission(ESSAY), {"prompt1": "v1"}, [2, 2, 1], ["k1", "k2", "k3"], [1, 2, 3])
+    assert history.plan_regrade(1, submission(ESSAY), {"prompt1": "v2"}) is None
+    assert history.plan_regrade(2, submission(ESSAY), {"prompt1": "v1"}) is None
@@ -0,0 +1,19 @@
+from utils.text_utils import split_message
+
+def test_split_message_keeps_lines_and_limit():
+    lines = [f"• счетчик{i}: {'x' * 50}\n" for i in range(200)]
+    text = "".join(lines)
+
+    parts = split_message(text, limit=1000)
+
+    assert all(len(part) <= 1000 for part in parts)
+    assert "".join(parts) == text
+    assert all(part.endswith("\n") for part in parts)
+
+def test_split_message_cuts_overlong_line():
+    parts = split_message("a" * 2500, limit=1000)
+
+    assert [len(part) for part in parts] == [1000, 1000, 500]
+
+def test_short_message_is_one_part():
+    assert split_message("коротко") == ["коротко"]
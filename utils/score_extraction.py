@@ -0,0 +1,127 @@
+import re
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Заголовок итогового блока в ответах модели
+SUMMARY_MARKER = "ИТОГОВАЯ ОЦЕНКА"
+
+def _summary_block(text: str) -> str:
+    """Блок ИТОГОВАЯ ОЦЕНКА: от первого заголовка до конца абзаца (пустая строка, если заголовка нет)"""
+    start = text.find(SUMMARY_MARKER)
+    if start < 0:
+        return ""
+    start += len(SUMMARY_MARKER)
+    end = text.find("\n\n", start)
+    return text[start:end] if end >= 0 else text[start:]
+
+def _summary_block_38(text: str) -> str:
+    """Блок ИТОГОВАЯ ОЦЕНКА заданий 38: первый абзац после заголовка, а если он короче 50 символов - и следующий"""
+    start = text.find(SUMMARY_MARKER)
+    if start < 0:
+        return ""
+    block = text[start + len(SUMMARY_MARKER):].lstrip('\n\r\t ')
+    end = block.find("\n\n")
+    if end < 0:
+        return block
+    if end < 50:
+        next_end = block.find("\n\n", end + 2)
+        return block[:next_end] if next_end >= 0 else block
+    return block[:end]
+
+def _after_last_summary(text: str) -> str:
+    """Текст после последнего заголовка ИТОГОВАЯ ОЦЕНКА (весь текст, если заголовка нет)"""
+    start = text.rfind(SUMMARY_MARKER)
+    return text[start + len(SUMMARY_MARKER):] if start >= 0 else text
+
+# Части ответа, в которых ищут балл отдельные шаблоны
+SECTIONS = {
+    "summary": _summary_block,
+    "summary_38": _summary_block_38,
+    "after_last_summary": _after_last_summary,
+}
+
+class ScorePattern:
+    """
+    Шаблон поиска балла в ответе модели.
+
+    Шаблон начинается с ключевой фразы, за которой следует регулярное
+    выражение; балл - первая группа выражения. Шаблон без ключевой фразы -
+    просто регулярное выражение. С ignore_case шаблон ищется без
+    учета регистра - так заданы фразы, которые прежний каскад искал в
+    нескольких написаниях ("Итоговый балл", "итоговый балл", "ИТОГОВЫЙ БАЛЛ").
+    """
+
+    def __init__(self, name: str, keyword: str, regex: str, section: str = None, ignore_case: bool = False):
+        self.name = name
+        self.keyword = keyword.lower() if keyword and ignore_case else keyword
+        self.section = section
+        self.ignore_case = ignore_case
+        self.compiled = re.compile((re.escape(keyword) if keyword else "") + regex, re.IGNORECASE if ignore_case else 0)
+
+    def search(self, text: str):
+        """Первое совпадение шаблона в тексте или None"""
+        if not self.ignore_case or not self.keyword:
+            # Выражение с буквальным началом re ищет быстрым поиском подстроки
+            return self.compiled.search(text)
+        # Без учета регистра re перебирает каждую позицию, поэтому ключевая фраза сначала ищется в тексте строчными
+        lowered = text.lower()
+        position = lowered.find(self.keyword)
+        if position < 0:
+            return None
+        # lower() может изменить длину текста с редкими символами - тогда позиция в нем не годится
+        return self.compiled.search(text, position if len(lowered) == len(text) else 0)
+
+_SCORE_PATTERNS_38 = [
+    ScorePattern("балл в блоке ИТОГОВАЯ ОЦЕНКА", "Балл", r':?\s*(\d+)', section="summary_38"),
+    ScorePattern("балл", "Балл", r':?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)'),
+    ScorePattern("итоговый балл", "Итоговый балл", r':?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)'),
+    ScorePattern("финальный балл", "Финальный балл", r':?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)'),
+    ScorePattern("ОЦЕНКА", "ОЦЕНКА", r':?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)'),
+    ScorePattern("оценка", "Оценка", r':?\s*(\d+)(?:\s*балл|\s*из\s*\d+|\.|\s|$)'),
+    ScorePattern("получает N баллов", "получает", r'\s*\*\*(\d+)\s*балл'),
+]
+
+# Шаблоны поиска балла для каждого файла промпта, в порядке приоритета
+SCORE_PATTERNS = {
+    "prompt1": [
+        ScorePattern("итоговый балл", "Итоговый балл", r':?\s*(\d+)(?:\s*балл|\.|\s|$)', ignore_case=True),
+        ScorePattern("N баллов в итоговой оценке", None, r'(\d+)\s*балл', section="after_last_summary"),
+    ],
+    "prompt2": [
+        ScorePattern("балл", "Балл", r':?\s*(\d+)(?:\s*балл|\.|\s|$)'),
+        ScorePattern("получает N баллов", "получает", r'\s*\*\*(\d+)\s*балл'),
+        ScorePattern("оценка", "оценка", r':?\s*(\d+)(?:\s*балл|\.|\s|$)'),
+    ],
+    "prompt3": [
+        ScorePattern("общий балл в блоке ИТОГОВАЯ ОЦЕНКА", "Общий балл", r':?\s*(\d+)', section="summary"),
+        ScorePattern("общий балл", "Общий балл", r':?\s*(\d+)(?:\s*балл|\.|\s|$)', ignore_case=True),
+    ],
+    "prompt38_1": _SCORE_PATTERNS_38,
+    "prompt38_2": _SCORE_PATTERNS_38,
+    "prompt38_3": _SCORE_PATTERNS_38,
+    "prompt38_4": _SCORE_PATTERNS_38,
+    "prompt38_5": _SCORE_PATTERNS_38,
+}
+
+def extract_score(prompt_name: str, response_text: str) -> tuple:
+    """
+    Извлекает балл из ответа модели на промпт prompt_name: шаблоны промпта
+    проверяются в порядке приоритета, побеждает первый сработавший.
+
+    Returns:
+        tuple: (score, pattern_name) - балл и имя сработавшего шаблона,
+               (None, None), если балл не найден
+    """
+    sections = {}
+    for pattern in SCORE_PATTERNS[prompt_name]:
+        text = response_text
+        if pattern.section:
+            if pattern.section not in sections:
+                sections[pattern.section] = SECTIONS[pattern.section](response_text)
+            text = sections[pattern.section]
+        match = pattern.search(text)
+        if match:
+            return int(match.group(1)), pattern.name
+    return None, None
@@ -0,0 +1,70 @@
+import re
+import logging
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Слово - последовательность букв, цифр и подчеркиваний (как \b\w+\b)
+_WORD_RE = re.compile(r'\w+')
+
+def count_words_and_truncate(text: str, limit: int) -> tuple:
+    """
+    Считает слова в тексте и находит позицию конца слова номер limit за один проход.
+
+    Args:
+        text: Исходный текст
+        limit: Максимальное число слов
+
+    Returns:
+        tuple: (word_count, end_pos) - общее число слов и позиция, по которую
+               нужно обрезать текст, чтобы в нем осталось limit слов
+               (len(text), если слов не больше limit)
+    """
+    word_count = 0
+    end_pos = len(text)
+    for match in _WORD_RE.finditer(text):
+        word_count += 1
+        if word_count == limit:
+            end_pos = match.end()
+    if word_count <= limit:
+        end_pos = len(text)
+    return word_count, end_pos
+
+def truncate_words(text: str, limit: int) -> tuple:
+    """
+    Обрезает текст до limit слов, сохраняя исходные пробелы и пунктуацию.
+
+    Returns:
+        tuple: (truncated_text, original_word_count)
+    """
+    word_count, end_pos = count_words_and_truncate(text, limit)
+    return text[:end_pos], word_count
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: около 3 символов на токен для смеси русского и английского"""
+    return len(text) // 3 + 1
+
+# Предел длины сообщения Telegram - 4096 символов, берем с запасом
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """
+    Делит текст на части не длиннее limit символов по границам строк;
+    строка длиннее limit режется на куски.
+    """
+    parts = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        parts.append(current)
+    return parts